@@ -0,0 +1,413 @@
+"""Local HTTP API for the formatting engine
+
+Serves the engine to other programs on this machine, without the GUI:
+
+    python api_server.py --port 8765 --workers 4
+
+    POST /detect-chapters  {"text": ...}                         -> chapter titles and offsets
+    POST /format           {"text": ..., "preset": "Kindle"}     -> formatted text
+    POST /export           {"text": ..., "preset": ..., "format": "pdf"}  -> the exported file
+    GET  /health
+    GET  /metrics                                                 -> latency histograms per endpoint
+
+The server only listens on 127.0.0.1. The event loop just parses request
+headers and streams responses; decoding the JSON body, chapter detection,
+formatting and export run on a process pool. At most ``--max-pending``
+jobs are admitted at once, counted from before their body is read, and
+requests beyond that are turned away with 503 and a Retry-After header
+rather than queued without bound. A pool that breaks because a worker
+died is replaced. Responses are sent in blocks as the client reads them,
+and an exported file is streamed from disk, so a large PDF is never held
+in memory whole.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
+
+from ebook_formatter import (
+    FORMATTING_PRESETS,
+    format_text_for_platform,
+    preformat_text,
+    process_text,
+    write_chapters_pdf,
+    write_chapters_text,
+)
+from scheduler import cpu_worker_count, create_process_pool
+
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+EXPORT_FORMATS = {"pdf": "application/pdf", "txt": "text/plain; charset=utf-8"}
+# Largest request body accepted
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Size of each block written to the client
+STREAM_BLOCK = 64 * 1024
+# Seconds a client may take to send its request headers
+HEADER_TIMEOUT = 30
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+    413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class PayloadError(ValueError):
+    """The request body is not a valid job; answered with 400"""
+
+
+def read_payload(body):
+    """Decode a JSON request body (runs in a worker process, since bodies can be large)"""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError as e:
+        raise PayloadError(f"Body is not valid JSON: {e}")
+    if not isinstance(payload, dict):
+        raise PayloadError("Body must be a JSON object")
+    return payload
+
+
+def text_argument(payload):
+    text = payload.get("text")
+    if not isinstance(text, str):
+        raise PayloadError("Missing \"text\"")
+    return text
+
+
+def preset_argument(payload):
+    platform = payload.get("preset", "Kindle")
+    if platform not in FORMATTING_PRESETS:
+        raise PayloadError(f"preset must be one of {', '.join(FORMATTING_PRESETS)}")
+    return platform
+
+
+def detect_job(body):
+    """Chapter titles and body offsets of a manuscript (runs in a worker process)"""
+    return [
+        {"title": chapter.title, "start": chapter.start, "end": chapter.end}
+        for chapter in process_text(text_argument(read_payload(body)))
+    ]
+
+
+def format_job(body):
+    """Formatted text for a preset (runs in a worker process)"""
+    payload = read_payload(body)
+    text, platform = text_argument(payload), preset_argument(payload)
+    return format_text_for_platform(text, platform, FORMATTING_PRESETS[platform])
+
+
+def export_job(body, path):
+    """Format a manuscript and write it to path; returns (chapters, format) (runs in a worker process)"""
+    payload = read_payload(body)
+    text, platform = text_argument(payload), preset_argument(payload)
+    export_format = payload.get("format", "pdf")
+    if export_format not in EXPORT_FORMATS:
+        raise PayloadError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    _, chapters = preformat_text(text, platform, FORMATTING_PRESETS[platform])
+    if export_format == "pdf":
+        write_chapters_pdf(chapters, path, FORMATTING_PRESETS[platform])
+    else:
+        write_chapters_text(chapters, path)
+    return len(chapters), export_format
+
+
+class LatencyHistogram:
+    """Request latencies of one endpoint in fixed buckets"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One count per bucket plus the overflow bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.statuses = {}
+
+    def observe(self, seconds, status):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def snapshot(self):
+        count = sum(self.counts)
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "count": count,
+            "sum_seconds": round(self.total, 6),
+            "mean_seconds": round(self.total / count, 6) if count else None,
+            "buckets": dict(zip(bounds, self.counts)),
+            "statuses": {str(status): number for status, number in sorted(self.statuses.items())},
+        }
+
+
+class Request:
+    __slots__ = ("method", "path", "headers", "body")
+
+    def __init__(self, method, path, headers, body=b""):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+class APIServer:
+    """Routes requests to the engine on a process pool under an admission limit"""
+
+    def __init__(self, port=DEFAULT_PORT, workers=None, max_pending=None):
+        self.port = port
+        self.workers = workers or cpu_worker_count()
+        self.max_pending = max_pending or self.workers * 2
+        self.pending = 0
+        self.rejected = 0
+        self.pool = None
+        self._stopping = None
+        self.started = time.monotonic()
+        self.routes = {
+            "/health": ("GET", self.health),
+            "/metrics": ("GET", self.metrics),
+            "/detect-chapters": ("POST", self.detect_chapters),
+            "/format": ("POST", self.format),
+            "/export": ("POST", self.export),
+        }
+        self.histograms = {path: LatencyHistogram() for path in self.routes}
+
+    async def serve(self):
+        """Serve until stop() is called"""
+        self._stopping = asyncio.Event()
+        self.pool = create_process_pool(self.workers)
+        try:
+            server = await asyncio.start_server(self.handle, HOST, self.port)
+            self.port = server.sockets[0].getsockname()[1]
+            print(f"Listening on http://{HOST}:{self.port} with {self.workers} workers", flush=True)
+            async with server:
+                await self._stopping.wait()
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def handle(self, reader, writer):
+        """Serve one request per connection"""
+        started = time.perf_counter()
+        path = None
+        status = 500
+        try:
+            request = await self.read_request(reader)
+            path = request.path
+            route = self.routes.get(path)
+            if route is None:
+                raise HTTPError(404, f"No endpoint {path}")
+            method, handler = route
+            if request.method != method:
+                raise HTTPError(405, f"{path} takes {method}", {"Allow": method})
+            if method == "POST":
+                # Admit the job before reading a body of up to MAX_BODY_BYTES
+                self.admit()
+                try:
+                    request.body = await self.read_body(reader, request.headers)
+                    status = await handler(request, writer)
+                finally:
+                    self.pending -= 1
+            else:
+                status = await handler(request, writer)
+        except HTTPError as e:
+            status = e.status
+            await self.send_error(writer, e)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            # The client went away; nothing left to answer
+            status = 499
+        except Exception as e:
+            status = 500
+            await self.send_error(writer, HTTPError(500, f"{type(e).__name__}: {e}"))
+        finally:
+            if path in self.histograms:
+                self.histograms[path].observe(time.perf_counter() - started, status)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def read_request(self, reader):
+        """Read the request line and headers; the body is left to read_body"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEADER_TIMEOUT)
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431, "Request headers are too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        return Request(method, urlsplit(target).path, headers)
+
+    @staticmethod
+    async def read_body(reader, headers):
+        if "content-length" not in headers:
+            raise HTTPError(411, "Send the body with a Content-Length")
+        try:
+            length = int(headers["content-length"])
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length < 0:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Body exceeds {MAX_BODY_BYTES} bytes")
+        return await reader.readexactly(length)
+
+    def admit(self):
+        """Take a job slot, or refuse at once when the pool is saturated; the caller gives it back"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPError(503, "Too many jobs in progress; try again shortly", {"Retry-After": "1"})
+        self.pending += 1
+
+    async def run_job(self, func, *args):
+        """Run func on the process pool, replacing the pool if a worker died"""
+        pool = self.pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except PayloadError as e:
+            raise HTTPError(400, str(e))
+        except BrokenProcessPool:
+            # Other requests on the same pool fail too; only the first replaces it
+            if self.pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = create_process_pool(self.workers)
+            raise HTTPError(503, "A worker process died; try again", {"Retry-After": "1"})
+
+    # Endpoints return the status they sent
+
+    async def health(self, request, writer):
+        await self.send_json(writer, 200, {"status": "ok"})
+        return 200
+
+    async def metrics(self, request, writer):
+        await self.send_json(writer, 200, {
+            "uptime_seconds": round(time.monotonic() - self.started, 1),
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "endpoints": {path: histogram.snapshot() for path, histogram in self.histograms.items()},
+        })
+        return 200
+
+    async def detect_chapters(self, request, writer):
+        chapters = await self.run_job(detect_job, request.body)
+        await self.send_json(writer, 200, {"chapters": chapters})
+        return 200
+
+    async def format(self, request, writer):
+        formatted_text = await self.run_job(format_job, request.body)
+        await self.send_text(writer, formatted_text)
+        return 200
+
+    async def export(self, request, writer):
+        # The worker writes to disk and the file is streamed from there
+        fd, path = tempfile.mkstemp(prefix="ebook-api-")
+        os.close(fd)
+        try:
+            chapters, export_format = await self.run_job(export_job, request.body, path)
+            await self.send_file(writer, path, EXPORT_FORMATS[export_format], {
+                "Content-Disposition": f'attachment; filename="manuscript.{export_format}"',
+                "X-Chapters": str(chapters),
+            })
+        finally:
+            os.remove(path)
+        return 200
+
+    # Responses
+
+    async def send_head(self, writer, status, content_type, length, headers=None):
+        lines = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {length}",
+            "Connection: close",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    async def send_json(self, writer, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        await self.send_head(writer, status, "application/json", len(body), headers)
+        writer.write(body)
+        await writer.drain()
+
+    async def send_error(self, writer, error):
+        try:
+            await self.send_json(writer, error.status, {"error": str(error)}, error.headers)
+        except ConnectionError:
+            pass
+
+    async def send_text(self, writer, text):
+        """Send text a block at a time, encoding each block as it goes out"""
+        # Length first, without an encoded copy of the whole text
+        length = sum(
+            len(text[start:start + STREAM_BLOCK].encode("utf-8"))
+            for start in range(0, len(text), STREAM_BLOCK)
+        )
+        await self.send_head(writer, 200, "text/plain; charset=utf-8", length)
+        for start in range(0, len(text), STREAM_BLOCK):
+            writer.write(text[start:start + STREAM_BLOCK].encode("utf-8"))
+            await writer.drain()
+
+    async def send_file(self, writer, path, content_type, headers=None):
+        await self.send_head(writer, 200, content_type, os.path.getsize(path), headers)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(STREAM_BLOCK), b""):
+                writer.write(block)
+                await writer.drain()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the formatter over HTTP on localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port on 127.0.0.1 (0 picks a free one)")
+    parser.add_argument("--workers", type=int, default=cpu_worker_count(), help="worker processes")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="jobs admitted at once before answering 503 (default: twice the workers)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = APIServer(args.port, args.workers, args.max_pending)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, server.stop)
+            except NotImplementedError:
+                pass
+        await server.serve()
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""Journaled auto-save with crash recovery
+
+Edits to the document model are appended to a per-document journal as
+small JSON records. Every so often the full text is written as a gzip
+checkpoint and a fresh journal segment is started, so the cost of an
+auto-save tracks the size of the edits rather than the size of the book.
+Recovery loads the newest checkpoint and replays its journal segment.
+
+Layout of the auto-save directory::
+
+    <app data>/EbookFormatterPro/autosave/<document id>/
+        session.json               source path and clean-shutdown flag
+        checkpoint-000003.txt.gz   full text at the start of segment 3
+        journal-000003.jsonl       edits made since that checkpoint
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from document_model import PieceTable
+from profiling import profiler
+
+APP_NAME = "EbookFormatterPro"
+
+# Checkpoints (and their journal segments) kept per document
+KEEP_CHECKPOINTS = 3
+# Clean sessions kept across all documents
+KEEP_SESSIONS = 20
+# Unclean sessions older than this are no longer offered for recovery but deleted
+KEEP_UNCLEAN_SECONDS = 30 * 24 * 3600
+# Directories without a session file (left by a crash before the first
+# checkpoint, or by older versions) are deleted once this old
+ORPHAN_SECONDS = 24 * 3600
+# Start a new checkpoint once the journal reaches this share of the text size
+CHECKPOINT_RATIO = 0.5
+# ...but never for journals smaller than this many characters
+MIN_CHECKPOINT_CHARS = 64 * 1024
+
+
+def app_data_dir():
+    """Return the per-user application data directory"""
+    base = os.environ.get("APPDATA") or os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, APP_NAME)
+
+
+def autosave_dir():
+    """Return the directory holding every document's journal"""
+    return os.path.join(app_data_dir(), "autosave")
+
+
+def document_id(source_path=None):
+    """Derive a stable journal id from a source file, or a fresh one for untitled text"""
+    if source_path:
+        digest = hashlib.sha1(os.path.abspath(source_path).encode("utf-8")).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(source_path))[0]
+        safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)[:40]
+        return f"{safe_name}-{digest}"
+    return "untitled-" + datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+
+class EditJournal:
+    """Append-only journal and checkpoints for one document
+
+    The directory is created with the first checkpoint, so documents that
+    are never edited leave nothing behind. Not thread-safe; AutoSaver
+    drives it from a single worker thread.
+    """
+
+    def __init__(self, doc_id, source_path=None, root=None, keep_checkpoints=KEEP_CHECKPOINTS):
+        self.doc_id = doc_id
+        self.source_path = source_path
+        self.directory = os.path.join(root or autosave_dir(), doc_id)
+        self.keep_checkpoints = keep_checkpoints
+        sequences = self.checkpoint_sequences()
+        self.sequence = sequences[-1] if sequences else 0
+
+    def checkpoint_path(self, sequence):
+        return os.path.join(self.directory, f"checkpoint-{sequence:06d}.txt.gz")
+
+    def journal_path(self, sequence):
+        return os.path.join(self.directory, f"journal-{sequence:06d}.jsonl")
+
+    def checkpoint_sequences(self):
+        """Return the sequence numbers of the stored checkpoints, oldest first"""
+        sequences = []
+        if not os.path.isdir(self.directory):
+            return sequences
+        for name in os.listdir(self.directory):
+            if name.startswith("checkpoint-") and name.endswith(".txt.gz"):
+                try:
+                    sequences.append(int(name[len("checkpoint-"):-len(".txt.gz")]))
+                except ValueError:
+                    continue
+        return sorted(sequences)
+
+    def write_checkpoint(self, text):
+        """Store the full text and start a new journal segment"""
+        sequence = self.sequence + 1
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.checkpoint_path(sequence)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8", compresslevel=5) as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+        open(self.journal_path(sequence), "w", encoding="utf-8").close()
+        self.sequence = sequence
+        self.write_session(clean=False)
+        self.prune()
+
+    def append(self, operations):
+        """Append edit records to the current journal segment"""
+        if not self.sequence:
+            raise RuntimeError("Cannot journal edits before the first checkpoint")
+        with open(self.journal_path(self.sequence), "a", encoding="utf-8") as f:
+            for operation in operations:
+                f.write(json.dumps(operation, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def recover(self):
+        """Rebuild the text from the newest checkpoint and its journal"""
+        if not self.sequence:
+            return None
+        with gzip.open(self.checkpoint_path(self.sequence), "rt", encoding="utf-8") as f:
+            document = PieceTable(f.read())
+
+        journal_path = self.journal_path(self.sequence)
+        if os.path.exists(journal_path):
+            with open(journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        operation = json.loads(line)
+                    except ValueError:
+                        break  # torn final record from a crash mid-write
+                    replay(document, operation)
+        return document.text()
+
+    def write_session(self, clean):
+        """Record the source file and whether the session ended cleanly"""
+        if not os.path.isdir(self.directory):
+            return  # nothing was ever saved
+        session = {
+            "source": self.source_path,
+            "clean": clean,
+            "updated": time.time(),
+            "sequence": self.sequence,
+        }
+        path = os.path.join(self.directory, "session.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(session, f)
+        os.replace(path + ".tmp", path)
+
+    def prune(self):
+        """Delete checkpoints and journal segments beyond the retention limit"""
+        for sequence in self.checkpoint_sequences()[:-self.keep_checkpoints]:
+            for path in (self.checkpoint_path(sequence), self.journal_path(sequence)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def replay(document, operation):
+    """Apply one journal record to a PieceTable"""
+    kind, offset, payload = operation
+    if kind == "i":
+        document.insert(offset, payload)
+    elif kind == "d":
+        document.delete(offset, payload)
+    else:
+        raise ValueError(f"Unknown journal record: {kind!r}")
+
+
+def read_session(directory):
+    try:
+        with open(os.path.join(directory, "session.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find_recoverable_sessions(root=None):
+    """Return (doc_id, session) for sessions that did not shut down cleanly, newest first"""
+    root = root or autosave_dir()
+    if not os.path.isdir(root):
+        return []
+    sessions = []
+    for doc_id in os.listdir(root):
+        session = read_session(os.path.join(root, doc_id))
+        if session and not session.get("clean") and session.get("sequence"):
+            sessions.append((doc_id, session))
+    sessions.sort(key=lambda item: item[1].get("updated", 0), reverse=True)
+    return sessions
+
+
+def prune_sessions(root=None, keep=KEEP_SESSIONS):
+    """Delete old sessions
+
+    Keeps the newest cleanly-closed sessions up to the retention limit and
+    unclean ones until they expire; directories without a session file are
+    deleted once they are old enough not to belong to a running session.
+    """
+    root = root or autosave_dir()
+    if not os.path.isdir(root):
+        return
+    now = time.time()
+    clean = []
+    for doc_id in os.listdir(root):
+        directory = os.path.join(root, doc_id)
+        if not os.path.isdir(directory):
+            continue
+        session = read_session(directory)
+        if session is None:
+            try:
+                if now - os.path.getmtime(directory) > ORPHAN_SECONDS:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except OSError:
+                pass
+        elif session.get("clean"):
+            clean.append((session.get("updated", 0), directory))
+        elif now - session.get("updated", 0) > KEEP_UNCLEAN_SECONDS:
+            shutil.rmtree(directory, ignore_errors=True)
+    clean.sort(reverse=True)
+    for _, directory in clean[keep:]:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class AutoSaver:
+    """Collects model edits on the UI thread and journals them on one worker
+
+    Edits are buffered as they happen; flush() hands the batch to a single
+    background thread, so journal writes stay in order and the worker
+    never touches application state. A failed write sets a flag that
+    stays up until a checkpoint succeeds: meanwhile edits are not
+    journalled against text that is not on disk, and every flush retries
+    the checkpoint.
+    """
+
+    def __init__(self, model, on_saved=None, on_error=None):
+        self.model = model
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self.journal = None
+        self.pending = []
+        self.pending_chars = 0
+        self.journal_chars = 0
+        self.checkpoint_chars = 0
+        self.needs_checkpoint = True
+        # Set by the worker when a write failed, cleared by its next checkpoint
+        self.write_failed = False
+        self.closed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+        model.add_listener(self.on_change)
+
+    def start(self, journal, close_previous=True):
+        """Journal the current document into a (new) journal
+
+        With close_previous the old journal's session is marked clean;
+        pass False when its document stays open elsewhere.
+        """
+        if close_previous and self.journal and self.journal is not journal:
+            self.close_journal(self.journal)
+        self.journal = journal
+        self.pending = []
+        self.pending_chars = 0
+        self.needs_checkpoint = True
+        self.write_failed = False
+
+    def close_journal(self, journal):
+        """Mark a journal's session clean once its pending writes are done"""
+        if self.closed:
+            return
+        self._executor.submit(journal.write_session, True)
+
+    def on_change(self, kind, offset, payload):
+        """Buffer one model edit (runs on the UI thread)"""
+        if kind == "reset":
+            self.pending = []
+            self.pending_chars = 0
+            self.needs_checkpoint = True
+        elif kind == "insert":
+            last = self.pending[-1] if self.pending else None
+            if last and last[0] == "i" and last[1] + len(last[2]) == offset:
+                last[2] += payload  # continued typing
+            else:
+                self.pending.append(["i", offset, payload])
+            self.pending_chars += len(payload)
+        elif kind == "delete":
+            last = self.pending[-1] if self.pending else None
+            if last and last[0] == "d" and offset in (last[1], last[1] - payload):
+                # Repeated Delete or Backspace
+                last[1] = offset
+                last[2] += payload
+            else:
+                self.pending.append(["d", offset, payload])
+            self.pending_chars += 1
+
+    def flush(self):
+        """Hand buffered edits (or a checkpoint) to the worker; does nothing once closed"""
+        if self.closed or not self.journal:
+            return None
+        if self.write_failed:
+            # The journal is missing a write; only a checkpoint can repair it
+            self.needs_checkpoint = True
+        if self.needs_checkpoint and not self.pending and not len(self.model):
+            return None
+        threshold = max(MIN_CHECKPOINT_CHARS, self.checkpoint_chars * CHECKPOINT_RATIO)
+        if self.needs_checkpoint or self.journal_chars + self.pending_chars > threshold:
+            if not self.needs_checkpoint and not self.pending:
+                return None
+            snapshot = self.model.snapshot()
+            self.checkpoint_chars = len(snapshot)
+            self.journal_chars = 0
+            task = (self._checkpoint, self.journal, snapshot)
+        elif self.pending:
+            self.journal_chars += self.pending_chars
+            task = (self._append, self.journal, self.pending)
+        else:
+            return None
+        self.pending = []
+        self.pending_chars = 0
+        self.needs_checkpoint = False
+        return self._executor.submit(*task)
+
+    def close(self):
+        """Flush outstanding edits, mark the session clean and stop the worker
+
+        Returns a future that completes once everything is on disk. The
+        caller should keep its event loop serviced while waiting, since
+        worker-side Tk calls are marshalled to the UI thread.
+        """
+        self.on_saved = self.on_error = None
+        self.flush()
+        if self.journal:
+            done = self._executor.submit(self.journal.write_session, True)
+        else:
+            done = self._executor.submit(lambda: None)
+        self.closed = True
+        self._executor.shutdown(wait=False)
+        return done
+
+    def _checkpoint(self, journal, snapshot):
+        try:
+            with profiler.stage("autosave", len(snapshot)):
+                journal.write_checkpoint(snapshot.text)
+            if journal is self.journal:
+                self.write_failed = False
+            if self.on_saved:
+                self.on_saved(f"Auto-saved checkpoint {journal.sequence} (version {snapshot.version})")
+        except Exception as e:
+            if journal is self.journal:
+                self.write_failed = True
+            if self.on_error:
+                self.on_error(f"Auto-save failed: {str(e)}")
+
+    def _append(self, journal, operations):
+        if self.write_failed and journal is self.journal:
+            return  # would apply to text that is not on disk
+        try:
+            with profiler.stage("autosave", len(operations)):
+                journal.append(operations)
+            if self.on_saved:
+                self.on_saved(f"Auto-saved {len(operations)} edits")
+        except Exception as e:
+            if journal is self.journal:
+                self.write_failed = True
+            if self.on_error:
+                self.on_error(f"Auto-save failed: {str(e)}")
@@ -0,0 +1,291 @@
+"""Resumable batch conversion through a persistent job queue
+
+    python batch_convert.py add manuscripts/ --output formatted/ --preset Kindle
+    python batch_convert.py run --workers 4
+    python batch_convert.py status
+    python batch_convert.py retry                  # queue failed jobs again
+
+Jobs live in a SQLite queue (``--db``, default batch_queue.sqlite). ``run``
+starts worker processes that claim jobs until nothing is left to do.
+Each input goes through extracting, formatting and exporting; the result
+of every completed stage is kept in ``<db>.work/``, so a job that fails
+or is interrupted (Ctrl+C, crash, power loss) continues from its last
+completed stage when ``run`` is started again. A malformed input only
+fails its own job, after its retries, and never stops the batch. A stage
+that runs past ``--stage-timeout`` ends its worker process, and a worker
+that crashed or was killed is replaced while work remains; the job is
+taken over from its last completed stage, which uses up one attempt.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+
+from ebook_formatter import FORMATTING_PRESETS, format_text_for_platform, process_text
+from job_queue import (JobQueue, LeaseLost, EXTRACTING, FORMATTING, STATES, FAILED, MAX_ATTEMPTS, BACKOFF_SECONDS,
+                       STAGE_TIMEOUT_SECONDS)
+from watch_daemon import EXPORT_FORMATS, SUPPORTED_EXTENSIONS, export_chapters, file_digest, log, read_manuscript
+
+DEFAULT_DB = "batch_queue.sqlite"
+# Longest an idle worker sleeps before looking for runnable jobs again
+IDLE_SECONDS = 1.0
+# Exit status of a worker that gave up a stage it could not finish in time
+LOST_JOB_EXIT = 3
+
+
+def work_dir(db_path):
+    """Directory holding the stage results of every job"""
+    return db_path + ".work"
+
+
+def stage_path(db_path, job, stage):
+    return os.path.join(work_dir(db_path), f"{job.id}.{stage}.txt")
+
+
+def write_stage(path, text):
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(path + ".part", path)
+
+
+def read_stage(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def run_stage(db_path, job, stage):
+    """Run one stage of a job from the previous stage's stored result"""
+    platform = job.params["platform"]
+    if stage == EXTRACTING:
+        write_stage(stage_path(db_path, job, EXTRACTING), read_manuscript(job.source))
+        return None
+    if stage == FORMATTING:
+        text = read_stage(stage_path(db_path, job, EXTRACTING))
+        formatted_text = format_text_for_platform(text, platform, FORMATTING_PRESETS[platform])
+        write_stage(stage_path(db_path, job, FORMATTING), formatted_text)
+        return None
+    chapters = process_text(read_stage(stage_path(db_path, job, FORMATTING)))
+    outputs = export_chapters(chapters, job.source, job.params["output_dir"], platform, job.params["formats"])
+    return {"outputs": outputs, "chapters": len(chapters)}
+
+
+class Heartbeat(threading.Thread):
+    """Keeps renewing the lease on a job while its stages run
+
+    Once the lease can no longer be renewed, because the stage ran out of
+    time or another worker took the job over, the stage cannot be trusted
+    to return, so the whole worker process exits.
+    """
+
+    def __init__(self, db_path, job, interval):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.job = job
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        with JobQueue(self.db_path) as queue:
+            while not self._stop_event.wait(self.interval):
+                if not queue.heartbeat(self.job):
+                    log(f"{os.path.basename(self.job.source)}: lost the job while {self.job.state}; stopping worker")
+                    os._exit(LOST_JOB_EXIT)
+
+    def stop(self):
+        """Stop renewing; returns once no renewal is in progress"""
+        self._stop_event.set()
+        self.join()
+
+
+def process_job(queue, job):
+    """Run the remaining stages of a claimed job and record the outcome"""
+    heartbeat = Heartbeat(queue.path, job, min(queue.lease_seconds, queue.stage_timeout) / 3)
+    heartbeat.start()
+    name = os.path.basename(job.source)
+    try:
+        try:
+            result = job.result
+            for stage in job.pending_stages():
+                queue.start_stage(job, stage)
+                started = time.perf_counter()
+                result = run_stage(queue.path, job, stage) or result
+                queue.finish_stage(job, stage, time.perf_counter() - started)
+        finally:
+            # Giving the job up below must not race a renewal, which would find it gone
+            heartbeat.stop()
+        queue.complete(job, result or {})
+        for stage in (EXTRACTING, FORMATTING):
+            try:
+                os.remove(stage_path(queue.path, job, stage))
+            except OSError:
+                pass
+        log(f"Converted {name} in {sum(job.timings.values()):.2f} s")
+    except KeyboardInterrupt:
+        # Stopped by the user: hand the job back with its completed stages
+        heartbeat.stop()
+        queue.release(job)
+        raise
+    except LeaseLost:
+        log(f"{name}: taken over by another worker")
+    except Exception as e:
+        heartbeat.stop()
+        try:
+            queue.fail(job, f"{type(e).__name__}: {e}")
+        except LeaseLost:
+            log(f"{name}: taken over by another worker after {type(e).__name__}: {e}")
+            return
+        outcome = "failed" if job.state == FAILED else f"will retry (attempt {job.attempts})"
+        log(f"{name}: {outcome} after {type(e).__name__}: {e}")
+
+
+def run_worker(db_path, max_attempts=MAX_ATTEMPTS, backoff_seconds=BACKOFF_SECONDS,
+               stage_timeout=STAGE_TIMEOUT_SECONDS):
+    """Claim and process jobs until none is queued or running (runs in a worker process)"""
+    try:
+        with JobQueue(db_path, max_attempts=max_attempts, backoff_seconds=backoff_seconds,
+                      stage_timeout=stage_timeout) as queue:
+            while True:
+                job = queue.claim()
+                if job is not None:
+                    log(f"Claimed {os.path.basename(job.source)} at {job.state}")
+                    process_job(queue, job)
+                    continue
+                wakeup = queue.next_wakeup()
+                if wakeup is None and not queue.active():
+                    return
+                # Wait for a backoff to pass or for another worker's job to come back
+                time.sleep(min(wakeup if wakeup is not None else IDLE_SECONDS, IDLE_SECONDS))
+    except KeyboardInterrupt:
+        pass
+
+
+def collect_inputs(paths):
+    """Expand directories into the supported files they contain"""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def add_command(args):
+    os.makedirs(args.output, exist_ok=True)
+    params = {"platform": args.preset, "formats": args.formats, "output_dir": os.path.abspath(args.output)}
+    added = skipped = 0
+    with JobQueue(args.db) as queue:
+        for path in collect_inputs(args.inputs):
+            source = os.path.abspath(path)
+            # A changed file or different settings make a new job; re-adding the same is a no-op
+            key = f"{source}:{file_digest(path)}:{args.preset}:{','.join(args.formats)}:{params['output_dir']}"
+            if queue.add(key, source, params):
+                added += 1
+            else:
+                skipped += 1
+    print(f"Queued {added} inputs ({skipped} already in the queue)")
+    return 0
+
+
+def has_work(db_path):
+    with JobQueue(db_path) as queue:
+        return queue.next_wakeup() is not None or queue.active() > 0
+
+
+def run_command(args):
+    os.makedirs(work_dir(args.db), exist_ok=True)
+    # Create the schema once before the workers race to
+    JobQueue(args.db).close()
+
+    def start_worker(name):
+        worker = multiprocessing.Process(
+            target=run_worker, args=(args.db, args.attempts, args.backoff, args.stage_timeout), name=name
+        )
+        worker.start()
+        return worker
+
+    workers = [start_worker(f"worker-{index}") for index in range(max(1, args.workers))]
+    try:
+        while workers:
+            wait([worker.sentinel for worker in workers])
+            for worker in [worker for worker in workers if not worker.is_alive()]:
+                workers.remove(worker)
+                # Killed by a signal (crash, out of memory) or gave up a hung stage
+                if worker.exitcode < 0 or worker.exitcode == LOST_JOB_EXIT:
+                    log(f"{worker.name} exited with status {worker.exitcode}")
+                    if has_work(args.db):
+                        workers.append(start_worker(worker.name))
+    except KeyboardInterrupt:
+        # Workers share the terminal's Ctrl+C and hand their jobs back
+        for worker in workers:
+            worker.join()
+        print("Interrupted; run again to resume")
+    return status_command(args)
+
+
+def status_command(args):
+    with JobQueue(args.db) as queue:
+        counts = queue.counts()
+        print("  ".join(f"{state}: {counts[state]}" for state in STATES))
+        for job in queue.jobs(FAILED):
+            print(f"  failed  {os.path.basename(job.source)}: {job.error}")
+        if getattr(args, "verbose", False):
+            for job in queue.jobs():
+                timings = ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in job.timings.items())
+                print(f"  {job.state:<11}{os.path.basename(job.source)}  {timings}")
+        return 1 if counts[FAILED] else 0
+
+
+def retry_command(args):
+    with JobQueue(args.db) as queue:
+        print(f"Queued {queue.retry_failed()} failed jobs again")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable batch conversion of manuscripts")
+    parser.add_argument("--db", default=DEFAULT_DB, help="job queue database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="queue TXT/PDF files or folders of them")
+    add.add_argument("inputs", nargs="+", help="files or folders to convert")
+    add.add_argument("--output", required=True, help="folder for the converted files")
+    add.add_argument("--preset", default="Kindle", choices=list(FORMATTING_PRESETS), help="formatting preset")
+    add.add_argument("--formats", default=",".join(EXPORT_FORMATS), help="comma-separated export formats (txt, pdf)")
+    add.set_defaults(func=add_command)
+
+    run = commands.add_parser("run", help="process the queue until it is empty")
+    run.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="worker processes")
+    run.add_argument("--attempts", type=int, default=MAX_ATTEMPTS, help="attempts before a job is marked failed")
+    run.add_argument("--backoff", type=float, default=BACKOFF_SECONDS,
+                     help="seconds before the first retry; doubles with every attempt")
+    run.add_argument("--stage-timeout", type=float, default=STAGE_TIMEOUT_SECONDS,
+                     help="seconds a single stage may run before its worker is replaced")
+    run.set_defaults(func=run_command)
+
+    status = commands.add_parser("status", help="show job counts and failures")
+    status.add_argument("--verbose", action="store_true", help="list every job with its stage timings")
+    status.set_defaults(func=status_command)
+
+    retry = commands.add_parser("retry", help="queue failed jobs again")
+    retry.set_defaults(func=retry_command)
+
+    args = parser.parse_args(argv)
+    if args.command == "add":
+        args.formats = [name.strip() for name in args.formats.split(",") if name.strip()]
+        if not args.formats or set(args.formats) - set(EXPORT_FORMATS):
+            parser.error(f"--formats must be drawn from {', '.join(EXPORT_FORMATS)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""Benchmark the formatting pipeline on synthetic manuscripts
+
+Generates reproducible manuscripts, times every pipeline stage, records peak
+memory with tracemalloc and compares the results against a stored baseline.
+With --low-memory it also replays the editor's handling of one large
+manuscript (format, pre-format, apply to the model, preview) in a fresh
+process per mode and reports the peak RSS with and without low-memory mode.
+
+    python benchmark.py                          # run and write bench_results.json
+    python benchmark.py --save-baseline          # store the run as the new baseline
+    python benchmark.py --sizes 10000,200000 --threshold 0.15
+    python benchmark.py --low-memory --sizes 10000 --session-words 850000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform as platform_module
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from itertools import accumulate
+
+from document_model import PieceTable, COMPACT_THRESHOLD
+from ebook_formatter import (
+    FORMAT_CACHE_ENTRIES,
+    FORMATTING_PRESETS,
+    FormatCache,
+    build_pdf_story,
+    clean_text,
+    create_pdf_document,
+    create_pdf_styles,
+    extract_pdf_text,
+    format_text_for_platform,
+    process_text,
+)
+from text_loader import MAX_PATCH_CHARS
+from text_patch import diff_pieces, split_pieces
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = [10000, 50000, 200000, 500000, 2000000]
+DEFAULT_RESULTS = "bench_results.json"
+DEFAULT_BASELINE = "bench_baseline.json"
+# Words in the untimed warm-up run
+WARM_UP_WORDS = 2000
+# Words in the --low-memory session manuscript, about 5 MB of text
+SESSION_WORDS = 850000
+
+WORDS = (
+    "the a an and but or of to in on at by with from over under between after before "
+    "house road river night morning window door letter voice silence light shadow "
+    "walked looked turned waited listened remembered whispered laughed opened closed "
+    "old quiet bright small heavy distant cold warm strange familiar careful sudden "
+    "always never slowly again almost perhaps still only even once"
+).split()
+NAMES = ["Anna", "Marcus", "Elena", "Tom", "Iris", "Jonah", "Clara", "Felix"]
+SPEECH_VERBS = ["said", "asked", "replied", "whispered", "muttered"]
+
+
+def generate_sentence(rng, min_words=6, max_words=18):
+    """Generate one capitalised sentence"""
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + rng.choice([".", ".", ".", "!", "?"])
+
+
+def generate_paragraph(rng, dialogue_density):
+    """Generate a narrative or dialogue paragraph and its word count"""
+    if rng.random() < dialogue_density:
+        line = generate_sentence(rng, 4, 12)[:-1]
+        text = f'"{line}," {rng.choice(NAMES)} {rng.choice(SPEECH_VERBS)}. "{generate_sentence(rng, 3, 10)}"'
+    else:
+        text = " ".join(generate_sentence(rng) for _ in range(rng.randint(2, 6)))
+    return text, len(text.split())
+
+
+def generate_manuscript(words, chapters=20, dialogue_density=0.3, seed=42):
+    """Generate a reproducible manuscript with roughly the requested word count"""
+    rng = random.Random(seed)
+    chapters = max(1, chapters)
+    words_per_chapter = max(1, words // chapters)
+    parts = []
+    for number in range(1, chapters + 1):
+        parts.append(f"Chapter {number}")
+        written = 0
+        while written < words_per_chapter:
+            paragraph, count = generate_paragraph(rng, dialogue_density)
+            parts.append(paragraph)
+            written += count
+    return "\n\n".join(parts) + "\n"
+
+
+def build_stages(text, preset_name, pdf_path, include_pdf):
+    """Return (name, setup, run) tuples for every benchmarked stage"""
+    preset = FORMATTING_PRESETS[preset_name]
+    chapters = process_text(text)
+    styles = create_pdf_styles(preset)
+
+    stages = [
+        ("process_text", lambda: text, process_text),
+        ("clean_text", lambda: text, clean_text),
+    ]
+    for name in FORMATTING_PRESETS:
+        stages.append((
+            f"format_text_for_platform[{name}]",
+            lambda: text,
+            lambda source, name=name: format_text_for_platform(source, name, FORMATTING_PRESETS[name]),
+        ))
+
+    if include_pdf:
+        def build_story(_):
+            return build_pdf_story(chapters, styles, preset)
+
+        def build_document(story):
+            create_pdf_document(pdf_path, preset).build(story)
+
+        stages.extend([
+            ("build_pdf_story", lambda: None, build_story),
+            ("doc.build", lambda: build_pdf_story(chapters, styles, preset), build_document),
+            ("pdf_import", lambda: pdf_path, extract_pdf_text),
+        ])
+    return stages
+
+
+def time_stage(setup, run, repeat):
+    """Time a stage without tracing and return its wall-clock samples"""
+    samples = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        run(argument)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def measure_peak_memory(setup, run):
+    """Run a stage once under tracemalloc and return its peak allocation"""
+    argument = setup()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        run(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def warm_up(args, pdf_path):
+    """Run every stage once on a small manuscript without timing it
+
+    One-time costs, such as loading nltk's punkt model, compiling patterns
+    and registering fonts, are then not charged to the first size.
+    """
+    text = generate_manuscript(WARM_UP_WORDS, args.chapters, args.dialogue, args.seed)
+    for _, setup, run in build_stages(text, args.preset, pdf_path, not args.skip_pdf):
+        run(setup())
+
+
+def run_benchmarks(args):
+    """Run every stage for every manuscript size"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "benchmark.pdf")
+        print(f"Warming up on {WARM_UP_WORDS:,} words")
+        warm_up(args, pdf_path)
+        for size in args.sizes:
+            text = generate_manuscript(size, args.chapters, args.dialogue, args.seed)
+            include_pdf = not args.skip_pdf and size <= args.pdf_max_words
+            print(f"\n{size:,} words ({len(text):,} characters, {args.chapters} chapters)")
+
+            size_results = {}
+            for name, setup, run in build_stages(text, args.preset, pdf_path, include_pdf):
+                samples = time_stage(setup, run, args.repeat)
+                peak = measure_peak_memory(setup, run) if args.memory else None
+                size_results[name] = {
+                    "seconds": min(samples),
+                    "median_seconds": statistics.median(samples),
+                    "peak_bytes": peak,
+                }
+                peak_text = f"{peak / 1048576:9.1f} MiB" if peak is not None else ""
+                print(f"  {name:<40} {min(samples):9.4f} s {peak_text}")
+            results[str(size)] = size_results
+    return results
+
+
+def apply_patch(document, old, new):
+    """Make the edits patch_widget would, in the model, as the input widget binding does
+
+    Returns False without editing when the app would reload instead.
+    """
+    edits = diff_pieces(old, new)
+    if sum(len(replacement) for _, _, replacement in edits) > MAX_PATCH_CHARS:
+        return False
+    offsets = list(accumulate(map(len, split_pieces(old)), initial=0))
+    for first, last, replacement in edits:
+        document.delete(offsets[first], offsets[last] - offsets[first])
+        document.insert(offsets[first], replacement)
+    return True
+
+
+def editor_session(text, preset_name, low_memory):
+    """Replay what the editor keeps in memory after formatting text and return it all
+
+    Formats the preset (and, outside low-memory mode, pre-formats the
+    others) into the format cache and applies the result to the document
+    model; then makes a small edit and chooses the preset again, which
+    patches the edit away outside low-memory mode, and builds the preview.
+    """
+    document = PieceTable(text)
+    document.compact_threshold = 0 if low_memory else COMPACT_THRESHOLD
+    cache = FormatCache(max_entries=1 if low_memory else FORMAT_CACHE_ENTRIES)
+    platforms = [preset_name] if low_memory else [preset_name, *(name for name in FORMATTING_PRESETS if name != preset_name)]
+    for platform in platforms:
+        formatted_text = format_text_for_platform(text, platform, FORMATTING_PRESETS[platform])
+        cache.put(cache.key(text, platform), formatted_text, process_text(formatted_text))
+
+    def apply_formatted_text():
+        formatted_text, chapters = cache.get(cache.key(text, preset_name))
+        if low_memory or not apply_patch(document, document.text(), formatted_text):
+            document.reset(formatted_text)
+        return chapters
+
+    apply_formatted_text()
+    document.insert(len(document) // 2, "edit ")
+    held = apply_formatted_text()
+
+    chapters = process_text(document.text())
+    shown = chapters[:1] if low_memory else chapters
+    separator = "-" * 50
+    preview = "".join(f"{chapter.title}\n\n{chapter.body()}\n\n{separator}\n\n" for chapter in shown)
+    return document, cache, held, chapters, preview
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def session_child(words, args, low_memory, results):
+    text = generate_manuscript(words, args.chapters, args.dialogue, args.seed)
+    loaded = peak_rss()
+    state = editor_session(text, args.preset, low_memory)
+    results.put((len(text), loaded, peak_rss()))
+    del state
+
+
+def measure_session_memory(args):
+    """Peak RSS of an editor session, in a fresh process per mode"""
+    if resource is None:
+        print("\nPeak RSS cannot be measured on this platform")
+        return None
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    print(f"\nEditor session, {args.session_words:,} words")
+    for low_memory in (False, True):
+        queue = context.Queue()
+        process = context.Process(target=session_child, args=(args.session_words, args, low_memory, queue))
+        process.start()
+        characters, loaded, peak = queue.get()
+        process.join()
+        mode = "low_memory" if low_memory else "normal"
+        results[mode] = {"characters": characters, "loaded_rss_bytes": loaded, "peak_rss_bytes": peak}
+        print(f"  {mode:<40} {peak / 1048576:9.1f} MiB peak RSS "
+              f"({(peak - loaded) / 1048576:.1f} MiB over the loaded manuscript)")
+    normal, low = results["normal"], results["low_memory"]
+    normal_growth = normal["peak_rss_bytes"] - normal["loaded_rss_bytes"]
+    low_growth = low["peak_rss_bytes"] - low["loaded_rss_bytes"]
+    # Peak RSS grows in whole pages; below one the ratio would be noise
+    growth_ratio = f"{normal_growth / low_growth:.2f}x" if low_growth >= resource.getpagesize() else "n/a"
+    print(f"  {'low-memory saving':<40} {normal['peak_rss_bytes'] / low['peak_rss_bytes']:9.2f}x peak RSS, "
+          f"{growth_ratio} over the loaded manuscript")
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """Return the stages that got slower or bigger than the baseline allows"""
+    regressions = []
+    for size, stages in results.items():
+        for name, current in stages.items():
+            previous = baseline.get(size, {}).get(name)
+            if not previous:
+                continue
+            for metric in ("seconds", "peak_bytes"):
+                old, new = previous.get(metric), current.get(metric)
+                if old and new is not None and new > old * (1 + threshold):
+                    regressions.append((size, name, metric, old, new))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ebook formatting pipeline")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="comma-separated manuscript sizes in words")
+    parser.add_argument("--chapters", type=int, default=30, help="chapters per manuscript")
+    parser.add_argument("--dialogue", type=float, default=0.3,
+                        help="fraction of paragraphs that are dialogue (0-1)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the generator")
+    parser.add_argument("--preset", default="Kindle", choices=list(FORMATTING_PRESETS),
+                        help="preset used for the PDF stages")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip the tracemalloc peak-memory run")
+    parser.add_argument("--skip-pdf", action="store_true", help="skip PDF build and import stages")
+    parser.add_argument("--pdf-max-words", type=int, default=200000,
+                        help="largest manuscript that still runs the PDF stages")
+    parser.add_argument("--output", default=DEFAULT_RESULTS, help="where to write the results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="also report an editor session's peak RSS with and without low-memory mode")
+    parser.add_argument("--session-words", type=int, default=SESSION_WORDS,
+                        help="manuscript size in words for --low-memory")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed slowdown before a stage counts as a regression (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    return args
+
+
+def main(argv=None):
+    """Run the benchmark suite and report regressions"""
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform_module.platform(),
+            "chapters": args.chapters,
+            "dialogue": args.dialogue,
+            "seed": args.seed,
+            "preset": args.preset,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.low_memory:
+        report["session_memory"] = measure_session_memory(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if not regressions:
+        print(f"No regressions beyond {args.threshold:.0%} of the baseline")
+        return 0
+
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+    for size, name, metric, old, new in regressions:
+        print(f"  {size:>8} words  {name:<40} {metric:<10} {old:.4g} -> {new:.4g} (+{new / old - 1:.0%})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+"""Authoritative document text kept in step with the input widget
+
+The input widget's Tcl command is wrapped so every insert, delete and
+replace - typing, paste, undo/redo and programmatic edits alike - is
+mirrored into a PieceTable. The engine reads the document from the model
+instead of copying the whole widget contents across the Tcl boundary.
+"""
+from bisect import bisect_right
+from itertools import accumulate
+
+# Typed characters are merged into one piece until it reaches this size
+COALESCE_LIMIT = 1024
+# Above this many pieces the table is flattened back into one piece
+COMPACT_THRESHOLD = 2048
+
+
+class DocumentSnapshot:
+    """Immutable view of the document at one version
+
+    Holds the text and chapter index exactly as they were when it was
+    taken, so a background job can read it while the user keeps editing.
+    Python strings are immutable, so taking a snapshot copies nothing.
+    """
+    __slots__ = ("version", "text", "chapters")
+
+    def __init__(self, version, text, chapters=()):
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "text", text)
+        object.__setattr__(self, "chapters", tuple(chapters))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DocumentSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("DocumentSnapshot is immutable")
+
+    def __len__(self):
+        return len(self.text)
+
+    def __repr__(self):
+        return f"DocumentSnapshot(version={self.version}, {len(self.text)} chars, {len(self.chapters)} chapters)"
+
+
+class PieceTable:
+    """Text buffer described as a list of (source, start, end) pieces"""
+
+    def __init__(self, text=""):
+        self.version = 0
+        # Materialising replaces more pieces than this with the joined text
+        self.compact_threshold = COMPACT_THRESHOLD
+        self._listeners = []
+        self._snapshot = None
+        self._set_pieces(text)
+
+    def _set_pieces(self, text):
+        self._pieces = [(text, 0, len(text))] if text else []
+        self._length = len(text)
+        self._starts = None
+        self._text = text
+        self._last_insert = None
+
+    def __len__(self):
+        return self._length
+
+    def text(self):
+        """Return the whole document, materialised once per version"""
+        if self._text is None:
+            self._text = "".join(source[start:end] for source, start, end in self._pieces)
+            if len(self._pieces) > self.compact_threshold:
+                self._pieces = [(self._text, 0, self._length)]
+                self._starts = None
+        return self._text
+
+    def sources(self):
+        """Return the distinct strings the document keeps alive"""
+        sources = {id(source): source for source, _, _ in self._pieces}
+        if self._text is not None:
+            sources[id(self._text)] = self._text
+        return list(sources.values())
+
+    def snapshot(self, chapters=()):
+        """Return an immutable snapshot of the current version
+
+        Repeated calls without edits in between return the same object.
+        """
+        chapters = tuple(chapters)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != self.version or snapshot.chapters != chapters:
+            snapshot = self._snapshot = DocumentSnapshot(self.version, self.text(), chapters)
+        return snapshot
+
+    def slice(self, start, end):
+        """Return text[start:end] without materialising the whole document"""
+        if self._text is not None:
+            return self._text[start:end]
+        start, end = max(0, start), min(end, self._length)
+        if start >= end:
+            return ""
+        starts = self._piece_starts()
+        index = bisect_right(starts, start) - 1
+        parts = []
+        while index < len(self._pieces) and starts[index] < end:
+            source, piece_start, piece_end = self._pieces[index]
+            offset = starts[index]
+            parts.append(source[piece_start + max(0, start - offset):piece_start + min(end - offset, piece_end - piece_start)])
+            index += 1
+        return "".join(parts)
+
+    def reset(self, text=""):
+        """Replace the whole document"""
+        self._set_pieces(text)
+        self._changed("reset", 0, text)
+
+    def insert(self, offset, text):
+        """Insert text at a character offset"""
+        if not text:
+            return
+        offset = min(max(offset, 0), self._length)
+        index = self._split(offset)
+
+        previous = self._pieces[index - 1] if index else None
+        if (previous is not None and previous is self._last_insert
+                and previous[2] == len(previous[0]) and previous[2] - previous[1] < COALESCE_LIMIT):
+            # Extend the piece created by the previous insert (typing)
+            source, start, end = previous
+            merged = (source + text, start, end + len(text))
+            self._pieces[index - 1] = merged
+        else:
+            merged = (text, 0, len(text))
+            self._pieces.insert(index, merged)
+        self._last_insert = merged
+
+        self._length += len(text)
+        self._starts = None
+        self._text = None
+        self._changed("insert", offset, text)
+
+    def delete(self, offset, length):
+        """Delete length characters starting at a character offset"""
+        offset = min(max(offset, 0), self._length)
+        length = min(length, self._length - offset)
+        if length <= 0:
+            return
+        first = self._split(offset)
+        last = self._split(offset + length)
+        del self._pieces[first:last]
+
+        self._length -= length
+        self._starts = None
+        self._text = None
+        self._last_insert = None
+        self._changed("delete", offset, length)
+
+    def add_listener(self, listener):
+        """Call listener(kind, offset, payload) after every change
+
+        kind is "insert" (payload is the text), "delete" (payload is the
+        length) or "reset" (payload is the new text).
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _changed(self, kind, offset, payload):
+        self.version += 1
+        for listener in list(self._listeners):
+            listener(kind, offset, payload)
+
+    def _piece_starts(self):
+        if self._starts is None:
+            self._starts = [0, *accumulate(end - start for _, start, end in self._pieces)][:-1] if self._pieces else []
+        return self._starts
+
+    def _split(self, offset):
+        """Make sure a piece boundary falls at offset and return its piece index"""
+        if offset >= self._length:
+            return len(self._pieces)
+        starts = self._piece_starts()
+        index = bisect_right(starts, offset) - 1
+        local = offset - starts[index]
+        if local == 0:
+            return index
+        source, start, end = self._pieces[index]
+        self._pieces[index:index + 1] = [(source, start, start + local), (source, start + local, end)]
+        self._starts = None
+        return index + 1
+
+
+class TextModelBinding:
+    """Mirrors every edit of a Tk text widget into a PieceTable
+
+    The widget's Tcl command is renamed and replaced by a Python command,
+    the same technique IDLE uses to observe its editor. Indices are
+    resolved with the widget's own ``count`` so only small strings cross
+    into Tcl.
+    """
+
+    def __init__(self, widget, model):
+        self.widget = widget
+        self.model = model
+        self.suspended = 0
+        self._edit_listeners = []
+        self._tk = widget.tk
+        self._name = widget._w
+        self._orig = self._name + "_model_orig"
+        self._tk.call("rename", self._name, self._orig)
+        self._tk.createcommand(self._name, self._dispatch)
+        model.reset(self._call("get", "1.0", "end-1c"))
+
+    def close(self):
+        """Restore the widget's original Tcl command"""
+        self._tk.deletecommand(self._name)
+        self._tk.call("rename", self._orig, self._name)
+
+    def suspend(self):
+        """Stop modelling edits until the matching resume()"""
+        self.suspended += 1
+
+    def resume(self):
+        self.suspended -= 1
+
+    def resync(self):
+        """Reload the model from the widget after edits made while suspended"""
+        self.model.reset(self._call("get", "1.0", "end-1c"))
+
+    def add_edit_listener(self, listener):
+        """Call listener(first_line, last_line, line_delta) after each modelled edit
+
+        first_line..last_line are the widget lines touched by the edit, in
+        the text as it is afterwards; line_delta is the number of lines the
+        edit added (negative when it removed lines).
+        """
+        self._edit_listeners.append(listener)
+
+    def remove_edit_listener(self, listener):
+        if listener in self._edit_listeners:
+            self._edit_listeners.remove(listener)
+
+    def offset(self, index):
+        """Return the model offset of a Tk index"""
+        return self._offset(index)
+
+    def _line(self, index):
+        return int(str(self._call("index", index)).split(".")[0])
+
+    def _edited(self, first, removed, text):
+        added = text.count("\n")
+        for listener in list(self._edit_listeners):
+            listener(first, first + added, added - removed)
+
+    def _call(self, *args):
+        return self._tk.call((self._orig,) + args)
+
+    def _dispatch(self, operation, *args):
+        if operation in ("insert", "delete", "replace") and not self.suspended:
+            return getattr(self, "_" + operation)(*args)
+        return self._call(operation, *args)
+
+    def _offset(self, index):
+        """Translate a Tk index into a character offset in the model"""
+        count = self._call("count", "-chars", "1.0", index)
+        return min(int(count) if count else 0, len(self.model))
+
+    def _editable(self):
+        return str(self._call("cget", "-state")) != "disabled"
+
+    def _insert(self, index, *args):
+        offset = self._offset(index) if self._editable() else None
+        line = self._line(index) if offset is not None and self._edit_listeners else None
+        result = self._call("insert", index, *args)
+        if offset is not None:
+            text = "".join(args[0::2])
+            self.model.insert(offset, text)
+            if line is not None:
+                self._edited(line, 0, text)
+        return result
+
+    def _delete(self, *indices):
+        ranges = self._ranges(indices) if self._editable() else []
+        lines = self._line_span(indices) if ranges and self._edit_listeners else None
+        result = self._call("delete", *indices)
+        for start, end in ranges:
+            self.model.delete(start, end - start)
+        if lines:
+            self._edited(lines[0], lines[1], "")
+        return result
+
+    def _replace(self, index1, index2, *args):
+        editable = self._editable()
+        if editable:
+            start = self._offset(index1)
+            ranges = self._ranges((index1, index2))
+            lines = self._line_span((index1, index2)) if self._edit_listeners else None
+        result = self._call("replace", index1, index2, *args)
+        if editable:
+            for range_start, range_end in ranges:
+                self.model.delete(range_start, range_end - range_start)
+            text = "".join(args[0::2])
+            self.model.insert(start, text)
+            if lines:
+                self._edited(lines[0], lines[1], text)
+        return result
+
+    def _line_span(self, indices):
+        """Return the first line touched by delete index pairs and the lines they remove"""
+        lines = [self._line(index) for index in indices]
+        if len(indices) % 2:
+            lines.append(lines[-1])
+        removed = sum(max(0, end - start) for start, end in zip(lines[0::2], lines[1::2]))
+        return min(lines), removed
+
+    def _ranges(self, indices):
+        """Resolve delete index pairs into merged ranges, last range first"""
+        ranges = []
+        for position in range(0, len(indices), 2):
+            start = self._offset(indices[position])
+            if position + 1 < len(indices):
+                end = self._offset(indices[position + 1])
+            else:
+                end = min(start + 1, len(self.model))
+            if end > start:
+                ranges.append((start, end))
+        ranges.sort()
+        merged = []
+        for start, end in ranges:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged[::-1]
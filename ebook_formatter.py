@@ -2,7 +2,7 @@ import tkinter as tk
 from tkinter import scrolledtext, messagebox, filedialog, ttk
 import re
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak, Preformatted
 from reportlab.platypus.tableofcontents import TableOfContents
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import fonts
@@ -19,56 +19,219 @@ from docx.enum.text import WD_ALIGN_PARAGRAPH
 import json
 import os
 from datetime import datetime
-import threading
-from queue import Queue
 import concurrent.futures
+import textwrap
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+import hashlib
+from collections import OrderedDict
+import multiprocessing
+import time
+from profiling import profiler, STAGES
+from document_model import PieceTable, TextModelBinding, COMPACT_THRESHOLD
+from scheduler import TaskScheduler, PRIORITY_NORMAL, PRIORITY_IDLE, JOB_CPU, create_process_pool
+from shared_text import SharedText, read_range
+from text_loader import TextLoader
+from refresh import RefreshLoop
+from gradient import GradientBackground
+from project_file import PROJECT_EXTENSION, save_project, load_project
+from workspace import Workspace, WorkspaceDocument
+from memory_report import start_tracing, measure_owners, format_report
+from text_patch import patch_widget
+from pagination import Paginator, content_key
+from text_metrics import WidthCache
+from autosave import AutoSaver, EditJournal, document_id, find_recoverable_sessions, prune_sessions
+
+# Chapter heading lines: "Chapter 3", "CHAPTER 3" or "3."
+CHAPTER_HEADING_PATTERN = re.compile(r'^[^\S\n]*(?:chapter[^\S\n]+\d|\d+\.)[^\n]*', re.IGNORECASE | re.MULTILINE)
+# A chapter heading standing as its own paragraph; no code block reaches past one
+PARAGRAPH_HEADING_PATTERN = re.compile(
+    r'^[^\S\n]*\n(?P<heading>' + CHAPTER_HEADING_PATTERN.pattern[1:] + r')\n[^\S\n]*(?:\n|\Z)',
+    re.IGNORECASE | re.MULTILINE
+)
+LINE_PATTERN = re.compile(r'[^\n]+')
+NON_SPACE_PATTERN = re.compile(r'\S')
+
+# Opening lines of code blocks: ``` or ~~~ fences and [code] markers. A
+# line that also holds its closing fence (a block joined onto one line by
+# formatting) opens nothing; backtick info strings never contain backticks.
+CODE_MARKERS = ('```', '~~~', '[code]', '[CODE]')
+CODE_START_PATTERN = re.compile(r'^[^\S\n]*(?:(?P<fence>`{3,}(?=[^`\n]*$)|~{3,}(?![^\n]*~{3}))[^\n]*|(?P<marker>\[(?:code|CODE)\])[^\S\n]*)$', re.MULTILINE)
+# ...optionally also lines indented by four spaces or a tab
+CODE_START_INDENTED_PATTERN = re.compile(CODE_START_PATTERN.pattern + r'|^(?P<indented>(?: {4}|\t)[^\n]*\S)', re.MULTILINE)
+CODE_END_MARKER_PATTERN = re.compile(r'^[^\S\n]*\[/(?:code|CODE)\][^\S\n]*$', re.MULTILINE)
+# Indented lines, with any blank lines between them, up to the last indented line
+INDENTED_BLOCK_PATTERN = re.compile(r'(?:(?:[^\S\n]*\n)*(?: {4}|\t)[^\n]*(?:\n|\Z))+')
+
+class Chapter:
+    """A chapter title plus the offsets of its body in the shared document text"""
+    __slots__ = ('title', 'source', 'start', 'end')
+
+    def __init__(self, title, source, start, end):
+        self.title = title
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return f"Chapter({self.title!r}, {self.start}:{self.end})"
+
+    def paragraphs(self):
+        """Lazily yield the stripped, non-empty lines of the chapter body"""
+        return iter_paragraphs(self.source, self.start, self.end)
+
+    def segments(self, indented_code=False):
+        """Lazily yield ("text", paragraph) and ("code", code) parts of the body"""
+        position = self.start
+        for block in find_code_blocks(self.source, self.start, self.end, indented_code):
+            for paragraph in iter_paragraphs(self.source, position, block.start):
+                yield "text", paragraph
+            code = textwrap.dedent(self.source[block.code_start:block.code_end]).strip("\n")
+            if code:
+                yield "code", code
+            position = block.end
+        for paragraph in iter_paragraphs(self.source, position, self.end):
+            yield "text", paragraph
+
+    def body(self):
+        """Return the chapter body with one paragraph per line"""
+        return "\n".join(self.paragraphs())
+
+class ProjectChapter(Chapter):
+    """A chapter of an opened project file whose text is read on first use"""
+    __slots__ = ('project', 'chunk')
+
+    def __init__(self, project, entry):
+        self.project = project
+        self.title = entry["title"]
+        self.chunk = entry["chunk"]
+        self.start = entry["start"]
+        self.end = entry["end"]
+
+    @property
+    def source(self):
+        return self.project.chunk_text(self.chunk)
+
+def iter_paragraphs(text, start, end):
+    """Lazily yield the stripped, non-empty lines of text[start:end]"""
+    for match in LINE_PATTERN.finditer(text, start, end):
+        line = match.group().strip()
+        if line:
+            yield line
+
+class CodeBlock:
+    """Offsets of a code block and of the code inside its fences or markers"""
+    __slots__ = ('kind', 'start', 'end', 'code_start', 'code_end')
+
+    def __init__(self, kind, start, end, code_start, code_end):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.code_start = code_start
+        self.code_end = code_end
+
+    def __repr__(self):
+        return f"CodeBlock({self.kind!r}, {self.start}:{self.end})"
+
+@lru_cache(maxsize=None)
+def closing_fence_pattern(fence):
+    """Pattern for a fence closing one opened with `fence`"""
+    return re.compile(r'^[^\S\n]*%s{%d,}[^\S\n]*$' % (re.escape(fence[0]), len(fence)), re.MULTILINE)
+
+def find_code_blocks(text, start=0, end=None, indented=False):
+    """Return the code blocks in text[start:end] in order, in one pass
+
+    Fenced (``` or ~~~) and [code]...[/code] blocks are always found. A
+    closing fence or marker is only looked for up to the next chapter
+    heading that stands as its own paragraph, and an unclosed block runs
+    to the next chapter heading or the end of the range, so a stray fence
+    cannot hide the rest of the book. Blocks of lines indented by four
+    spaces or a tab after a blank line are only found with indented=True,
+    since the Print preset indents every paragraph.
+    """
+    end = len(text) if end is None else end
+    if not indented and all(text.find(marker, start, end) == -1 for marker in CODE_MARKERS):
+        return []  # plain prose, the common case
+    pattern = CODE_START_INDENTED_PATTERN if indented else CODE_START_PATTERN
+    blocks = []
+    position = start
+    while True:
+        match = pattern.search(text, position, end)
+        if not match:
+            return blocks
+        line_end = match.end()
+        code_start = min(line_end + 1, end)
+        if match.lastgroup == 'indented':
+            # Must follow a blank line (or start the range)
+            previous_end = match.start() - 1
+            if previous_end > start and NON_SPACE_PATTERN.search(text, max(start, text.rfind('\n', start, previous_end) + 1), previous_end):
+                position = code_start
+                continue
+            block = INDENTED_BLOCK_PATTERN.match(text, match.start(), end)
+            blocks.append(CodeBlock('indented', match.start(), block.end(), match.start(), block.end()))
+            position = block.end()
+            continue
+        heading = PARAGRAPH_HEADING_PATTERN.search(text, code_start, end)
+        limit = heading.start('heading') if heading else end
+        if match.lastgroup == 'fence':
+            closing = closing_fence_pattern(match.group('fence')).search(text, code_start, limit)
+            kind = 'fence'
+        else:
+            closing = CODE_END_MARKER_PATTERN.search(text, code_start, limit)
+            kind = 'marker'
+        if closing:
+            code_end, block_end = closing.start(), min(closing.end() + 1, end)
+        else:
+            heading = CHAPTER_HEADING_PATTERN.search(text, code_start, limit)
+            code_end = block_end = heading.start() if heading else limit
+        blocks.append(CodeBlock(kind, match.start(), block_end, code_start, code_end))
+        position = block_end
+
+def code_block_lines(text, blocks):
+    """Return (first_line, last_line) of the code in each block, 1-based"""
+    lines = []
+    line = 1
+    position = 0
+    for block in blocks:
+        line += text.count('\n', position, block.code_start)
+        position = block.code_start
+        code_lines = text.count('\n', block.code_start, block.code_end)
+        if block.code_end > block.code_start and text[block.code_end - 1] != '\n':
+            code_lines += 1  # block ends without a trailing newline
+        if code_lines:
+            lines.append((line, line + code_lines - 1))
+    return lines
 
 def process_text(text):
     """Process text to detect chapters and their content"""
     chapters = []
-    current_chapter = None
-    current_content = []
+    headings = list(CHAPTER_HEADING_PATTERN.finditer(text))
     
-    # Split text into lines
-    lines = text.split('\n')
+    # Numbered lines inside code blocks are not headings
+    blocks = find_code_blocks(text) if headings else []
+    if blocks:
+        block_starts = [block.start for block in blocks]
+        headings = [
+            heading for heading in headings
+            if not _inside_block(blocks, block_starts, heading.start())
+        ]
     
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-            
-        # Check for chapter markers
-        if re.match(r'^Chapter\s+\d+', line, re.IGNORECASE) or \
-           re.match(r'^CHAPTER\s+\d+', line) or \
-           re.match(r'^\d+\.', line):
-            # Save previous chapter if exists
-            if current_chapter:
-                chapters.append({
-                    'title': current_chapter,
-                    'content': current_content
-                })
-            
-            # Start new chapter
-            current_chapter = line
-            current_content = []
-        else:
-            # Add line to current chapter content
-            if current_chapter:
-                current_content.append(line)
-            else:
-                # If no chapter title found yet, create a default chapter
-                current_chapter = "Chapter 1"
-                current_content.append(line)
+    # Text before the first heading becomes a default chapter
+    first_heading = headings[0].start() if headings else len(text)
+    if NON_SPACE_PATTERN.search(text, 0, first_heading):
+        chapters.append(Chapter("Chapter 1", text, 0, first_heading))
     
-    # Add the last chapter
-    if current_chapter:
-        chapters.append({
-            'title': current_chapter,
-            'content': current_content
-        })
+    # Each heading owns the text up to the next heading
+    for index, heading in enumerate(headings):
+        body_end = headings[index + 1].start() if index + 1 < len(headings) else len(text)
+        chapters.append(Chapter(heading.group().strip(), text, heading.end(), body_end))
     
     return chapters
 
+def _inside_block(blocks, block_starts, offset):
+    index = bisect_right(block_starts, offset) - 1
+    return index >= 0 and offset < blocks[index].end
+
 def clean_text(text):
     """Clean and normalize text"""
     # Remove extra whitespace
@@ -84,19 +247,162 @@ def clean_text(text):
     
     return text.strip()
 
-# Create a thread pool for background tasks
-thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
-
-# Initialize NLTK in a background thread
+def format_text_for_platform(text, platform, preset):
+    """Format text according to platform-specific rules"""
+    try:
+        # Split text into paragraphs
+        paragraphs = text.split('\n\n')
+        formatted_paragraphs = []
+        
+        for paragraph in paragraphs:
+            # Clean up the paragraph
+            paragraph = clean_text(paragraph)
+            
+            # Apply platform-specific formatting
+            if platform in ["Kindle", "Google Books"]:
+                # Add proper spacing for e-readers
+                paragraph = paragraph.replace('. ', '.\n\n')
+                paragraph = paragraph.replace('! ', '!\n\n')
+                paragraph = paragraph.replace('? ', '?\n\n')
+                # Ensure proper dialogue formatting
+                paragraph = paragraph.replace('" "', '" "')
+            elif platform == "Print":
+                # Add proper spacing for print
+                paragraph = paragraph.replace('. ', '. ')
+                paragraph = paragraph.replace('! ', '! ')
+                paragraph = paragraph.replace('? ', '? ')
+                # Ensure proper paragraph indentation
+                paragraph = "    " + paragraph
+            
+            formatted_paragraphs.append(paragraph)
+        
+        # Join paragraphs with appropriate spacing
+        return '\n\n'.join(formatted_paragraphs)
+    except Exception as e:
+        print(f"Error in format_text_for_platform: {str(e)}")
+        return text  # Return original text if formatting fails
+
+PARAGRAPH_BREAK_PATTERN = re.compile(r'\n{2,}')
+
+def split_paragraph_batches(text, batches):
+    """Split text at paragraph breaks into up to `batches` pieces
+
+    Formatting each piece with format_text_for_platform and joining the
+    results with a blank line gives exactly the same output as formatting
+    the whole text, so the pieces can be formatted in parallel.
+    """
+    target = max(1, len(text) // max(1, batches))
+    pieces = []
+    start = 0
+    # Split at the start of a run of newlines, where str.split('\n\n') would
+    for match in PARAGRAPH_BREAK_PATTERN.finditer(text):
+        if match.start() - start < target:
+            continue
+        pieces.append(text[start:match.start()])
+        start = match.start() + 2
+    pieces.append(text[start:])
+    return pieces
+
+def format_shared_range(name, start, end, platform, preset):
+    """Format one byte range of a SharedText block (runs in a worker process)"""
+    return format_text_for_platform(read_range(name, start, end), platform, preset)
+
+def preformat_shared_range(name, start, end, platform, preset):
+    """Format a SharedText range and detect its chapters (runs in a worker process)"""
+    formatted_text = format_shared_range(name, start, end, platform, preset)
+    return formatted_text, process_text(formatted_text)
+
+def preformat_text(text, platform, preset):
+    """Format text and detect its chapters"""
+    formatted_text = format_text_for_platform(text, platform, preset)
+    return formatted_text, process_text(formatted_text)
+
+# Formatted presets cached; low-memory mode keeps only the current one
+FORMAT_CACHE_ENTRIES = 8
+
+class FormatCache:
+    """Bounded LRU cache of formatted text and chapters per source text and preset
+
+    Entries are evicted oldest-first once there are more than max_entries
+    or their formatted text exceeds max_chars in total.
+    """
+
+    def __init__(self, max_entries=FORMAT_CACHE_ENTRIES, max_chars=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._digest_source = None
+        self._digest = None
+
+    def key(self, source_text, platform):
+        """Cache key for a source text and preset; the digest is kept for the last text"""
+        if source_text is not self._digest_source:
+            self._digest = hashlib.blake2b(source_text.encode("utf-8"), digest_size=16).digest()
+            self._digest_source = source_text
+        return (self._digest, platform)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return (formatted_text, chapters) or None"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, formatted_text, chapters):
+        if key in self._entries:
+            self._chars -= len(self._entries.pop(key)[0])
+        if len(formatted_text) > self.max_chars:
+            return
+        self._entries[key] = (formatted_text, chapters)
+        self._chars += len(formatted_text)
+        self._evict()
+
+    def resize(self, max_entries=None, max_chars=None):
+        """Change the limits, evicting at once if the cache is now over them"""
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_chars is not None:
+            self.max_chars = max_chars
+        self._evict()
+
+    def texts(self):
+        """Return the formatted texts held, for memory reports"""
+        return [formatted_text for formatted_text, _ in self._entries.values()]
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._chars -= len(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self._chars = 0
+
+def extract_pdf_text(file_path):
+    """Extract the text of every page in a PDF file"""
+    text = ""
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            text += page.extract_text() + "\n"
+    return text
+
+# Flush the edit journal this often; saves are incremental, so it can be short
+AUTO_SAVE_INTERVAL_MS = 30000
+# Pause in typing before code blocks are re-indexed
+CODE_SCAN_DELAY_MS = 300
+
+# Fetch NLTK's sentence model once; called at app startup, not on import, so
+# the CLIs and worker processes that import this module stay off the network
 def init_nltk():
     try:
         nltk.data.find('tokenizers/punkt')
     except LookupError:
         nltk.download('punkt', quiet=True)
 
-# Start NLTK initialization in background
-threading.Thread(target=init_nltk, daemon=True).start()
-
 # Define themes with modern colors
 THEMES = {
     "Light": {
@@ -191,6 +497,201 @@ FORMATTING_PRESETS = {
     }
 }
 
+def create_pdf_styles(preset):
+    """Create PDF styles based on preset"""
+    styles = getSampleStyleSheet()
+    
+    # Custom styles
+    styles.add(ParagraphStyle(
+        name='CustomHeading',
+        fontName=preset['font_name'],
+        fontSize=preset['chapter_title_size'],
+        leading=preset['chapter_title_size'] * 1.2,
+        spaceAfter=preset['chapter_title_spacing'],
+        spaceBefore=preset['chapter_title_spacing']
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='CustomBody',
+        fontName=preset['font_name'],
+        fontSize=preset['font_size'],
+        leading=preset['font_size'] * preset['line_spacing'],
+        spaceAfter=preset['paragraph_spacing'],
+        spaceBefore=0,
+        firstLineIndent=preset['first_line_indent'],
+        leftIndent=0,
+        rightIndent=0,
+        wordWrap='CJK'
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='CodeBlock',
+        fontName='Courier',
+        fontSize=preset['font_size'] - 2,
+        leading=(preset['font_size'] - 2) * 1.3,
+        spaceAfter=preset['paragraph_spacing'],
+        spaceBefore=preset['paragraph_spacing'],
+        leftIndent=12
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='TOCHeading1',
+        fontName=preset['font_name'],
+        fontSize=preset['font_size'] + 2,
+        leading=preset['font_size'] * preset['line_spacing'],
+        spaceAfter=preset['paragraph_spacing'],
+        spaceBefore=0
+    ))
+    
+    return styles
+
+def create_pdf_document(file_path, preset):
+    """Create a PDF document template laid out for the preset"""
+    return SimpleDocTemplate(
+        file_path,
+        pagesize=preset['page_size'],
+        leftMargin=preset['margins'][0],
+        rightMargin=preset['margins'][1],
+        topMargin=preset['margins'][2],
+        bottomMargin=preset['margins'][3]
+    )
+
+# Page counts of chapters already laid out, shared by every export
+paginator = Paginator(create_pdf_document)
+
+# String widths shared by every PDF layout, warm-started from the last session
+width_cache = WidthCache()
+
+def use_width_cache():
+    """Load and install the width cache on the first PDF layout in this process"""
+    if not width_cache.installed:
+        width_cache.load()
+        width_cache.install()
+
+def build_pdf_story(chapters, styles, preset, cover_image_path=None, indented_code=False):
+    """Build the PDF story with all content
+
+    Every chapter starts on a new page, so the page numbers in the table
+    of contents are worked out from cached per-chapter page counts before
+    the story is built, and a single build pass lays out the book.
+    """
+    use_width_cache()
+    story = []
+    page = 1
+    
+    # Cover image
+    if cover_image_path:
+        page += paginator.count_pages(add_cover_image(cover_image_path, preset), preset)
+        story.extend(add_cover_image(cover_image_path, preset))
+    
+    # Table of Contents; its layout does not depend on the page numbers
+    toc_key = content_key("toc", *(chapter.title for chapter in chapters))
+    page += paginator.pages(toc_key, lambda: add_table_of_contents(chapters, styles), preset)
+    
+    # Chapter start pages, laying out only chapters not measured before
+    pages = []
+    for index, chapter in enumerate(chapters):
+        pages.append(page)
+        if index < len(chapters) - 1:
+            chapter_key = content_key(chapter.title, chapter.source[chapter.start:chapter.end], str(indented_code))
+            page += paginator.pages(
+                chapter_key, lambda: [*add_chapter(chapter, styles, indented_code), PageBreak()], preset
+            )
+    
+    story.extend(add_table_of_contents(chapters, styles, pages))
+    
+    # Chapters
+    story.extend(add_chapters(chapters, styles, indented_code))
+    return story
+
+def add_cover_image(cover_image_path, preset):
+    """Add cover image to PDF"""
+    with PILImage.open(cover_image_path) as img:
+        img_width, img_height = img.size
+    
+    page_width, page_height = preset['page_size']
+    scale = min(page_width / img_width, page_height / img_height)
+    scaled_width = img_width * scale
+    scaled_height = img_height * scale
+    
+    return [
+        Image(cover_image_path, width=scaled_width, height=scaled_height),
+        PageBreak()
+    ]
+
+def add_table_of_contents(chapters, styles, pages=None):
+    """Add table of contents to PDF, listing the page each chapter starts on"""
+    toc = TableOfContents(levelStyles=[styles['TOCHeading1']], dotsMinLevel=0)
+    if pages:
+        # Entries link to the anchors on the chapter headings
+        toc.addEntries([(0, chapter.title, pages[index], f"chapter-{index}") for index, chapter in enumerate(chapters)])
+    else:
+        toc.addEntries([(0, chapter.title, 0) for chapter in chapters])
+    # The entries are final, so a single build draws them
+    toc.beforeBuild()
+    return [
+        Paragraph("Table of Contents", styles['CustomHeading']),
+        Spacer(1, 24),
+        toc,
+        PageBreak()
+    ]
+
+def add_chapter(chapter, styles, indented_code=False, anchor=None):
+    """Add one chapter to PDF, with an optional link anchor on its heading"""
+    title = f'<a name="{anchor}"/>{chapter.title}' if anchor else chapter.title
+    story = [Paragraph(title, styles["CustomHeading"]), Spacer(1, 12)]
+    
+    for kind, paragraph in chapter.segments(indented_code):
+        if kind == "code":
+            # Code keeps its line breaks and indentation
+            story.append(Preformatted(paragraph, styles["CodeBlock"]))
+            continue
+        # Clean up paragraph text
+        paragraph = clean_text(paragraph)
+        # Ensure proper spacing around dialogue
+        paragraph = re.sub(r'"\s*"', '" "', paragraph)
+        # Add proper spacing after punctuation
+        paragraph = re.sub(r'([.!?])([A-Z])', r'\1 \2', paragraph)
+        story.append(Paragraph(paragraph, styles["CustomBody"]))
+    story.append(Spacer(1, 24))
+    return story
+
+def add_chapters(chapters, styles, indented_code=False):
+    """Add chapters to PDF, each starting on a new page"""
+    story = []
+    for index, chapter in enumerate(chapters):
+        if index:
+            story.append(PageBreak())
+        story.extend(add_chapter(chapter, styles, indented_code, f"chapter-{index}"))
+    
+    return story
+
+def write_chapters_text(chapters, file_path):
+    """Write chapters to a plain text file"""
+    with profiler.stage("export", len(chapters)), open(file_path, "w", encoding="utf-8") as f:
+        for chapter in chapters:
+            f.write(f"{chapter.title}\n\n")
+            f.write(chapter.body() + "\n\n")
+            f.write("-" * 50 + "\n\n")
+    return file_path
+
+def write_chapters_pdf(chapters, file_path, preset, cover_image_path=None, indented_code=False):
+    """Build a PDF of the chapters with cover image and table of contents"""
+    with profiler.stage("export", len(chapters)):
+        doc = create_pdf_document(file_path, preset)
+        styles = create_pdf_styles(preset)
+        doc.build(build_pdf_story(chapters, styles, preset, cover_image_path, indented_code))
+    try:
+        width_cache.save()
+    except OSError:
+        # The cache only speeds up the next session
+        pass
+    return file_path
+
+def document_stats(text):
+    """Return the word, character and line counts of text"""
+    return len(text.split()), len(text), len(text.splitlines())
+
 class ModernButton(ttk.Button):
     """Custom button with hover effect and modern styling"""
     def __init__(self, master=None, **kwargs):
@@ -298,12 +799,20 @@ class ModernProgressBar(ttk.Frame):
         self.progress_var.set(100)
         self.status_var.set(message)
 
+    def set_progress(self, percent, message=None):
+        """Show determinate progress, stopping any animation"""
+        self.progress.stop()
+        self.progress_var.set(percent)
+        if message is not None:
+            self.status_var.set(message)
+
 class SearchDialog(tk.Toplevel):
     """Modern search and replace dialog"""
-    def __init__(self, parent, text_widget):
+    def __init__(self, parent, text_widget, document=None):
         super().__init__(parent)
         self.title("Search and Replace")
         self.text_widget = text_widget
+        self.document = document
         self.current_search = None
         self.create_widgets()
         
@@ -410,10 +919,12 @@ class SearchDialog(tk.Toplevel):
         if self.whole_var.get():
             flags |= tk.END
             
-        content = self.text_widget.get('1.0', tk.END)
+        if self.document is not None:
+            content = self.document.text()
+        else:
+            content = self.text_widget.get('1.0', 'end-1c')
         new_content = content.replace(search_text, replace_text)
-        self.text_widget.delete('1.0', tk.END)
-        self.text_widget.insert('1.0', new_content)
+        patch_widget(self.text_widget, content, new_content)
 
 class ModernTitleBar(tk.Frame):
     """Modern title bar with gradient background and format indicators"""
@@ -455,52 +966,11 @@ class ModernTitleBar(tk.Frame):
             )
             indicator.pack(side=tk.LEFT, padx=5)
             self.format_indicators[format_name] = indicator
-        
-        # Bind window resize
-        self.bind('<Configure>', self.on_resize)
     
     def create_gradient(self):
-        """Create enhanced gradient background"""
-        width = self.winfo_width()
-        height = self.winfo_height()
-        
-        # Create a more vibrant gradient with three colors
-        start_color = "#0078d7"  # Microsoft blue
-        mid_color = "#00a4ef"    # Lighter blue
-        end_color = "#106ebe"    # Darker blue
-        
-        for i in range(height):
-            # Calculate position in gradient (0 to 1)
-            pos = i / height
-            
-            # Create three-color gradient
-            if pos < 0.5:
-                # Blend from start to mid color
-                blend = pos * 2
-                color = self.blend_colors(start_color, mid_color, blend)
-            else:
-                # Blend from mid to end color
-                blend = (pos - 0.5) * 2
-                color = self.blend_colors(mid_color, end_color, blend)
-            
-            self.canvas.create_line(0, i, width, i, fill=color)
-    
-    def blend_colors(self, color1, color2, blend_factor):
-        """Blend two colors based on blend factor (0 to 1)"""
-        # Convert hex to RGB
-        r1, g1, b1 = [int(color1[i:i+2], 16) for i in (1, 3, 5)]
-        r2, g2, b2 = [int(color2[i:i+2], 16) for i in (1, 3, 5)]
-        
-        # Blend colors
-        r = int(r1 + (r2 - r1) * blend_factor)
-        g = int(g1 + (g2 - g1) * blend_factor)
-        b = int(b1 + (b2 - b1) * blend_factor)
-        
-        return f'#{r:02x}{g:02x}{b:02x}'
-    
-    def on_resize(self, event):
-        """Handle window resize"""
-        self.create_gradient()
+        """Create enhanced gradient background, rendered once per size"""
+        # A more vibrant gradient with three colors: Microsoft blue, lighter blue, darker blue
+        self.gradient = GradientBackground(self.canvas, ("#0078d7", "#00a4ef", "#106ebe"))
     
     def update_format_indicator(self, format_name):
         """Update the active format indicator with enhanced visual feedback"""
@@ -598,6 +1068,24 @@ class ModernSearchBar(ttk.Frame):
             self.clear_search()
             return
         
+        self.highlight_matches()
+        
+        # Go to first match
+        if self.matches:
+            self.current_match = 0
+            self.go_to_match(0)
+    
+    def refresh(self):
+        """Re-highlight the matches after the text changed, without moving"""
+        if self.text_widget and self.search_var.get():
+            self.highlight_matches()
+            if self.current_match >= len(self.matches):
+                self.current_match = 0
+    
+    def highlight_matches(self):
+        """Find and highlight every match of the search text"""
+        search_text = self.search_var.get()
+        
         # Remove existing tags
         self.text_widget.tag_remove('search', '1.0', tk.END)
         
@@ -622,11 +1110,6 @@ class ModernSearchBar(ttk.Frame):
         
         # Configure search tag
         self.text_widget.tag_configure('search', background='yellow')
-        
-        # Go to first match
-        if self.matches:
-            self.current_match = 0
-            self.go_to_match(0)
     
     def find_next(self):
         """Go to next match"""
@@ -678,16 +1161,13 @@ class StatsBar(ttk.Frame):
     
     def update_stats(self, text):
         """Update statistics based on text content"""
-        # Count words
-        words = len(text.split())
+        self.show_stats(document_stats(text))
+
+    def show_stats(self, stats):
+        """Show counts computed by document_stats"""
+        words, chars, lines = stats
         self.word_count_var.set(f"Words: {words}")
-        
-        # Count characters
-        chars = len(text)
         self.char_count_var.set(f"Characters: {chars}")
-        
-        # Count lines
-        lines = len(text.splitlines())
         self.line_count_var.set(f"Lines: {lines}")
 
 class SplashScreen(tk.Toplevel):
@@ -754,28 +1234,9 @@ class SplashScreen(tk.Toplevel):
     
     def create_gradient(self):
         """Create gradient background"""
-        width = self.winfo_width()
-        height = self.winfo_height()
-        
-        # Create gradient colors
-        start_color = "#0078d7"
-        end_color = "#106ebe"
-        
-        for i in range(height):
-            pos = i / height
-            color = self.blend_colors(start_color, end_color, pos)
-            self.canvas.create_line(0, i, width, i, fill=color)
-    
-    def blend_colors(self, color1, color2, blend_factor):
-        """Blend two colors based on blend factor (0 to 1)"""
-        r1, g1, b1 = [int(color1[i:i+2], 16) for i in (1, 3, 5)]
-        r2, g2, b2 = [int(color2[i:i+2], 16) for i in (1, 3, 5)]
-        
-        r = int(r1 + (r2 - r1) * blend_factor)
-        g = int(g1 + (g2 - g1) * blend_factor)
-        b = int(b1 + (b2 - b1) * blend_factor)
-        
-        return f'#{r:02x}{g:02x}{b:02x}'
+        self.gradient = GradientBackground(self.canvas, ("#0078d7", "#106ebe"))
+        # The window is not mapped yet, so render at the requested size
+        self.gradient.render(int(self.canvas.cget('width')), int(self.canvas.cget('height')))
     
     def animate_progress(self):
         """Animate the progress bar"""
@@ -811,16 +1272,27 @@ class DocumentMiniMap(tk.Canvas):
         self.text_color = THEMES["Light"]["text_fg"]
         self.highlight_color = THEMES["Light"]["accent_hover"]
     
-    def set_text_widget(self, text_widget):
-        """Set the text widget to monitor"""
+    def set_text_widget(self, text_widget, on_change=None):
+        """Set the text widget to monitor
+
+        on_change() is called instead of redrawing straight away, so the
+        owner can coalesce redraws.
+        """
         self.text_widget = text_widget
-        self.text_widget.bind('<Configure>', self.update_minimap)
-        self.text_widget.bind('<Key>', self.update_minimap)
-        self.text_widget.bind('<MouseWheel>', self.update_minimap)
+        self.on_change = on_change
+        for sequence in ('<Configure>', '<Key>', '<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.text_widget.bind(sequence, self.request_update, add='+')
+    
+    def request_update(self, event=None):
+        """Redraw now, or let the owner schedule the redraw"""
+        if getattr(self, 'on_change', None):
+            self.on_change()
+        else:
+            self.update_minimap()
     
     def on_resize(self, event):
         """Handle resize events"""
-        self.update_minimap()
+        self.request_update()
     
     def update_minimap(self, event=None):
         """Update the mini-map display"""
@@ -848,12 +1320,14 @@ class DocumentMiniMap(tk.Canvas):
         width = self.winfo_width()
         height = self.winfo_height()
         
-        # Draw document representation
-        line_height = height / self.document_height
-        for i in range(self.document_height):
-            y = i * line_height
+        # Draw document representation, sampling one line per pixel row at most
+        rows = min(self.document_height, max(1, height))
+        row_height = height / rows
+        for row in range(rows):
+            line = row * self.document_height // rows + 1
             # Draw a line for each paragraph
-            if self.text_widget.get(f"{i+1}.0", f"{i+1}.end").strip():
+            if self.text_widget.get(f"{line}.0", f"{line}.end").strip():
+                y = row * row_height
                 self.create_line(0, y, width, y, fill=self.text_color, width=1)
         
         # Draw viewport indicator
@@ -893,19 +1367,129 @@ class DocumentMiniMap(tk.Canvas):
         # Scroll text widget
         self.text_widget.see(f"{line}.0")
 
+class PerformancePanel(tk.Toplevel):
+    """Rolling view of recent pipeline stage timings"""
+    def __init__(self, parent, profiler, max_rows=100):
+        super().__init__(parent)
+        self.title("Performance")
+        self.geometry("620x360")
+        self.profiler = profiler
+        self.max_rows = max_rows
+        self.refresh_pending = False
+        self.create_widgets()
+        self.refresh()
+        
+        self.profiler.add_listener(self.on_record)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+    def create_widgets(self):
+        # Summary of each stage
+        self.summary_var = tk.StringVar(value="")
+        ttk.Label(self, textvariable=self.summary_var, anchor=tk.W, justify=tk.LEFT).pack(fill=tk.X, padx=5, pady=5)
+        
+        # Recent records, newest first
+        columns = ("stage", "wall", "cpu", "size", "thread")
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=12)
+        for column, heading, width in zip(columns, ("Stage", "Wall (ms)", "CPU (ms)", "Size", "Thread"), (90, 90, 90, 100, 150)):
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, anchor=tk.W if column in ("stage", "thread") else tk.E)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        # Controls
+        buttons_frame = ttk.Frame(self)
+        buttons_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.enabled_var = tk.BooleanVar(value=self.profiler.enabled)
+        ttk.Checkbutton(buttons_frame, text="Record timings", variable=self.enabled_var,
+                        command=lambda: self.profiler.set_enabled(self.enabled_var.get())).pack(side=tk.LEFT, padx=2)
+        self.trace_button = ttk.Button(buttons_frame, command=self.toggle_trace)
+        self.trace_button.pack(side=tk.LEFT, padx=2)
+        ttk.Button(buttons_frame, text="Clear", command=self.clear).pack(side=tk.LEFT, padx=2)
+        ttk.Button(buttons_frame, text="Close", command=self.close).pack(side=tk.RIGHT, padx=2)
+        self.update_trace_button()
+
+    def on_record(self, entry):
+        """Coalesce refreshes; records may arrive from worker threads"""
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.after(0, self.refresh)
+
+    def refresh(self):
+        """Redraw the record list and the per-stage summary"""
+        self.refresh_pending = False
+        self.tree.delete(*self.tree.get_children())
+        records = list(self.profiler.records)[-self.max_rows:]
+        for entry in reversed(records):
+            size = "" if entry["size"] is None else f"{entry['size']:,}"
+            self.tree.insert("", tk.END, values=(
+                entry["stage"] + (" (failed)" if entry.get("failed") else ""),
+                f"{entry['wall_ms']:.1f}",
+                "" if entry["cpu_ms"] is None else f"{entry['cpu_ms']:.1f}",
+                size,
+                entry["thread"]
+            ))
+        
+        summary = self.profiler.summary()
+        lines = []
+        for stage in STAGES:
+            if stage in summary:
+                stats = summary[stage]
+                lines.append(f"{stage}: {stats['count']} runs, last {stats['last_ms']:.1f} ms, "
+                             f"mean {stats['mean_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+        self.summary_var.set("\n".join(lines) or "No timings recorded yet")
+
+    def toggle_trace(self):
+        """Start or stop writing the JSONL trace file"""
+        if self.profiler.trace_path:
+            self.profiler.close_trace()
+        else:
+            file_path = filedialog.asksaveasfilename(
+                parent=self,
+                title="Write Trace To",
+                defaultextension=".jsonl",
+                filetypes=(("JSON Lines", "*.jsonl"), ("All files", "*.*"))
+            )
+            if file_path:
+                self.profiler.open_trace(file_path)
+                self.enabled_var.set(True)
+        self.update_trace_button()
+
+    def update_trace_button(self):
+        self.trace_button.configure(text="Stop Trace" if self.profiler.trace_path else "Write Trace...")
+
+    def clear(self):
+        self.profiler.clear()
+        self.refresh()
+
+    def close(self):
+        self.profiler.remove_listener(self.on_record)
+        self.destroy()
+
 class CodeHighlighter:
-    """Modern syntax highlighter for code blocks"""
-    def __init__(self, text_widget):
+    """Modern syntax highlighter for code blocks
+
+    All token kinds are matched by one combined scanner in a single pass,
+    and tags are added at line.column indices computed while scanning, so
+    Tk never has to count characters from the start of the range. After
+    attach() only the visible lines (plus a margin) are highlighted, and
+    edits re-highlight just the lines they touched. Once set_regions() has
+    been called only lines inside those code regions are highlighted.
+    """
+    # Earlier alternatives win, so keywords inside strings and comments stay uncoloured.
+    # No token spans a newline, and an unterminated string stops at the end of its line.
+    TOKEN_PATTERN = re.compile(
+        r'(?P<comments>#[^\n]*)'
+        r'|(?P<strings>"(?:[^"\\\n]|\\.)*"?|\'(?:[^\'\\\n]|\\.)*\'?)'
+        r'|(?P<decorators>@\w+)'
+        r'|(?P<keywords>\b(?:if|else|elif|for|while|def|class|import|from|return|try|except|finally|with|as|in|is|not|and|or|True|False|None)\b)'
+        r'|(?P<functions>\b\w+(?=\())'
+        r'|(?P<numbers>\b\d+\b)'
+        r'|(?P<operators>[+\-*/=<>!&|^~%])'
+    )
+
+    def __init__(self, text_widget, margin=50):
         self.text_widget = text_widget
-        self.patterns = {
-            'keywords': r'\b(if|else|elif|for|while|def|class|import|from|return|try|except|finally|with|as|in|is|not|and|or|True|False|None)\b',
-            'strings': r'"[^"\\]*(\\.[^"\\]*)*"|\'[^\'\\]*(\\.[^\'\\]*)*\'',
-            'comments': r'#.*$',
-            'numbers': r'\b\d+\b',
-            'functions': r'\b\w+(?=\()',
-            'operators': r'[+\-*/=<>!&|^~%]',
-            'decorators': r'@\w+'
-        }
+        self.margin = margin
         self.colors = {
             'keywords': '#FF6B6B',
             'strings': '#98C379',
@@ -915,25 +1499,147 @@ class CodeHighlighter:
             'operators': '#56B6C2',
             'decorators': '#E5C07B'
         }
+        self.highlighted = None
+        self.regions = None
+        self._region_ends = []
+        self._refresh_pending = False
+        self._yscrollcommand = None
         
         # Configure tags
         for name, color in self.colors.items():
             self.text_widget.tag_configure(name, foreground=color)
     
-    def highlight(self, start='1.0', end='end-1c'):
+    def highlight(self, start='1.0', end='end-1c', clear=True):
         """Apply syntax highlighting to the specified range"""
-        content = self.text_widget.get(start, end)
+        widget = self.text_widget
+        start = widget.index(start)
+        content = widget.get(start, end)
         
         # Remove existing tags
-        for tag in self.colors.keys():
+        if clear:
+            self.clear(start, end)
+        
+        # Apply highlighting, one tag_add call per token kind
+        line, column = map(int, start.split('.'))
+        line_start = -column  # offset in content of column 0 of the current line
+        position = 0
+        ranges = {}
+        for match in self.TOKEN_PATTERN.finditer(content):
+            match_start = match.start()
+            newlines = content.count('\n', position, match_start)
+            if newlines:
+                line += newlines
+                line_start = content.rfind('\n', position, match_start) + 1
+            position = match_start
+            column = match_start - line_start
+            ranges.setdefault(match.lastgroup, []).extend(
+                (f"{line}.{column}", f"{line}.{column + match.end() - match_start}")
+            )
+        for tag, indices in ranges.items():
+            widget.tag_add(tag, *indices)
+
+    def clear(self, start='1.0', end='end'):
+        """Remove highlighting from a range"""
+        for tag in self.colors:
             self.text_widget.tag_remove(tag, start, end)
-        
-        # Apply highlighting
-        for name, pattern in self.patterns.items():
-            for match in re.finditer(pattern, content, re.MULTILINE):
-                start_index = f"{start}+{match.start()}c"
-                end_index = f"{start}+{match.end()}c"
-                self.text_widget.tag_add(name, start_index, end_index)
+
+    def highlight_lines(self, first, last):
+        """Highlight whole lines first..last (1-based, inclusive)"""
+        if last < first:
+            return
+        if self.regions is None:
+            self.highlight(f"{first}.0", f"{last}.end")
+            return
+        # Only the parts of the range inside code regions
+        self.clear(f"{first}.0", f"{last}.end")
+        index = bisect_left(self._region_ends, first)
+        while index < len(self.regions) and self.regions[index][0] <= last:
+            region_first, region_last = self.regions[index]
+            self.highlight(f"{max(first, region_first)}.0", f"{min(last, region_last)}.end", clear=False)
+            index += 1
+
+    def set_regions(self, regions):
+        """Limit highlighting to sorted (first_line, last_line) code regions
+
+        None highlights everything again.
+        """
+        if regions == self.regions:
+            return
+        self.regions = regions
+        self._region_ends = [last for _, last in regions] if regions is not None else []
+        self.clear()
+        self.reset()
+
+    def visible_lines(self):
+        """Return the first and last line on screen, widened by the margin"""
+        widget = self.text_widget
+        first = int(widget.index("@0,0").split('.')[0])
+        last = int(widget.index(f"@0,{widget.winfo_height()}").split('.')[0])
+        line_count = int(widget.index("end-1c").split('.')[0])
+        return max(1, first - self.margin), min(line_count, last + self.margin)
+
+    def highlight_visible(self):
+        """Highlight the visible region, skipping lines that are already done"""
+        self._refresh_pending = False
+        first, last = self.visible_lines()
+        if self.highlighted:
+            done_first, done_last = self.highlighted
+            if done_first <= last and first <= done_last:
+                # Only highlight what scrolled into view
+                self.highlight_lines(first, done_first - 1)
+                self.highlight_lines(done_last + 1, last)
+                self.highlighted = (min(first, done_first), max(last, done_last))
+                return
+        self.highlight_lines(first, last)
+        self.highlighted = (first, last)
+
+    def attach(self, binding=None):
+        """Keep the visible region highlighted as the widget scrolls and changes
+
+        With a TextModelBinding edits are reported line by line; otherwise
+        the line with the insert cursor is re-highlighted after each key.
+        """
+        widget = self.text_widget
+        self._yscrollcommand = widget.cget("yscrollcommand")
+        widget.configure(yscrollcommand=self.on_scroll)
+        if binding is not None:
+            binding.add_edit_listener(self.on_edit)
+        else:
+            widget.bind("<KeyRelease>", lambda event: self.on_edit(*(self._insert_line(),) * 2, 0), add="+")
+        self.schedule_refresh()
+
+    def _insert_line(self):
+        return int(self.text_widget.index("insert").split('.')[0])
+
+    def on_scroll(self, first, last):
+        """Forward the scroll position to the scrollbar and highlight new lines"""
+        if self._yscrollcommand:
+            self.text_widget.tk.call(*self.text_widget.tk.splitlist(self._yscrollcommand), first, last)
+        self.schedule_refresh()
+
+    def on_edit(self, first, last, line_delta):
+        """Re-highlight lines first..last after an edit that added line_delta lines"""
+        if self.highlighted:
+            # Lines below the edit moved by line_delta
+            done_first, done_last = self.highlighted
+            if first < done_first:
+                done_first = max(first, done_first + line_delta)
+            if first <= done_last:
+                done_last = max(first, done_last + line_delta)
+            self.highlighted = (done_first, done_last)
+            if first <= done_last and last >= done_first:
+                self.highlight_lines(max(first, self.highlighted[0]), min(last, self.highlighted[1]))
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.text_widget.after_idle(self.highlight_visible)
+
+    def reset(self):
+        """Forget what has been highlighted, e.g. after the whole text is replaced"""
+        self.highlighted = None
+        self.schedule_refresh()
 
 class EbookFormatterApp:
     def __init__(self, root):
@@ -949,14 +1655,46 @@ class EbookFormatterApp:
         self.original_text = ""
         self.current_theme = "Light"
         self.auto_save_timer = None
-        self.last_save = None
-        self.operation_queue = Queue()
+        self.auto_saver = None
+        # Set once closing starts; the Tk events served while it waits may ask again
+        self.closing = False
+        self.document_path = None
+        self.project = None
+        self.project_path = None
+        self.pending_project = None
         self.processing = False
         self.debounce_timer = None
+        self.performance_panel = None
+        self.process_pool = None
+        self.format_task = None
+        self.format_cache = FormatCache()
+        self.preformat_task = None
+        self.preformat_platforms = ()
+        self.preformat_waiting = None
+        self.input_version = 0
+        self.code_blocks = []
+        self.code_scan_timer = None
+        self.stats_task = None
+        self.indented_code = tk.BooleanVar(value=False)
+        self.low_memory = tk.BooleanVar(value=bool(os.environ.get("EBOOK_FORMATTER_LOW_MEMORY")))
+        self.memory_window = None
+        
+        # Background work reports back through a single Tk wakeup event
+        self.thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        self.scheduler = TaskScheduler(self.root, self.thread_pool)
+        
+        # Views that follow the text redraw at most once per frame
+        self.refresh_loop = RefreshLoop(self.root)
+        
+        # Documents open in other tabs, unloaded to disk beyond the memory budget
+        self.workspace = Workspace(process_text)
         
         # Create UI elements first
         self.create_basic_ui()
         
+        # Flush auto-save before the window goes away
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # Start background initialization
         self.root.after(100, self.initialize_background)
     
@@ -974,6 +1712,9 @@ class EbookFormatterApp:
         # Create menu bar
         self.create_menu()
         
+        # Create document tabs
+        self.create_document_tabs()
+        
         # Create main container
         self.main_container = ttk.Frame(self.root)
         self.main_container.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
@@ -1011,9 +1752,19 @@ class EbookFormatterApp:
         # Create mini-map
         self.mini_map = DocumentMiniMap(self.left_panel)
         self.mini_map.pack(fill=tk.X, padx=5, pady=5)
+        self.mini_map.set_text_widget(self.input_text, on_change=lambda: self.refresh_loop.mark_dirty("minimap"))
+        
+        # Register everything that redraws after an edit, in render order
+        self.refresh_loop.register("preview", self.update_preview)
+        self.refresh_loop.register("search", self.search_bar.refresh)
+        self.refresh_loop.register("stats", self.update_stats)
+        self.refresh_loop.register("minimap", self.mini_map.update_minimap)
         
         # Apply theme
         self.apply_theme()
+        
+        # Apply the memory mode to the widgets and model just created
+        self.apply_memory_mode()
     
     def initialize_background(self):
         """Initialize heavy components in the background"""
@@ -1024,8 +1775,12 @@ class EbookFormatterApp:
             # Bind keyboard shortcuts
             self.bind_shortcuts()
             
-            # Start background task processor
-            self.process_background_tasks()
+            # Start the process pool for CPU-bound text stages
+            try:
+                self.process_pool = create_process_pool()
+                self.scheduler.set_cpu_executor(self.process_pool)
+            except (OSError, NotImplementedError) as e:
+                print(f"Process pool unavailable, using threads: {e}")
             
             # Start auto-save timer in background
             self.start_auto_save()
@@ -1036,64 +1791,148 @@ class EbookFormatterApp:
             self.update_status(f"Error during initialization: {str(e)}", "error")
             messagebox.showerror("Error", f"Failed to initialize application: {str(e)}")
 
-    def process_background_tasks(self):
-        """Process background tasks from the queue"""
-        try:
-            while not self.operation_queue.empty():
-                task = self.operation_queue.get_nowait()
-                if task:
-                    func, args, callback = task
-                    future = thread_pool.submit(func, *args)
-                    if callback:
-                        self.root.after(100, lambda: self.check_future(future, callback))
-        except Exception as e:
-            print(f"Error processing background tasks: {e}")
-        
-        # Schedule next check
-        self.root.after(100, self.process_background_tasks)
+    def run_in_background(self, func, *args, callback=None, error_callback=None, priority=PRIORITY_NORMAL, name=None):
+        """Run a function on the worker pool; callbacks run on the UI thread"""
+        return self.scheduler.submit(
+            func, *args,
+            callback=callback,
+            error_callback=error_callback,
+            priority=priority,
+            name=name
+        )
 
-    def check_future(self, future, callback):
-        """Check if a future is done and call the callback"""
-        if future.done():
-            try:
-                result = future.result()
-                callback(result)
-            except Exception as e:
-                print(f"Error in background task: {e}")
-        else:
-            self.root.after(100, lambda: self.check_future(future, callback))
+    def snapshot(self):
+        """Return an immutable snapshot of the document text and chapters"""
+        return self.document.snapshot(self.chapters)
+
+    def run_on_snapshot(self, func, *args, callback=None, error_callback=None, priority=PRIORITY_NORMAL,
+                        name=None, discard_stale=True):
+        """Run func(snapshot, *args) in the background against the current document
 
-    def run_in_background(self, func, *args, callback=None):
-        """Run a function in the background thread pool"""
-        self.operation_queue.put((func, args, callback))
+        With discard_stale the result is dropped if the document has been
+        edited since the snapshot was taken.
+        """
+        snapshot = self.snapshot()
+        
+        def deliver(result):
+            if discard_stale and snapshot.version != self.document.version:
+                return
+            if callback:
+                callback(result)
+        
+        return self.run_in_background(
+            func, snapshot, *args,
+            callback=deliver,
+            error_callback=error_callback,
+            priority=priority,
+            name=name
+        )
 
     def start_auto_save(self):
-        """Start auto-save timer in background"""
-        def auto_save_task():
-            if self.original_text:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"autosave_{timestamp}.txt"
+        """Offer crash recovery, then journal edits periodically"""
+        self.recover_auto_save()
+        if not self.auto_saver.journal:
+            self.start_journal()
+        prune_sessions()
+        self.auto_save_timer = self.root.after(AUTO_SAVE_INTERVAL_MS, self.auto_save)
+
+    def start_journal(self):
+        """Journal the current document under its own auto-save directory"""
+        self.auto_saver.start(EditJournal(document_id(self.document_path), self.document_path))
+        # A new journal means a new file, so the tab follows its name
+        self.update_document_tab()
+
+    def auto_save(self):
+        """Hand the edits made since the last auto-save to the journal"""
+        if self.closing:
+            return
+        try:
+            self.auto_saver.flush()
+        except Exception as e:
+            self.update_status(f"Auto-save failed: {str(e)}", "error")
+        self.auto_save_timer = self.root.after(AUTO_SAVE_INTERVAL_MS, self.auto_save)
+
+    def recover_auto_save(self):
+        """Offer to restore every session that did not shut down cleanly
+
+        The newest one accepted goes into the editor, older ones open in
+        tabs of their own.
+        """
+        sessions = find_recoverable_sessions()
+        recovered = 0
+        for index, (doc_id, session) in enumerate(sessions):
+            source = session.get("source")
+            journal = EditJournal(doc_id, source)
+            name = os.path.basename(source) if source else "an untitled document"
+            when = datetime.fromtimestamp(session.get("updated", 0)).strftime("%Y-%m-%d %H:%M")
+            count = f" ({index + 1} of {len(sessions)})" if len(sessions) > 1 else ""
+            if not messagebox.askyesno(
+                "Recover Document",
+                f"Ebook Formatter Pro did not shut down cleanly{count}.\n\n"
+                f"Recover unsaved changes to {name} from {when}?"
+            ):
+                journal.write_session(clean=True)
+                continue
+            
+            try:
+                text = journal.recover()
+            except Exception as e:
+                self.update_status(f"Recovery failed: {str(e)}", "error")
+                messagebox.showerror("Error", f"Failed to recover document: {str(e)}")
+                continue
+            if recovered:
+                document = self.workspace.add(WorkspaceDocument(os.path.basename(source) if source else "Untitled", text, source))
+                document.original_text = text
+                document.journal = journal
+                self.add_document_tab(document)
+            else:
+                self.set_input_text(text)
+                self.set_original_text(text)
+                self.document_path = source
+                self.auto_saver.start(journal)
+                self.update_document_tab()
+            recovered += 1
+            self.update_status(f"Recovered {name} from auto-save", "success")
+        if recovered > 1:
+            self.enforce_memory_budget()
+
+    def on_close(self):
+        """Flush the journal, mark the session clean and exit"""
+        if self.closing:
+            return
+        self.closing = True
+        # Tk events are still served below; nothing may start new work
+        for timer in (self.auto_save_timer, self.code_scan_timer):
+            if timer:
+                self.root.after_cancel(timer)
+        if self.auto_saver:
+            # Documents in other tabs were not lost either
+            for document in self.workspace.documents:
+                if document is not self.workspace.active and document.journal:
+                    self.auto_saver.close_journal(document.journal)
+            done = self.auto_saver.close()
+            # Keep serving Tk while the journal finishes; worker Tk calls are marshalled here
+            while True:
                 try:
-                    with open(filename, "w", encoding="utf-8") as f:
-                        f.write(self.original_text)
-                    self.last_save = filename
-                    self.root.after(0, lambda: self.update_status(f"Auto-saved to {filename}"))
+                    done.result(timeout=0.05)
+                    break
+                except concurrent.futures.TimeoutError:
+                    self.root.update()
                 except Exception as e:
-                    self.root.after(0, lambda: self.update_status(f"Auto-save failed: {str(e)}"))
-        
-        # Schedule next auto-save
-        self.auto_save_timer = threading.Timer(300, self.start_auto_save)
-        self.auto_save_timer.daemon = True
-        self.auto_save_timer.start()
-        
-        # Run auto-save in background
-        self.run_in_background(auto_save_task)
+                    print(f"Error finishing auto-save: {e}")
+                    break
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+            self.process_pool = None
+        self.workspace.close()
+        self.root.destroy()
 
     def __del__(self):
         """Cleanup when the application is closed"""
-        if self.auto_save_timer:
-            self.auto_save_timer.cancel()
-        thread_pool.shutdown(wait=False)
+        if getattr(self, "thread_pool", None):
+            self.thread_pool.shutdown(wait=False)
+        if getattr(self, "process_pool", None):
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
 
     def create_toolbar(self):
         """Create the modern toolbar"""
@@ -1121,8 +1960,12 @@ class EbookFormatterApp:
         if messagebox.askyesno("New Document", "Do you want to save the current document?"):
             self.export_chapters_text()
         
-        self.input_text.delete("1.0", tk.END)
-        self.original_text = ""
+        self.set_input_text("")
+        self.set_original_text("")
+        self.document_path = None
+        self.project = None
+        self.project_path = None
+        self.start_journal()
         self.chapters = []
         self.chapter_listbox.delete(0, tk.END)
         self.update_status("New document created")
@@ -1161,8 +2004,12 @@ class EbookFormatterApp:
     def bind_shortcuts(self):
         """Bind keyboard shortcuts"""
         self.root.bind('<Control-n>', lambda e: self.new_document())
+        self.root.bind('<Control-N>', lambda e: self.new_document_tab())
+        self.root.bind('<Control-w>', lambda e: self.close_document_tab())
         self.root.bind('<Control-o>', lambda e: self.import_text_file())
         self.root.bind('<Control-s>', lambda e: self.export_chapters_text())
+        self.root.bind('<Control-O>', lambda e: self.open_project_file())
+        self.root.bind('<Control-S>', lambda e: self.save_project_file())
         self.root.bind('<Control-p>', lambda e: self.import_pdf_file())
         self.root.bind('<Control-i>', lambda e: self.import_cover_image())
         self.root.bind('<Control-e>', lambda e: self.export_chapters_pdf_editable())
@@ -1173,68 +2020,214 @@ class EbookFormatterApp:
         self.root.bind('<Control-plus>', lambda e: self.zoom_in())
         self.root.bind('<Control-minus>', lambda e: self.zoom_out())
         self.root.bind('<Control-t>', lambda e: self.toggle_theme())
+        self.root.bind('<Control-P>', lambda e: self.show_performance_panel())
 
     def show_search_dialog(self):
         """Show the search and replace dialog"""
-        SearchDialog(self.root, self.input_text)
+        SearchDialog(self.root, self.input_text, self.document)
+
+    def show_performance_panel(self):
+        """Show the rolling performance panel, enabling profiling"""
+        if self.performance_panel and self.performance_panel.winfo_exists():
+            self.performance_panel.lift()
+            return
+        profiler.set_enabled(True)
+        self.performance_panel = PerformancePanel(self.root, profiler)
 
     def detect_chapters(self):
         """Detect chapters from input text and populate listbox."""
-        print("Detect chapters called")  # Debug output
         self.progress.start("Detecting chapters...")
         
-        input_text = self.input_text.get("1.0", tk.END).strip()
-        print(f"Input text length: {len(input_text)}")  # Debug output
+        # Chapters are views over the model's own text, not over a stripped copy
+        input_text = self.document.text()
         
-        if not input_text:
+        if not NON_SPACE_PATTERN.search(input_text):
             messagebox.showwarning("Warning", "Please enter some text to process.")
             self.progress.stop("Ready")
             return
 
         try:
             # Process chapters synchronously
-            print("Processing chapters...")  # Debug output
-            chapters = process_text(input_text)
-            print(f"Processed chapters: {len(chapters)}")  # Debug output
+            with profiler.stage("detect", len(input_text)):
+                chapters = process_text(input_text)
             
             if chapters:
                 self.chapters = chapters
                 self.chapter_listbox.delete(0, tk.END)
                 for chapter in self.chapters:
-                    self.chapter_listbox.insert(tk.END, chapter["title"].strip())
+                    self.chapter_listbox.insert(tk.END, chapter.title)
                 self.progress.stop(f"Found {len(self.chapters)} chapters")
                 self.update_status(f"Detected {len(self.chapters)} chapters", "success")
             else:
                 self.progress.stop("No chapters detected")
                 self.update_status("No chapters detected", "warning")
         except Exception as e:
-            print(f"Error in detect_chapters: {str(e)}")  # Debug output
             self.progress.stop("Error detecting chapters")
             self.update_status(f"Error detecting chapters: {str(e)}", "error")
             messagebox.showerror("Error", f"Failed to detect chapters: {str(e)}")
 
     def format_for_platform(self, platform):
         """Format text specifically for the selected platform."""
+        # Only the latest choice may be applied when a speculative job finishes
+        self.preformat_waiting = None
         self.progress.start(f"Formatting for {platform}...")
         
         if not self.original_text:
-            self.original_text = self.input_text.get("1.0", tk.END).strip()
+            self.set_original_text(self.document.text().strip(), exclude=platform)
         
         if not self.original_text:
             messagebox.showwarning("Warning", "Please enter some text to format.")
             self.progress.stop("Ready")
             return
 
+        # Only the latest request matters
+        if self.format_task:
+            self.format_task.cancel()
+        
+        # Switching back to a preset of the same text needs no formatting
+        started = time.perf_counter()
+        cache_key = self.format_cache.key(self.original_text, platform)
+        cached = self.format_cache.get(cache_key)
+        if cached:
+            formatted_text, chapters = cached
+            self.apply_formatted_text(platform, formatted_text, started, chapters)
+            return
+        
+        # A speculative job is already formatting this preset
+        if self.preformat_task and platform in self.preformat_platforms:
+            self.preformat_waiting = (platform, started)
+            return
+        
+        # Format paragraph batches in parallel on the process pool
+        preset = FORMATTING_PRESETS[platform]
+        batch_count = self.scheduler.cpu_workers * 4
+        if self.scheduler.cpu_in_processes:
+            # Workers read their ranges from shared memory instead of unpickling text
+            shared = SharedText(self.original_text)
+            batches = [(shared.name, start, end) for start, end in shared.paragraph_ranges(batch_count)]
+            func, cleanup = format_shared_range, shared.release
+        else:
+            batches = [(batch,) for batch in split_paragraph_batches(self.original_text, batch_count)]
+            func, cleanup = format_text_for_platform, None
+        self.format_task = self.scheduler.submit_batch(
+            func, batches, platform, preset,
+            callback=lambda parts: self.apply_formatted_text(platform, "\n\n".join(parts), started, cache_key=cache_key),
+            error_callback=self.on_format_error,
+            name="format",
+            job_type=JOB_CPU,
+            cleanup=cleanup
+        )
+
+    def set_original_text(self, text, exclude=None):
+        """Set the text presets are formatted from and pre-format them"""
+        if text is not self.original_text:
+            self.original_text = text
+            self.preformat_presets(exclude)
+
+    def set_input_text(self, text, patch=True):
+        """Replace the input text; edits after this count as user edits
+
+        Small changes are patched in place, unless patch is False because
+        text is known to be unrelated. Otherwise the model takes the new
+        text at once and the widget is filled in chunks; edits made
+        meanwhile land in both consistently since the loaded prefix is
+        identical. Low-memory mode never patches: the patched model would
+        build its own copy of a text the caller already holds.
+        """
+        if patch and not self.low_memory.get() and not self.input_loader.loading:
+            # Patch the changed paragraphs; the binding carries the edits into the model
+            if patch_widget(self.input_text, self.document.text(), text, self.input_loader.max_patch_chars) is not None:
+                self.input_version = self.document.version
+                self.input_text.edit_modified(False)
+                self.on_input_loaded()
+                return
+        
+        self.document.reset(text)
+        self.input_version = self.document.version
+        self.input_loader.load(text, on_done=self.on_input_loaded)
+
+    def on_input_loaded(self):
+        self.code_highlighter.reset()
+        self.text_changed()
+
+    def on_load_progress(self, fraction):
+        if fraction < 1:
+            self.progress.set_progress(fraction * 100, f"Loading text... {fraction:.0%}")
+        else:
+            self.progress.set_progress(100)
+
+    def preformat_presets(self, exclude=None):
+        """Format every other preset at idle priority so switching is instant"""
+        self.cancel_preformat()
+        if not self.original_text or self.low_memory.get():
+            return
+        platforms = [
+            platform for platform in FORMATTING_PRESETS
+            if platform not in (self.current_preset, exclude)
+            and self.format_cache.key(self.original_text, platform) not in self.format_cache
+        ]
+        if not platforms:
+            return
+        
+        keys = [self.format_cache.key(self.original_text, platform) for platform in platforms]
+        if self.scheduler.cpu_in_processes:
+            shared = SharedText(self.original_text)
+            items = [(shared.name, 0, shared.size, platform, FORMATTING_PRESETS[platform]) for platform in platforms]
+            func, cleanup = preformat_shared_range, shared.release
+        else:
+            items = [(self.original_text, platform, FORMATTING_PRESETS[platform]) for platform in platforms]
+            func, cleanup = preformat_text, None
+        self.preformat_platforms = platforms
+        self.preformat_task = self.scheduler.submit_batch(
+            func, items,
+            item_callback=lambda index, result: self.on_preformatted(platforms[index], keys[index], result),
+            callback=lambda results: self.finish_preformat(),
+            error_callback=self.on_preformat_error,
+            priority=PRIORITY_IDLE,
+            name="preformat",
+            job_type=JOB_CPU,
+            cleanup=cleanup
+        )
+
+    def on_preformatted(self, platform, cache_key, result):
+        """Store a speculatively formatted preset"""
+        formatted_text, chapters = result
+        self.format_cache.put(cache_key, formatted_text, chapters)
+        if self.preformat_waiting and self.preformat_waiting[0] == platform:
+            _, started = self.preformat_waiting
+            self.preformat_waiting = None
+            self.apply_formatted_text(platform, formatted_text, started, chapters)
+
+    def finish_preformat(self):
+        self.preformat_task = None
+        self.preformat_platforms = ()
+
+    def on_preformat_error(self, error):
+        print(f"Error pre-formatting presets: {error}")
+        self.cancel_preformat()
+
+    def cancel_preformat(self):
+        """Drop speculative formatting; a preset waiting on it is formatted directly"""
+        if self.preformat_task:
+            self.preformat_task.cancel()
+        self.finish_preformat()
+        waiting, self.preformat_waiting = self.preformat_waiting, None
+        if waiting:
+            self.format_for_platform(waiting[0])
+
+    def apply_formatted_text(self, platform, formatted_text, started, chapters=None, cache_key=None):
+        """Show formatted text and its chapters, detecting them unless given
+
+        With a cache_key the text and detected chapters are stored in the
+        format cache.
+        """
+        self.format_task = None
+        if profiler.enabled:
+            profiler.record("format", time.perf_counter() - started, None, len(self.original_text))
+        
         try:
-            # Get the preset for the platform
-            preset = FORMATTING_PRESETS[platform]
-            
-            # Format the text based on platform-specific rules
-            formatted_text = self.format_text_for_platform(self.original_text, platform, preset)
-            
             # Update the input text with formatted content
-            self.input_text.delete("1.0", tk.END)
-            self.input_text.insert("1.0", formatted_text)
+            self.set_input_text(formatted_text)
             
             # Update the current preset
             self.current_preset = platform
@@ -1250,63 +2243,35 @@ class EbookFormatterApp:
             
             # Process chapters in the main thread
             try:
-                print("Detecting chapters after formatting...")  # Debug output
-                chapters = process_text(formatted_text)
+                if chapters is None:
+                    with profiler.stage("detect", len(formatted_text)):
+                        chapters = process_text(formatted_text)
+                    if cache_key:
+                        self.format_cache.put(cache_key, formatted_text, chapters)
                 if chapters:
                     self.chapters = chapters
                     for chapter in self.chapters:
-                        self.chapter_listbox.insert(tk.END, chapter["title"].strip())
+                        self.chapter_listbox.insert(tk.END, chapter.title)
                     self.update_status(f"Detected {len(self.chapters)} chapters", "success")
                 else:
                     self.update_status("No chapters detected", "warning")
             except Exception as e:
-                print(f"Error detecting chapters: {str(e)}")  # Debug output
                 self.update_status(f"Error detecting chapters: {str(e)}", "error")
             
             # Update preview after chapter detection
-            self.update_preview()
+            self.refresh_loop.mark_dirty("preview")
             
             self.progress.stop("Formatting complete")
             self.update_status(f"Formatted for {platform}", "success")
         except Exception as e:
-            self.progress.stop("Error formatting text")
-            self.update_status(f"Error: {str(e)}", "error")
-            messagebox.showerror("Error", f"Failed to format text: {str(e)}")
+            self.on_format_error(e)
 
-    def format_text_for_platform(self, text, platform, preset):
-        """Format text according to platform-specific rules"""
-        try:
-            # Split text into paragraphs
-            paragraphs = text.split('\n\n')
-            formatted_paragraphs = []
-            
-            for paragraph in paragraphs:
-                # Clean up the paragraph
-                paragraph = clean_text(paragraph)
-                
-                # Apply platform-specific formatting
-                if platform in ["Kindle", "Google Books"]:
-                    # Add proper spacing for e-readers
-                    paragraph = paragraph.replace('. ', '.\n\n')
-                    paragraph = paragraph.replace('! ', '!\n\n')
-                    paragraph = paragraph.replace('? ', '?\n\n')
-                    # Ensure proper dialogue formatting
-                    paragraph = paragraph.replace('" "', '" "')
-                elif platform == "Print":
-                    # Add proper spacing for print
-                    paragraph = paragraph.replace('. ', '. ')
-                    paragraph = paragraph.replace('! ', '! ')
-                    paragraph = paragraph.replace('? ', '? ')
-                    # Ensure proper paragraph indentation
-                    paragraph = "    " + paragraph
-                
-                formatted_paragraphs.append(paragraph)
-            
-            # Join paragraphs with appropriate spacing
-            return '\n\n'.join(formatted_paragraphs)
-        except Exception as e:
-            print(f"Error in format_text_for_platform: {str(e)}")
-            return text  # Return original text if formatting fails
+    def on_format_error(self, error):
+        """Report a failed formatting job"""
+        self.format_task = None
+        self.progress.stop("Error formatting text")
+        self.update_status(f"Error: {str(error)}", "error")
+        messagebox.showerror("Error", f"Failed to format text: {str(error)}")
 
     def export_chapters_text(self):
         """Export detected chapters to a plain text file."""
@@ -1321,20 +2286,24 @@ class EbookFormatterApp:
         )
         if file_path:
             self.progress.start("Exporting chapters...")
-            try:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    for chapter in self.chapters:
-                        f.write(f"{chapter['title']}\n\n")
-                        f.write("\n".join(chapter['content']) + "\n\n")
-                        f.write("-" * 50 + "\n\n")
-                
-                self.progress.stop("Export complete")
-                self.update_status(f"Exported to {file_path}", "success")
-                messagebox.showinfo("Success", f"Chapters exported to {file_path}")
-            except Exception as e:
-                self.progress.stop("Export failed")
-                self.update_status(f"Error: {str(e)}", "error")
-                messagebox.showerror("Error", f"Failed to export text file: {str(e)}")
+            # The export reads a snapshot, so editing can continue meanwhile
+            self.run_on_snapshot(
+                lambda snapshot: write_chapters_text(snapshot.chapters, file_path),
+                callback=self.on_text_exported,
+                error_callback=self.on_text_export_failed,
+                name="export",
+                discard_stale=False
+            )
+
+    def on_text_exported(self, file_path):
+        self.progress.stop("Export complete")
+        self.update_status(f"Exported to {file_path}", "success")
+        messagebox.showinfo("Success", f"Chapters exported to {file_path}")
+
+    def on_text_export_failed(self, error):
+        self.progress.stop("Export failed")
+        self.update_status(f"Error: {str(error)}", "error")
+        messagebox.showerror("Error", f"Failed to export text file: {str(error)}")
 
     def export_chapters_pdf_editable(self):
         """Export detected chapters to a PDF with editable text, cover image, and basic TOC."""
@@ -1349,130 +2318,26 @@ class EbookFormatterApp:
         )
         if file_path:
             self.progress.start("Exporting PDF...")
-            try:
-                preset = FORMATTING_PRESETS[self.current_preset]
-                doc = SimpleDocTemplate(
-                    file_path,
-                    pagesize=preset['page_size'],
-                    leftMargin=preset['margins'][0],
-                    rightMargin=preset['margins'][1],
-                    topMargin=preset['margins'][2],
-                    bottomMargin=preset['margins'][3]
-                )
-                
-                # Create styles
-                styles = self.create_pdf_styles(preset)
-                
-                # Build document
-                story = self.build_pdf_story(styles)
-                
-                # Generate PDF
-                doc.build(story)
-                
-                self.progress.stop("PDF export complete")
-                self.update_status(f"Exported PDF to {file_path}", "success")
-                messagebox.showinfo("Success", f"Editable PDF exported to {file_path}")
-            except Exception as e:
-                self.progress.stop("PDF export failed")
-                self.update_status(f"Error: {str(e)}", "error")
-                messagebox.showerror("Error", f"Failed to export PDF: {str(e)}")
-
-    def create_pdf_styles(self, preset):
-        """Create PDF styles based on preset"""
-        styles = getSampleStyleSheet()
-        
-        # Custom styles
-        styles.add(ParagraphStyle(
-            name='CustomHeading',
-            fontName=preset['font_name'],
-            fontSize=preset['chapter_title_size'],
-            leading=preset['chapter_title_size'] * 1.2,
-            spaceAfter=preset['chapter_title_spacing'],
-            spaceBefore=preset['chapter_title_spacing']
-        ))
-        
-        styles.add(ParagraphStyle(
-            name='CustomBody',
-            fontName=preset['font_name'],
-            fontSize=preset['font_size'],
-            leading=preset['font_size'] * preset['line_spacing'],
-            spaceAfter=preset['paragraph_spacing'],
-            spaceBefore=0,
-            firstLineIndent=preset['first_line_indent'],
-            leftIndent=0,
-            rightIndent=0,
-            wordWrap='CJK'
-        ))
-        
-        styles.add(ParagraphStyle(
-            name='TOCHeading1',
-            fontName=preset['font_name'],
-            fontSize=preset['font_size'] + 2,
-            leading=preset['font_size'] * preset['line_spacing'],
-            spaceAfter=preset['paragraph_spacing'],
-            spaceBefore=0
-        ))
-        
-        return styles
-
-    def build_pdf_story(self, styles):
-        """Build the PDF story with all content"""
-        story = []
-        
-        # Cover image
-        if self.cover_image_path:
-            story.extend(self.add_cover_image(styles))
-        
-        # Table of Contents
-        story.extend(self.add_table_of_contents(styles))
-        
-        # Chapters
-        story.extend(self.add_chapters(styles))
-        
-        return story
-
-    def add_cover_image(self, styles):
-        """Add cover image to PDF"""
-        with PILImage.open(self.cover_image_path) as img:
-            img_width, img_height = img.size
-        
-        page_width, page_height = FORMATTING_PRESETS[self.current_preset]['page_size']
-        scale = min(page_width / img_width, page_height / img_height)
-        scaled_width = img_width * scale
-        scaled_height = img_height * scale
-        
-        return [
-            Image(self.cover_image_path, width=scaled_width, height=scaled_height),
-            PageBreak()
-        ]
+            preset = FORMATTING_PRESETS[self.current_preset]
+            cover_image_path = self.cover_image_path
+            indented_code = self.indented_code.get()
+            self.run_on_snapshot(
+                lambda snapshot: write_chapters_pdf(snapshot.chapters, file_path, preset, cover_image_path, indented_code),
+                callback=self.on_pdf_exported,
+                error_callback=self.on_pdf_export_failed,
+                name="export",
+                discard_stale=False
+            )
 
-    def add_table_of_contents(self, styles):
-        """Add table of contents to PDF"""
-        return [
-            Paragraph("Table of Contents", styles['CustomHeading']),
-            Spacer(1, 24),
-            *[Paragraph(chapter["title"], styles['TOCHeading1']) for chapter in self.chapters],
-            PageBreak()
-        ]
+    def on_pdf_exported(self, file_path):
+        self.progress.stop("PDF export complete")
+        self.update_status(f"Exported PDF to {file_path}", "success")
+        messagebox.showinfo("Success", f"Editable PDF exported to {file_path}")
 
-    def add_chapters(self, styles):
-        """Add chapters to PDF"""
-        story = []
-        for chapter in self.chapters:
-            story.append(Paragraph(chapter["title"], styles["CustomHeading"]))
-            story.append(Spacer(1, 12))
-            
-            for paragraph in chapter["content"]:
-                # Clean up paragraph text
-                paragraph = clean_text(paragraph)
-                # Ensure proper spacing around dialogue
-                paragraph = re.sub(r'"\s*"', '" "', paragraph)
-                # Add proper spacing after punctuation
-                paragraph = re.sub(r'([.!?])([A-Z])', r'\1 \2', paragraph)
-                story.append(Paragraph(paragraph, styles["CustomBody"]))
-            story.append(Spacer(1, 24))
-        
-        return story
+    def on_pdf_export_failed(self, error):
+        self.progress.stop("PDF export failed")
+        self.update_status(f"Error: {str(error)}", "error")
+        messagebox.showerror("Error", f"Failed to export PDF: {str(error)}")
 
     def setup_styles(self):
         """Configure ttk styles for the application"""
@@ -1518,14 +2383,20 @@ class EbookFormatterApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="New", command=self.new_document, accelerator="Ctrl+N")
+        file_menu.add_command(label="New Tab", command=self.new_document_tab, accelerator="Ctrl+Shift+N")
+        file_menu.add_command(label="Close Tab", command=self.close_document_tab, accelerator="Ctrl+W")
         file_menu.add_command(label="Open", command=self.import_text_file, accelerator="Ctrl+O")
         file_menu.add_command(label="Save", command=self.export_chapters_text, accelerator="Ctrl+S")
         file_menu.add_separator()
+        file_menu.add_command(label="Open Project", command=self.open_project_file, accelerator="Ctrl+Shift+O")
+        file_menu.add_command(label="Save Project", command=self.save_project_file, accelerator="Ctrl+Shift+S")
+        file_menu.add_command(label="Save Project As", command=lambda: self.save_project_file(save_as=True))
+        file_menu.add_separator()
         file_menu.add_command(label="Import PDF", command=self.import_pdf_file, accelerator="Ctrl+P")
         file_menu.add_command(label="Import Cover Image", command=self.import_cover_image, accelerator="Ctrl+I")
         file_menu.add_command(label="Export PDF", command=self.export_chapters_pdf_editable, accelerator="Ctrl+E")
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.on_close)
         
         # Edit menu
         edit_menu = tk.Menu(menubar, tearoff=0)
@@ -1545,6 +2416,8 @@ class EbookFormatterApp:
         format_menu.add_command(label="Format for Kindle", command=lambda: self.format_for_platform("Kindle"), accelerator="Ctrl+K")
         format_menu.add_command(label="Format for Google Books", command=lambda: self.format_for_platform("Google Books"), accelerator="Ctrl+G")
         format_menu.add_command(label="Format for Print", command=lambda: self.format_for_platform("Print"), accelerator="Ctrl+R")
+        format_menu.add_separator()
+        format_menu.add_checkbutton(label="Detect Indented Code", variable=self.indented_code, command=self.scan_code_blocks)
         
         # View menu
         view_menu = tk.Menu(menubar, tearoff=0)
@@ -1553,6 +2426,10 @@ class EbookFormatterApp:
         view_menu.add_command(label="Zoom Out", command=self.zoom_out, accelerator="Ctrl+-")
         view_menu.add_separator()
         view_menu.add_command(label="Toggle Theme", command=self.toggle_theme, accelerator="Ctrl+T")
+        view_menu.add_separator()
+        view_menu.add_command(label="Performance Panel", command=self.show_performance_panel, accelerator="Ctrl+Shift+P")
+        view_menu.add_command(label="Memory Report", command=self.show_memory_report)
+        view_menu.add_checkbutton(label="Low Memory Mode", variable=self.low_memory, command=self.apply_memory_mode)
         
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
@@ -1568,11 +2445,14 @@ class EbookFormatterApp:
         if file_path:
             self.progress.start("Importing text file...")
             try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                self.input_text.delete("1.0", tk.END)
-                self.input_text.insert("1.0", text)
-                self.original_text = text
+                with profiler.stage("import") as stage:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        text = f.read()
+                    stage.set_size(len(text))
+                self.set_input_text(text)
+                self.set_original_text(text)
+                self.document_path = file_path
+                self.start_journal()
                 
                 # Automatically detect chapters after import
                 self.detect_chapters()
@@ -1593,13 +2473,13 @@ class EbookFormatterApp:
         if file_path:
             self.progress.start("Importing PDF file...")
             try:
-                text = ""
-                with pdfplumber.open(file_path) as pdf:
-                    for page in pdf.pages:
-                        text += page.extract_text() + "\n"
-                self.input_text.delete("1.0", tk.END)
-                self.input_text.insert("1.0", text)
-                self.original_text = text
+                with profiler.stage("import") as stage:
+                    text = extract_pdf_text(file_path)
+                    stage.set_size(len(text))
+                self.set_input_text(text)
+                self.set_original_text(text)
+                self.document_path = file_path
+                self.start_journal()
                 self.progress.stop("Import complete")
                 self.update_status(f"Imported PDF from {file_path}", "success")
             except Exception as e:
@@ -1607,6 +2487,293 @@ class EbookFormatterApp:
                 self.update_status(f"Error: {str(e)}", "error")
                 messagebox.showerror("Error", f"Failed to import PDF file: {str(e)}")
 
+    def open_project_file(self):
+        """Open a project; chapters are listed at once and their text read on demand"""
+        file_path = filedialog.askopenfilename(
+            title="Open Project",
+            filetypes=(("Ebook projects", f"*{PROJECT_EXTENSION}"), ("All files", "*.*"))
+        )
+        if not file_path:
+            return
+        try:
+            project = load_project(file_path)
+        except Exception as e:
+            self.update_status(f"Error: {str(e)}", "error")
+            messagebox.showerror("Error", f"Failed to open project: {str(e)}")
+            return
+        
+        self.project_path = file_path
+        self.show_project(project, file_path)
+
+    def show_project(self, project, document_path, journal=None):
+        """List a project's chapters at once and load its text in the background
+
+        Once the text is in, editing is journaled to journal, or to a new
+        journal for document_path.
+        """
+        self.project = project
+        self.pending_project = project
+        self.chapters = [ProjectChapter(project, entry) for entry in project.chapters]
+        self.show_chapter_list()
+        if project.preset in FORMATTING_PRESETS:
+            self.show_preset(project.preset)
+        self.cover_image_path = project.cover_image_path
+        if project.stats:
+            self.stats_bar.show_stats(project.stats)
+        
+        # The full text only matters for editing; assemble it in the background
+        self.progress.start("Opening project...")
+        self.run_in_background(
+            lambda: (project.text(), project.source_text(), project.formatted()),
+            callback=lambda result: self.on_project_loaded(project, result, document_path, journal),
+            error_callback=self.on_project_open_failed,
+            name="import"
+        )
+
+    def on_project_loaded(self, project, result, document_path, journal=None):
+        """Show the project text and restore its cached formatting"""
+        if self.project is not project:
+            return
+        self.pending_project = None
+        text, source_text, formatted = result
+        source_text = source_text or text
+        for platform, formatted_text in formatted.items():
+            self.format_cache.put(self.format_cache.key(source_text, platform), formatted_text, None)
+        
+        self.set_input_text(text, patch=False)
+        self.set_original_text(source_text)
+        self.document_path = document_path
+        self.resume_journal(journal)
+        self.progress.stop("Project loaded")
+        self.update_status(f"Opened {os.path.basename(document_path or project.path)}", "success")
+
+    def on_project_open_failed(self, error):
+        self.project = None
+        self.pending_project = None
+        self.progress.stop("Open failed")
+        self.update_status(f"Error: {str(error)}", "error")
+        messagebox.showerror("Error", f"Failed to open project: {str(error)}")
+
+    def save_project_file(self, save_as=False):
+        """Save the document, its chapter index and cached formatting as a project"""
+        if self.pending_project:
+            # project_path already names the project being opened; the editor still holds the old text
+            self.update_status("Wait for the document to finish loading", "warning")
+            return
+        file_path = self.project_path
+        if save_as or not file_path:
+            file_path = filedialog.asksaveasfilename(
+                title="Save Project As",
+                defaultextension=PROJECT_EXTENSION,
+                filetypes=(("Ebook projects", f"*{PROJECT_EXTENSION}"), ("All files", "*.*"))
+            )
+        if not file_path:
+            return
+        
+        preset = self.current_preset
+        cover_image_path = self.cover_image_path
+        source_text = self.original_text
+        formatted = {}
+        if source_text:
+            for platform in FORMATTING_PRESETS:
+                cached = self.format_cache.get(self.format_cache.key(source_text, platform))
+                if cached:
+                    formatted[platform] = cached[0]
+        
+        self.progress.start("Saving project...")
+        self.run_on_snapshot(
+            lambda snapshot: save_project(
+                file_path, snapshot.text, process_text(snapshot.text), preset, cover_image_path,
+                source_text, formatted, document_stats(snapshot.text)
+            ),
+            callback=self.on_project_saved,
+            error_callback=self.on_project_save_failed,
+            name="export",
+            discard_stale=False
+        )
+
+    def on_project_saved(self, file_path):
+        self.project_path = file_path
+        self.progress.stop("Project saved")
+        self.update_status(f"Saved project to {file_path}", "success")
+
+    def on_project_save_failed(self, error):
+        self.progress.stop("Save failed")
+        self.update_status(f"Error: {str(error)}", "error")
+        messagebox.showerror("Error", f"Failed to save project: {str(error)}")
+
+    def show_preset(self, platform):
+        """Show platform as the current preset without reformatting"""
+        self.current_preset = platform
+        self.platform_var.set(platform)
+        self.title_bar.update_format_indicator(platform)
+
+    def show_chapter_list(self):
+        self.chapter_listbox.delete(0, tk.END)
+        for chapter in self.chapters:
+            self.chapter_listbox.insert(tk.END, chapter.title)
+
+    def resume_journal(self, journal):
+        """Continue journaling into a document's earlier journal, or start one"""
+        if not self.auto_saver:
+            return
+        if journal:
+            self.auto_saver.start(journal, close_previous=False)
+            self.update_document_tab()
+        else:
+            self.start_journal()
+
+    def create_document_tabs(self):
+        """Create the tab strip of open documents, starting with an empty one"""
+        self.document_tabs = ttk.Notebook(self.root)
+        self.document_tabs.pack(fill=tk.X, padx=10)
+        self.tab_documents = {}
+        document = self.workspace.add(WorkspaceDocument())
+        self.workspace.activate(document)
+        self.add_document_tab(document)
+        self.document_tabs.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+
+    def add_document_tab(self, document):
+        tab = ttk.Frame(self.document_tabs, height=1)
+        self.document_tabs.add(tab, text=document.name)
+        self.tab_documents[str(tab)] = document
+        return str(tab)
+
+    def tab_for(self, document):
+        for tab, tab_document in self.tab_documents.items():
+            if tab_document is document:
+                return tab
+        return None
+
+    def update_document_tab(self):
+        """Name the active tab after its project or source file"""
+        document = self.workspace.active
+        tab = self.tab_for(document)
+        if tab is None:
+            return
+        path = self.project_path or self.document_path
+        document.name = os.path.basename(path) if path else "Untitled"
+        self.document_tabs.tab(tab, text=document.name)
+
+    def new_document_tab(self):
+        """Open an empty document in a new tab"""
+        if self.pending_project:
+            self.update_status("Wait for the document to finish loading", "warning")
+            return
+        document = self.workspace.add(WorkspaceDocument())
+        self.document_tabs.select(self.add_document_tab(document))
+        # The tab change event arrives later and finds the switch done
+        self.on_tab_changed(None)
+
+    def close_document_tab(self):
+        """Close the active document, keeping at least one tab open"""
+        if self.pending_project:
+            self.update_status("Wait for the document to finish loading", "warning")
+            return
+        document = self.workspace.active
+        if len(self.workspace.documents) == 1:
+            self.add_document_tab(self.workspace.add(WorkspaceDocument()))
+        if self.auto_saver:
+            self.auto_saver.flush()
+            self.auto_saver.start(None)
+        
+        # Forgetting the selected tab selects a neighbour; switch to it
+        tab = self.tab_for(document)
+        self.workspace.remove(document)
+        del self.tab_documents[tab]
+        self.document_tabs.forget(tab)
+        self.on_tab_changed(None)
+
+    def on_tab_changed(self, event):
+        document = self.tab_documents.get(self.document_tabs.select())
+        if document is None or document is self.workspace.active:
+            return
+        if self.pending_project:
+            # Switching now would store a partly loaded text
+            self.document_tabs.select(self.tab_for(self.workspace.active))
+            self.update_status("Wait for the document to finish loading", "warning")
+            return
+        self.switch_document(document)
+
+    def switch_document(self, document):
+        """Put document in the editor, keeping the current one in the workspace"""
+        self.store_active_document()
+        self.workspace.activate(document)
+        self.show_document(document)
+        self.enforce_memory_budget()
+
+    def store_active_document(self):
+        """Move the editor's document state into its workspace entry"""
+        document = self.workspace.active
+        if document is None:
+            return
+        
+        # Results computed for this text must not land in the next one
+        if self.format_task:
+            self.format_task.cancel()
+            self.format_task = None
+        self.preformat_waiting = None
+        self.cancel_preformat()
+        
+        document.text = self.document.text()
+        document.original_text = self.original_text
+        document.chapters = list(self.chapters)
+        document.preset = self.current_preset
+        document.cover_image_path = self.cover_image_path
+        document.document_path = self.document_path
+        document.project_path = self.project_path
+        if self.auto_saver:
+            self.auto_saver.flush()
+            document.journal = self.auto_saver.journal
+
+    def show_document(self, document):
+        """Load a workspace document into the editor, from the store if evicted"""
+        self.document_path = document.document_path
+        self.project_path = document.project_path
+        self.cover_image_path = document.cover_image_path
+        self.project = None
+        if document.preset in FORMATTING_PRESETS:
+            self.show_preset(document.preset)
+        
+        if not document.loaded:
+            try:
+                project = self.workspace.restore(document)
+            except Exception as e:
+                self.set_input_text("", patch=False)
+                self.update_status(f"Error: {str(e)}", "error")
+                messagebox.showerror("Error", f"Failed to reload {document.name}: {str(e)}")
+                return
+            self.show_project(project, document.document_path, document.journal)
+            return
+        
+        self.chapters = document.chapters
+        self.show_chapter_list()
+        self.set_input_text(document.text, patch=False)
+        self.set_original_text(document.original_text)
+        self.resume_journal(document.journal)
+        # The editor holds the text now
+        document.release()
+
+    def enforce_memory_budget(self):
+        """Unload the least recently used inactive documents beyond the budget"""
+        for document in self.workspace.eviction_candidates(len(self.document)):
+            self.run_in_background(
+                self.workspace.evict_job(document),
+                callback=lambda path, document=document: self.on_evicted(document),
+                error_callback=lambda error, document=document: self.on_evict_failed(document, error),
+                priority=PRIORITY_IDLE,
+                name="evict"
+            )
+
+    def on_evicted(self, document):
+        # A document edited while it was being written out is written again
+        if not self.workspace.discard(document):
+            self.enforce_memory_budget()
+
+    def on_evict_failed(self, document, error):
+        self.workspace.evict_failed(document)
+        self.update_status(f"Could not unload {document.name}: {str(error)}", "error")
+
     def import_cover_image(self):
         """Import a cover image for the ebook"""
         file_path = filedialog.askopenfilename(
@@ -1646,6 +2813,22 @@ class EbookFormatterApp:
         )
         self.input_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
+        # Mirror every edit into the document model
+        self.document = PieceTable()
+        self.document_binding = TextModelBinding(self.input_text, self.document)
+        self.input_loader = TextLoader(
+            self.input_text,
+            on_progress=self.on_load_progress,
+            before_chunk=self.document_binding.suspend,
+            after_chunk=self.document_binding.resume,
+            keep_text=False  # the document model is the canonical copy
+        )
+        self.auto_saver = AutoSaver(
+            self.document,
+            on_saved=lambda message: self.scheduler.post(self.update_status, message),
+            on_error=lambda message: self.scheduler.post(self.update_status, message, "error")
+        )
+        
         # Create search bar
         self.search_bar = ModernSearchBar(input_frame)
         self.search_bar.pack(fill=tk.X, padx=5, pady=5)
@@ -1665,6 +2848,11 @@ class EbookFormatterApp:
         self.auto_preview = tk.BooleanVar(value=True)
         ttk.Checkbutton(button_frame, text="Auto-preview", variable=self.auto_preview).pack(side=tk.RIGHT, padx=2)
         
+        # Highlight code blocks only
+        self.code_highlighter = CodeHighlighter(self.input_text)
+        self.code_highlighter.set_regions([])
+        self.code_highlighter.attach(self.document_binding)
+        
         # Bind text change event
         self.input_text.bind('<<Modified>>', self.on_text_change)
         
@@ -1682,6 +2870,7 @@ class EbookFormatterApp:
             fg=THEMES[self.current_theme]["text_fg"]
         )
         self.preview_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.preview_loader = TextLoader(self.preview_text)
         
         # Create button frame
         button_frame = ttk.Frame(preview_frame)
@@ -1689,7 +2878,7 @@ class EbookFormatterApp:
         
         # Preview buttons
         ttk.Button(button_frame, text="Update Preview", command=self.update_preview).pack(side=tk.LEFT, padx=2)
-        ttk.Button(button_frame, text="Clear Preview", command=lambda: self.preview_text.delete("1.0", tk.END)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(button_frame, text="Clear Preview", command=lambda: self.preview_loader.load("")).pack(side=tk.LEFT, padx=2)
 
     def create_settings_panel(self):
         """Create the settings panel"""
@@ -1786,20 +2975,27 @@ class EbookFormatterApp:
         """Update the preview area with formatted text"""
         try:
             # Get current text
-            text = self.input_text.get("1.0", tk.END).strip()
-            if not text:
-                self.preview_text.delete("1.0", tk.END)
+            text = self.document.text()
+            if not NON_SPACE_PATTERN.search(text):
+                self.preview_loader.load("")
                 return
             
-            # Process chapters
-            chapters = process_text(text)
-            
-            # Update preview
-            self.preview_text.delete("1.0", tk.END)
-            for chapter in chapters:
-                self.preview_text.insert(tk.END, f"{chapter['title']}\n\n")
-                self.preview_text.insert(tk.END, "\n".join(chapter['content']) + "\n\n")
-                self.preview_text.insert(tk.END, "-" * 50 + "\n\n")
+            with profiler.stage("preview", len(text)):
+                # Process chapters
+                chapters = process_text(text)
+                
+                # Update preview
+                separator = "-" * 50
+                if self.low_memory.get():
+                    # Show the chapter being edited rather than a second copy of the book
+                    offset = self.document_binding.offset("insert")
+                    index = max(0, bisect_right([chapter.start for chapter in chapters], offset) - 1)
+                    shown = chapters[index:index + 1]
+                else:
+                    shown = chapters
+                self.preview_loader.update("".join(
+                    f"{chapter.title}\n\n{chapter.body()}\n\n{separator}\n\n" for chapter in shown
+                ))
             
             # Update status
             self.update_status(f"Preview updated with {len(chapters)} chapters")
@@ -1815,23 +3011,114 @@ class EbookFormatterApp:
         index = selection[0]
         if 0 <= index < len(self.chapters):
             chapter = self.chapters[index]
-            self.preview_text.delete("1.0", tk.END)
-            self.preview_text.insert("1.0", f"{chapter['title']}\n\n")
-            self.preview_text.insert(tk.END, "\n".join(chapter['content']))
-            self.update_status(f"Selected chapter: {chapter['title']}")
+            self.preview_loader.update(f"{chapter.title}\n\n{chapter.body()}")
+            self.update_status(f"Selected chapter: {chapter.title}")
 
     def on_text_change(self, event):
         """Handle text changes in input area"""
-        if self.auto_preview.get():
-            self.update_preview()
-        
-        # Update statistics
-        text = self.input_text.get("1.0", tk.END)
-        self.stats_bar.update_stats(text)
+        # Clearing the flag fires the event again; a load reports once when it is done
+        if self.input_loader.loading or not self.input_text.edit_modified():
+            return
+        self.text_changed()
         
         # Reset modified flag
         self.input_text.edit_modified(False)
 
+    def text_changed(self):
+        """Refresh everything that depends on the input text"""
+        if self.closing:
+            return
+        # Speculative formatting is stale once the user edits the text
+        if self.document.version != self.input_version:
+            self.input_version = self.document.version
+            self.cancel_preformat()
+        
+        # Redraw dependent views in the next frame
+        self.refresh_loop.mark_dirty("search", "stats", "minimap")
+        if self.auto_preview.get():
+            self.refresh_loop.mark_dirty("preview")
+        
+        # Find code blocks once typing pauses
+        if self.code_scan_timer:
+            self.root.after_cancel(self.code_scan_timer)
+        self.code_scan_timer = self.root.after(CODE_SCAN_DELAY_MS, self.scan_code_blocks)
+
+    def update_stats(self):
+        """Count words, characters and lines off the UI thread; only the newest count is shown"""
+        if self.stats_task:
+            self.stats_task.cancel()
+        self.stats_task = self.run_on_snapshot(
+            lambda snapshot: document_stats(snapshot.text),
+            callback=self.stats_bar.show_stats,
+            priority=PRIORITY_IDLE,
+            name="stats"
+        )
+
+    def apply_memory_mode(self):
+        """Switch between the normal and the low-memory configuration
+
+        Low-memory mode keeps the model's text as the one materialised
+        copy of the document, shared with the format cache rather than
+        patched into an equal copy, caches only the current preset, skips
+        speculative formatting and previews only the chapter being edited.
+        """
+        low_memory = self.low_memory.get()
+        if low_memory:
+            start_tracing()
+            self.cancel_preformat()
+        self.document.compact_threshold = 0 if low_memory else COMPACT_THRESHOLD
+        self.format_cache.resize(max_entries=1 if low_memory else FORMAT_CACHE_ENTRIES)
+        self.refresh_loop.mark_dirty("preview")
+        self.update_status("Low-memory mode on" if low_memory else "Low-memory mode off")
+
+    def memory_owners(self):
+        """Return (owner, strings) for everything that may hold manuscript text"""
+        return [
+            ("Document model", self.document.sources()),
+            ("Original text", [self.original_text]),
+            ("Chapters", list({id(chapter.source): chapter.source for chapter in self.chapters
+                               if not isinstance(chapter, ProjectChapter)}.values())),
+            ("Input loader", [self.input_loader.text]),
+            ("Preview loader", [self.preview_loader.text]),
+            ("Format cache", self.format_cache.texts()),
+            ("Workspace", [text for document in self.workspace.documents
+                           for text in (document.text, document.original_text)]),
+        ]
+
+    def memory_report(self):
+        """Return the memory report as text"""
+        preview_chars = self.preview_text.count("1.0", "end-1c", "chars")
+        widgets = [
+            ("Input text", len(self.document)),
+            ("Preview text", preview_chars[0] if preview_chars else 0),
+        ]
+        return format_report(measure_owners(self.memory_owners()), widgets)
+
+    def show_memory_report(self):
+        """Show which parts of the application hold copies of the text"""
+        start_tracing()
+        if self.memory_window and self.memory_window.winfo_exists():
+            self.memory_window.lift()
+        else:
+            self.memory_window = tk.Toplevel(self.root)
+            self.memory_window.title("Memory Report")
+            self.memory_window.geometry("640x420")
+            self.memory_report_text = scrolledtext.ScrolledText(self.memory_window, font=("Consolas", 9), wrap=tk.NONE)
+            self.memory_report_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            buttons_frame = ttk.Frame(self.memory_window)
+            buttons_frame.pack(fill=tk.X, padx=5, pady=5)
+            ttk.Button(buttons_frame, text="Refresh", command=self.show_memory_report).pack(side=tk.LEFT, padx=2)
+            ttk.Button(buttons_frame, text="Close", command=self.memory_window.destroy).pack(side=tk.RIGHT, padx=2)
+        self.memory_report_text.delete("1.0", tk.END)
+        self.memory_report_text.insert("1.0", self.memory_report())
+
+    def scan_code_blocks(self):
+        """Index the code blocks in the document and highlight only those"""
+        self.code_scan_timer = None
+        text = self.document.text()
+        self.code_blocks = find_code_blocks(text, indented=self.indented_code.get())
+        self.code_highlighter.set_regions(code_block_lines(text, self.code_blocks))
+
     def change_theme(self, new_theme):
         """Change the application theme"""
         if new_theme not in THEMES:
@@ -1900,5 +3187,6 @@ def main():
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     main()
         
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""Pre-rendered vertical gradients for canvas backgrounds
+
+Drawing a gradient as one canvas line per pixel row costs a canvas item
+and a colour blend per row on every redraw. GradientBackground instead
+renders the gradient once per height into a single PhotoImage as wide as
+the screen and shows it as one canvas image item, so widening or
+narrowing the canvas only reveals more or less of the same image.
+<Configure> bursts while a window is dragged are coalesced into one
+idle check, and the canvas never holds more than one gradient item.
+"""
+import tkinter as tk
+from functools import lru_cache
+
+# Pre-rendered images kept per background, keyed by size
+IMAGE_CACHE_SIZE = 4
+
+
+def parse_color(color):
+    """Return the (r, g, b) components of a #rrggbb colour"""
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+@lru_cache(maxsize=32)
+def color_ramp(stops, steps):
+    """Return `steps` #rrggbb colours blending evenly through the colour stops"""
+    rgb = [parse_color(color) for color in stops]
+    if len(rgb) == 1 or steps <= 0:
+        return ("#%02x%02x%02x" % rgb[0],) * max(0, steps)
+
+    segments = len(rgb) - 1
+    ramp = []
+    for i in range(steps):
+        pos = i / steps * segments
+        index = min(int(pos), segments - 1)
+        blend = pos - index
+        (r1, g1, b1), (r2, g2, b2) = rgb[index], rgb[index + 1]
+        ramp.append("#%02x%02x%02x" % (
+            int(r1 + (r2 - r1) * blend),
+            int(g1 + (g2 - g1) * blend),
+            int(b1 + (b2 - b1) * blend),
+        ))
+    return tuple(ramp)
+
+
+class GradientBackground:
+    """Keeps a canvas filled with a top-to-bottom gradient through one image item"""
+
+    def __init__(self, canvas, stops, cache_size=IMAGE_CACHE_SIZE):
+        self.canvas = canvas
+        self.stops = tuple(stops)
+        self.cache_size = cache_size
+        self._images = {}
+        self._item = None
+        # The displayed image must stay referenced even once evicted
+        self._shown = None
+        self._size = None
+        self._pending = None
+        canvas.bind('<Configure>', self.schedule, add='+')
+
+    def schedule(self, event=None):
+        """Redraw once the current burst of events has been handled"""
+        if self._pending is None:
+            self._pending = self.canvas.after_idle(self.render)
+
+    def render(self, width=None, height=None):
+        """Show the gradient for the canvas size, or the given size before mapping"""
+        self._pending = None
+        width = width or self.canvas.winfo_width()
+        height = height or self.canvas.winfo_height()
+        if width <= 1 or height <= 1 or (width, height) == self._size:
+            return
+        self._size = (width, height)
+
+        image = self._shown = self._image(width, height)
+        if self._item is None:
+            self._item = self.canvas.create_image(0, 0, anchor=tk.NW, image=image)
+            self.canvas.tag_lower(self._item)
+        else:
+            self.canvas.itemconfigure(self._item, image=image)
+
+    def _image(self, width, height):
+        # One image per height serves every width up to the screen's
+        for (image_width, image_height), image in self._images.items():
+            if image_height == height and image_width >= width:
+                return image
+
+        width = max(width, self.canvas.winfo_screenwidth())
+        column = tk.PhotoImage(master=self.canvas, width=1, height=height)
+        column.put(" ".join("{%s}" % color for color in color_ramp(self.stops, height)))
+        image = column.zoom(width, 1)
+
+        if len(self._images) >= self.cache_size:
+            del self._images[next(iter(self._images))]
+        self._images[(width, height)] = image
+        return image
@@ -0,0 +1,304 @@
+"""Persistent job queue for resumable batch conversion, stored in SQLite
+
+Every input is one row that moves through the states::
+
+    queued -> extracting -> formatting -> exporting -> done
+
+and from any working state back to queued for a retry, or to failed.
+
+A job also records the last stage it completed, so a retried or
+interrupted job starts again after that stage instead of from scratch;
+the stage results themselves live in files next to the database.
+
+Workers claim a job inside an IMMEDIATE transaction, so two workers never
+take the same row, and hold a lease on it that a heartbeat keeps
+renewing, but never past the time limit of the running stage. A job whose
+worker died or hung is claimable again once its lease runs out, or at
+once when the worker is known to be gone (same host, process no longer
+running); taking it over uses up an attempt, like a failed stage, so a
+job that crashes its worker every time ends up failed. Failed attempts
+are retried with exponential backoff until the job runs out of attempts.
+Every write a worker makes is conditional on it still holding the job,
+so a worker that lost its lease cannot overwrite its successor's work.
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+
+QUEUED = "queued"
+EXTRACTING = "extracting"
+FORMATTING = "formatting"
+EXPORTING = "exporting"
+DONE = "done"
+FAILED = "failed"
+# Working states in pipeline order
+STAGES = (EXTRACTING, FORMATTING, EXPORTING)
+STATES = (QUEUED,) + STAGES + (DONE, FAILED)
+
+# Seconds a claim stays valid without a heartbeat
+LEASE_SECONDS = 120
+# Attempts before a job is marked failed
+MAX_ATTEMPTS = 3
+# Delay before the first retry; doubles with every further attempt
+BACKOFF_SECONDS = 5.0
+# Longest a single stage may run before its lease stops being renewed
+STAGE_TIMEOUT_SECONDS = 30 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    stage_done TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    deadline REAL,
+    error TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, next_attempt);
+"""
+
+
+class LeaseLost(Exception):
+    """The job was taken over by another worker"""
+
+
+def worker_id():
+    """Identify the calling process as host:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def worker_alive(worker):
+    """Whether a worker is still running; workers on other hosts count as alive"""
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class Job:
+    """One row of the queue as claimed by a worker"""
+    __slots__ = ("id", "key", "source", "params", "state", "stage_done", "attempts", "error", "timings", "result")
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.key = row["key"]
+        self.source = row["source"]
+        self.params = json.loads(row["params"])
+        self.state = row["state"]
+        self.stage_done = row["stage_done"]
+        self.attempts = row["attempts"]
+        self.error = row["error"]
+        self.timings = json.loads(row["timings"])
+        self.result = json.loads(row["result"]) if row["result"] else None
+
+    def __repr__(self):
+        return f"Job({self.id}, {os.path.basename(self.source)!r}, {self.state})"
+
+    def pending_stages(self):
+        """Stages still to run, after the last one completed"""
+        if self.stage_done in STAGES:
+            return STAGES[STAGES.index(self.stage_done) + 1:]
+        return STAGES
+
+
+class JobQueue:
+    """SQLite-backed queue; open one per thread or process"""
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, backoff_seconds=BACKOFF_SECONDS,
+                 stage_timeout=STAGE_TIMEOUT_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.stage_timeout = stage_timeout
+        self.worker = worker_id()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "deadline" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN deadline REAL")
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, key, source, params):
+        """Queue an input unless a job with the same key exists; returns whether it was added"""
+        now = time.time()
+        cursor = self._conn.execute(
+            "INSERT OR IGNORE INTO jobs (key, source, params, created, updated) VALUES (?, ?, ?, ?, ?)",
+            (key, source, json.dumps(params), now, now)
+        )
+        return cursor.rowcount == 1
+
+    def claim(self):
+        """Take the next runnable job, or return None
+
+        Runnable are queued jobs whose backoff has passed and working jobs
+        whose worker is gone or whose lease ran out. Taking over a job
+        counts as an attempt; one out of attempts is marked failed instead.
+        """
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE (state = ? AND next_attempt <= ?) "
+                f"OR (state IN ({', '.join('?' * len(STAGES))})) ORDER BY next_attempt, id",
+                (QUEUED, now) + STAGES
+            ).fetchall()
+            for row in rows:
+                attempts, error = row["attempts"], row["error"]
+                if row["state"] != QUEUED:
+                    alive = worker_alive(row["worker"])
+                    if row["lease_until"] > now and alive:
+                        continue
+                    attempts += 1
+                    error = f"Worker {row['worker']} {'timed out' if alive else 'stopped'} while {row['state']}"
+                    if attempts >= self.max_attempts:
+                        self._conn.execute(
+                            "UPDATE jobs SET state = ?, attempts = ?, error = ?, worker = NULL, lease_until = NULL, "
+                            "deadline = NULL, updated = ? WHERE id = ?",
+                            (FAILED, attempts, error, now, row["id"])
+                        )
+                        continue
+                # Resume at the first stage not completed yet
+                pending = Job(row).pending_stages()
+                state = pending[0] if pending else EXPORTING
+                deadline = now + self.stage_timeout
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, worker = ?, lease_until = ?, deadline = ?, attempts = ?, error = ?, "
+                    "updated = ? WHERE id = ?",
+                    (state, self.worker, min(now + self.lease_seconds, deadline), deadline, attempts, error, now,
+                     row["id"])
+                )
+                self._conn.execute("COMMIT")
+                return self.get(row["id"])
+            self._conn.execute("COMMIT")
+            return None
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def get(self, job_id):
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(row) if row else None
+
+    def heartbeat(self, job):
+        """Extend the lease on a job this worker holds, up to its stage's time limit
+
+        Returns False once the job is no longer held or its stage ran out
+        of time; the worker should then stop working on it.
+        """
+        now = time.time()
+        return self._conn.execute(
+            "UPDATE jobs SET lease_until = MIN(?, deadline) WHERE id = ? AND worker = ? AND deadline > ?",
+            (now + self.lease_seconds, job.id, self.worker, now)
+        ).rowcount == 1
+
+    def start_stage(self, job, stage):
+        job.state = stage
+        now = time.time()
+        deadline = now + self.stage_timeout
+        self._update(job, state=stage, deadline=deadline, lease_until=min(now + self.lease_seconds, deadline))
+
+    def finish_stage(self, job, stage, seconds):
+        """Record a completed stage so a later attempt skips it"""
+        job.stage_done = stage
+        job.timings[stage] = round(seconds, 4)
+        self._update(job, stage_done=stage, timings=json.dumps(job.timings))
+
+    def complete(self, job, result):
+        job.state = DONE
+        self._update(job, state=DONE, result=json.dumps(result), error=None, worker=None, lease_until=None,
+                     deadline=None)
+
+    def fail(self, job, error):
+        """Schedule a retry with backoff, or mark the job failed after its last attempt"""
+        job.attempts += 1
+        job.error = error
+        if job.attempts >= self.max_attempts:
+            job.state = FAILED
+            self._update(job, state=FAILED, attempts=job.attempts, error=error, worker=None, lease_until=None,
+                         deadline=None)
+        else:
+            job.state = QUEUED
+            delay = self.backoff_seconds * 2 ** (job.attempts - 1)
+            self._update(job, state=QUEUED, attempts=job.attempts, error=error,
+                         next_attempt=time.time() + delay, worker=None, lease_until=None, deadline=None)
+
+    def release(self, job):
+        """Give a job back untouched, e.g. when a worker is stopped"""
+        job.state = QUEUED
+        self._update(job, state=QUEUED, worker=None, lease_until=None, deadline=None)
+
+    def retry_failed(self):
+        """Queue every failed job again with fresh attempts; returns how many"""
+        return self._conn.execute(
+            "UPDATE jobs SET state = ?, attempts = 0, next_attempt = 0, updated = ? WHERE state = ?",
+            (QUEUED, time.time(), FAILED)
+        ).rowcount
+
+    def counts(self):
+        """Return the number of jobs in each state"""
+        counts = dict.fromkeys(STATES, 0)
+        for state, count in self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+            counts[state] = count
+        return counts
+
+    def jobs(self, state=None):
+        if state:
+            rows = self._conn.execute("SELECT * FROM jobs WHERE state = ? ORDER BY id", (state,))
+        else:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY id")
+        return [Job(row) for row in rows]
+
+    def next_wakeup(self):
+        """Seconds until a queued job becomes runnable, 0 if one is, None if none is waiting"""
+        row = self._conn.execute(
+            "SELECT MIN(next_attempt) FROM jobs WHERE state = ?", (QUEUED,)
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def active(self):
+        """Number of jobs some worker is working on"""
+        return self._conn.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE state IN ({', '.join('?' * len(STAGES))})", STAGES
+        ).fetchone()[0]
+
+    def _update(self, job, **fields):
+        """Write fields of a job this worker holds; raises LeaseLost if it no longer does"""
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        cursor = self._conn.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND worker = ?", (*fields.values(), job.id, self.worker)
+        )
+        if cursor.rowcount != 1:
+            raise LeaseLost(f"{job!r} was taken over by another worker")
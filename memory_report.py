@@ -0,0 +1,104 @@
+"""Report which parts of the application hold copies of the manuscript
+
+tracemalloc shows how much Python memory is allocated and where, but
+not which object keeps a buffer alive. The report therefore combines the
+two: every owner lists the strings it keeps alive, each string is
+counted once by identity, and a string equal to one already counted but
+stored separately is reported as a copy. Text inside Tk widgets lives in
+Tcl's memory, outside tracemalloc, and is listed by character count.
+
+Set ``EBOOK_FORMATTER_TRACEMALLOC=1`` to trace from startup. Otherwise
+tracing starts with low-memory mode or the first report, and earlier
+allocations are not attributed to a source line.
+"""
+import os
+import sys
+import tracemalloc
+
+# Frames kept per traced allocation
+TRACE_FRAMES = 1
+# Allocation sites listed in the report
+TOP_SITES = 10
+# Shorter strings are not manuscript text and are left out
+MIN_REPORT_CHARS = 4096
+
+
+def start_tracing():
+    """Start tracemalloc unless it is already running"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+
+
+def measure_owners(owners):
+    """Measure the strings each owner keeps alive
+
+    owners is a list of (name, strings). Returns one row per owner with
+    the number of strings, the bytes it alone holds, the bytes it shares
+    with an earlier owner (the same object) and the bytes of those that
+    duplicate an earlier string (an equal but separate object).
+    """
+    counted = set()
+    by_content = {}
+    rows = []
+    for name, strings in owners:
+        row = {"owner": name, "strings": 0, "bytes": 0, "shared": 0, "copies": 0}
+        for text in strings:
+            if not isinstance(text, str) or len(text) < MIN_REPORT_CHARS:
+                continue
+            row["strings"] += 1
+            size = sys.getsizeof(text)
+            if id(text) in counted:
+                row["shared"] += size
+                continue
+            counted.add(id(text))
+            row["bytes"] += size
+            key = (len(text), hash(text))
+            earlier = by_content.get(key)
+            if earlier is not None and earlier == text:
+                row["copies"] += size
+            else:
+                by_content[key] = text
+        rows.append(row)
+    return rows
+
+
+def format_report(rows, widgets=()):
+    """Render owner rows, widget sizes and tracemalloc totals as text
+
+    widgets is a list of (name, characters) for text held by Tk.
+    """
+    lines = [f"{'Owner':<24}{'Strings':>8}{'Held (KB)':>12}{'Shared (KB)':>13}{'Copies (KB)':>13}"]
+    for row in rows:
+        lines.append(
+            f"{row['owner']:<24}{row['strings']:>8}{row['bytes'] / 1024:>12.0f}"
+            f"{row['shared'] / 1024:>13.0f}{row['copies'] / 1024:>13.0f}"
+        )
+    held = sum(row["bytes"] for row in rows)
+    copies = sum(row["copies"] for row in rows)
+    lines.append(f"{'Total':<24}{'':>8}{held / 1024:>12.0f}{'':>13}{copies / 1024:>13.0f}")
+
+    if widgets:
+        lines.append("")
+        lines.append("Held by Tk (outside tracemalloc):")
+        for name, characters in widgets:
+            lines.append(f"  {name:<22}{characters:>10} chars")
+
+    lines.append("")
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f"Traced Python memory: {current / 1048576:.1f} MB now, {peak / 1048576:.1f} MB peak")
+        lines.append("Largest allocation sites:")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        for stat in snapshot.statistics("lineno")[:TOP_SITES]:
+            frame = stat.traceback[0]
+            lines.append(f"  {stat.size / 1024:>10.0f} KB  {os.path.basename(frame.filename)}:{frame.lineno}")
+    else:
+        lines.append("tracemalloc is not running; enable low-memory mode or set EBOOK_FORMATTER_TRACEMALLOC=1")
+    return "\n".join(lines)
+
+
+if os.environ.get("EBOOK_FORMATTER_TRACEMALLOC"):
+    start_tracing()
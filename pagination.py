@@ -0,0 +1,103 @@
+"""Page numbers for the PDF table of contents, known before the book is built
+
+Every chapter starts on a new page, so the pages it fills depend only on
+its own content and the preset. A chapter is laid out once into a
+throwaway document to count them, and the count is cached under a digest
+of the chapter and the preset; after an edit only the changed chapters
+are laid out again. With every count known, the table of contents gets
+its page numbers before the single build of the book, instead of
+reportlab's multiBuild laying out the whole book two or more times.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from reportlab.platypus import Flowable
+
+# Page counts kept, one per chapter version and preset
+PAGE_CACHE_ENTRIES = 4096
+
+
+def content_key(*parts):
+    """Digest identifying a piece of content"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def preset_key(preset):
+    """Digest of everything in a preset that can change the layout"""
+    return content_key(json.dumps(preset, sort_keys=True, default=repr))
+
+
+class PageMarker(Flowable):
+    """Zero-size flowable that notes the page it is drawn on"""
+
+    def __init__(self):
+        super().__init__()
+        self.page = None
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.page = self.canv.getPageNumber()
+
+
+class Paginator:
+    """Counts and caches the pages of sections that start on a new page
+
+    create_document(file, preset) returns the document template the book
+    is built with, so sections are measured in the same frames.
+    """
+
+    def __init__(self, create_document, entries=PAGE_CACHE_ENTRIES):
+        self.create_document = create_document
+        self.entries = entries
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count_pages(self, flowables, preset):
+        """Lay flowables out from the top of a page and count the pages used
+
+        flowables should end with the page break that leads to the next
+        section; the count runs up to the page that section starts on.
+        """
+        marker = PageMarker()
+        doc = self.create_document(BytesIO(), preset)
+        # Lay out and draw only, as multiBuild does on its intermediate passes
+        doc._doSave = 0
+        doc.build([*flowables, marker])
+        return marker.page - 1
+
+    def pages(self, key, make_flowables, preset):
+        """Return the cached page count of a section, measuring it on a miss
+
+        make_flowables() builds the section for measuring; flowables that
+        have been laid out once are not reused for the book itself.
+        """
+        key = (key, preset_key(preset))
+        with self._lock:
+            pages = self._pages.get(key)
+            if pages is not None:
+                self._pages.move_to_end(key)
+                self.hits += 1
+                return pages
+            self.misses += 1
+        pages = self.count_pages(make_flowables(), preset)
+        with self._lock:
+            self._pages[key] = pages
+            while len(self._pages) > self.entries:
+                self._pages.popitem(last=False)
+        return pages
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.hits = self.misses = 0
@@ -0,0 +1,169 @@
+"""Native project files with lazy per-chapter loading
+
+A project is a zip archive, each member deflated on its own, so any one
+chapter can be read without decompressing the rest. The manifest holds
+everything needed to show the document straight away: the chapter
+index, preset, cover reference and statistics. Chapter text is only read
+when a chapter is viewed or exported, and the full text is assembled in
+the background.
+
+Layout of a project file::
+
+    manifest.json          format version, preset, cover, stats, chunk and chapter index
+    text/<digest>.txt      one chunk per chapter, in order they make up the document
+    source.txt             text the presets are formatted from, if not the document itself
+    formatted/<n>.txt      formatted output cached per preset
+
+Chunks are named after a digest of their contents, so a chapter opened
+from an earlier save of the same file either reads identical text or
+fails, never another chapter's text.
+"""
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+
+PROJECT_EXTENSION = ".efp"
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+SOURCE_NAME = "source.txt"
+# Decompressed chunks kept in memory per open project
+CHUNK_CACHE_SIZE = 16
+
+
+def text_digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def save_project(path, text, chapters, preset, cover_image_path=None, source_text=None, formatted=None, stats=None):
+    """Write a project file, replacing any existing one only once it is complete
+
+    chapters are (title, start, end) objects over text in document order;
+    each becomes one chunk running from the previous chapter's end.
+    formatted maps preset names to the formatted output of source_text.
+    """
+    bounds = [0] + [chapter.end for chapter in chapters[:-1]] + [len(text)]
+    manifest = {
+        "version": FORMAT_VERSION,
+        "preset": preset,
+        "cover_image": cover_image_path,
+        "stats": list(stats) if stats else None,
+        "chunks": [],
+        "chapters": [],
+        "source": None,
+        "formatted": {},
+    }
+
+    temp_path = path + ".tmp"
+    try:
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+            written = set()
+            for index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+                chunk = text[start:end]
+                name = f"text/{text_digest(chunk)}.txt"
+                if name not in written:
+                    archive.writestr(name, chunk)
+                    written.add(name)
+                manifest["chunks"].append({"name": name, "length": len(chunk)})
+                if index < len(chapters):
+                    chapter = chapters[index]
+                    if not start <= chapter.start <= chapter.end <= end:
+                        raise ValueError(f"Chapter {chapter.title!r} is out of order")
+                    manifest["chapters"].append({
+                        "title": chapter.title,
+                        "chunk": index,
+                        "start": chapter.start - start,
+                        "end": chapter.end - start,
+                    })
+
+            if source_text and source_text != text:
+                archive.writestr(SOURCE_NAME, source_text)
+                manifest["source"] = SOURCE_NAME
+            for index, (platform, formatted_text) in enumerate(sorted((formatted or {}).items())):
+                name = f"formatted/{index}.txt"
+                archive.writestr(name, formatted_text)
+                manifest["formatted"][platform] = name
+
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=1))
+    except BaseException:
+        # Leave no half-written file next to the project
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    os.replace(temp_path, path)
+    return path
+
+
+def load_project(path):
+    """Open a project file, reading only its manifest"""
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST_NAME).decode("utf-8"))
+    if manifest.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"{os.path.basename(path)} was saved by a newer version")
+    return Project(path, manifest)
+
+
+class Project:
+    """An opened project file; chunk text is read from disk on demand
+
+    Thread-safe, so background exports can read chapters while the UI
+    thread shows another one.
+    """
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.preset = manifest.get("preset")
+        self.cover_image_path = manifest.get("cover_image")
+        stats = manifest.get("stats")
+        self.stats = tuple(stats) if stats else None
+        self.chunks = manifest["chunks"]
+        self.chapters = manifest["chapters"]
+        self.source_name = manifest.get("source")
+        self.formatted_names = manifest.get("formatted", {})
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Project({self.path!r}, {len(self.chapters)} chapters)"
+
+    def chunk_text(self, index):
+        """Return the text of one chunk, cached while recently used"""
+        with self._lock:
+            text = self._cache.get(index)
+            if text is not None:
+                self._cache.move_to_end(index)
+                return text
+        text = self._read(self.chunks[index]["name"])
+        with self._lock:
+            self._cache[index] = text
+            while len(self._cache) > CHUNK_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return text
+
+    def text(self):
+        """Assemble the whole document text"""
+        with zipfile.ZipFile(self.path) as archive:
+            return "".join(self._read_member(archive, chunk["name"]) for chunk in self.chunks)
+
+    def source_text(self):
+        """Return the text presets are formatted from, or None if it is the document"""
+        return self._read(self.source_name) if self.source_name else None
+
+    def formatted(self):
+        """Return the cached formatted output per preset"""
+        with zipfile.ZipFile(self.path) as archive:
+            return {platform: self._read_member(archive, name) for platform, name in self.formatted_names.items()}
+
+    def _read(self, name):
+        with zipfile.ZipFile(self.path) as archive:
+            return self._read_member(archive, name)
+
+    def _read_member(self, archive, name):
+        try:
+            return archive.read(name).decode("utf-8")
+        except KeyError:
+            raise ValueError(f"{os.path.basename(self.path)} has changed since it was opened") from None
@@ -0,0 +1,96 @@
+"""Coalesce UI refreshes into at most one render pass per frame
+
+Components register a render callback once. Anything that makes a
+component stale marks it dirty instead of redrawing straight away; a
+burst of keystrokes, scroll events and model changes therefore costs one
+render per component per frame, done in a single idle callback.
+
+A frame stops rendering once its time budget is spent and leaves the
+remaining components dirty for the next frame. A render callback can
+also return True to say it has more to do (for work done in slices); it
+then stays dirty and continues next frame.
+"""
+import time
+
+from profiling import profiler
+
+# Target frame interval and the share of it spent rendering
+FRAME_SECONDS = 1 / 60
+FRAME_BUDGET_SECONDS = 0.010
+
+
+class RefreshLoop:
+    """Renders dirty components, in registration order, once per frame"""
+
+    def __init__(self, root, frame_seconds=FRAME_SECONDS, budget_seconds=FRAME_BUDGET_SECONDS):
+        self.root = root
+        self.frame_seconds = frame_seconds
+        self.budget_seconds = budget_seconds
+        self._components = {}
+        self._dirty = set()
+        self._scheduled = None
+        self._last_frame = 0.0
+
+    def register(self, name, render):
+        """Add a component; render() returns True if it still has work left"""
+        self._components[name] = render
+
+    def unregister(self, name):
+        self._components.pop(name, None)
+        self._dirty.discard(name)
+
+    def mark_dirty(self, *names):
+        """Render the named components in the next frame"""
+        self._dirty.update(name for name in names if name in self._components)
+        if self._dirty:
+            self._schedule()
+
+    def is_dirty(self, name):
+        return name in self._dirty
+
+    def flush(self):
+        """Render everything that is dirty now, ignoring the budget"""
+        self._cancel()
+        while self._dirty:
+            self._render(float("inf"))
+
+    def _schedule(self):
+        if self._scheduled:
+            return
+        delay = self._last_frame + self.frame_seconds - time.perf_counter()
+        if delay > 0:
+            self._scheduled = self.root.after(max(1, int(delay * 1000)), self._request_frame)
+        else:
+            self._scheduled = self.root.after_idle(self._frame)
+
+    def _request_frame(self):
+        self._scheduled = self.root.after_idle(self._frame)
+
+    def _cancel(self):
+        if self._scheduled:
+            self.root.after_cancel(self._scheduled)
+            self._scheduled = None
+
+    def _frame(self):
+        self._scheduled = None
+        self._last_frame = time.perf_counter()
+        self._render(self._last_frame + self.budget_seconds)
+        if self._dirty:
+            self._schedule()
+
+    def _render(self, deadline):
+        # Components dirtied while rendering wait for the next frame
+        pending = [name for name in self._components if name in self._dirty]
+        self._dirty.difference_update(pending)
+        for index, name in enumerate(pending):
+            if time.perf_counter() >= deadline:
+                self._dirty.update(pending[index:])
+                return
+            try:
+                with profiler.stage(f"render:{name}"):
+                    more = self._components[name]()
+            except Exception as e:
+                print(f"Error rendering {name}: {e}")
+                more = False
+            if more:
+                self._dirty.add(name)
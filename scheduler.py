@@ -0,0 +1,381 @@
+"""Event-driven background task scheduler for the Tk application
+
+Workers never poll and the event loop is never polled: when a task
+finishes, its result is queued and the worker fires a single virtual
+event into Tk (coalesced, so a burst of completions costs one wakeup).
+The handler then runs the callbacks on the UI thread.
+
+Tasks carry a priority, a cancellation token and their own timings.
+Pending tasks are held back in a priority heap and handed to the
+executor only when a worker is free, so idle-priority work never delays
+a user-initiated job.
+
+Each task declares a job type. I/O jobs run on the thread pool; CPU jobs
+(the regex-heavy text stages, which hold the GIL) run on a warm process
+pool sized to the machine's cores. CPU job functions and their arguments
+must be picklable module-level objects. Pool workers are never forked
+from the app, which runs Tk and threads; they start from a fork server or
+a fresh interpreter and import the job's module themselves.
+"""
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from profiling import profiler
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_IDLE = 20
+
+JOB_IO = "io"
+JOB_CPU = "cpu"
+
+WAKEUP_EVENT = "<<SchedulerWakeup>>"
+
+_cpu_clock = getattr(time, "thread_time", time.process_time)
+
+
+def cpu_worker_count():
+    """Number of process-pool workers: one per core"""
+    return max(1, os.cpu_count() or 1)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def pool_context():
+    """Start method for pool workers: a fork server where there is one, else spawn"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def create_process_pool(max_workers=None):
+    """Start a process pool and spawn its workers ahead of the first job"""
+    pool = ProcessPoolExecutor(max_workers=max_workers or cpu_worker_count(), mp_context=pool_context())
+    for _ in range(pool._max_workers):
+        pool.submit(_warm_up)
+    return pool
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task that noticed its token was cancelled"""
+
+
+class CancellationToken:
+    """Thread-safe flag a task can poll to stop early"""
+    __slots__ = ("_event",)
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TaskCancelled()
+
+
+class Task:
+    """Handle for a scheduled background task"""
+
+    def __init__(self, func, args, kwargs, callback, error_callback, priority, name, token, job_type=JOB_IO):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.error_callback = error_callback
+        self.priority = priority
+        self.job_type = job_type
+        self.name = name or getattr(func, "__name__", "task")
+        self.token = token or CancellationToken()
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.cpu_time = None
+        self.future = None
+
+    def cancel(self):
+        """Drop the task if it has not started; ask it to stop if it has"""
+        self.token.cancel()
+        if self.future is not None and self.job_type == JOB_CPU:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    @property
+    def queue_time(self):
+        """Seconds spent waiting for a worker"""
+        return None if self.started_at is None else self.started_at - self.submitted_at
+
+    @property
+    def run_time(self):
+        """Seconds spent running on the worker"""
+        return None if self.finished_at is None else self.finished_at - self.started_at
+
+
+class BatchTask:
+    """Handle for a group of tasks whose results are delivered together"""
+
+    def __init__(self, count, callback, error_callback, token, cleanup=None, item_callback=None):
+        self.results = [None] * count
+        self.remaining = count
+        self.callback = callback
+        self.item_callback = item_callback
+        self.error_callback = error_callback
+        self.token = token
+        self.cleanup = cleanup
+        self.failed = False
+        self.tasks = []
+
+    def cancel(self):
+        self.token.cancel()
+        for task in self.tasks:
+            task.cancel()
+        self._release()
+
+    def _release(self):
+        cleanup, self.cleanup = self.cleanup, None
+        if cleanup:
+            cleanup()
+
+    @property
+    def cancelled(self):
+        return self.token.cancelled
+
+    def _task_done(self, index, result):
+        self.results[index] = result
+        self.remaining -= 1
+        if self.item_callback and not self.failed:
+            self.item_callback(index, result)
+        if self.remaining == 0 and not self.failed:
+            self._release()
+            if self.callback:
+                self.callback(self.results)
+
+    def _task_failed(self, error):
+        if not self.failed:
+            self.failed = True
+            self.cancel()
+            if self.error_callback:
+                self.error_callback(error)
+            else:
+                print(f"Error in background batch: {error}")
+
+
+class _Tier:
+    """Executor for one job type plus its queue of waiting tasks"""
+
+    def __init__(self, executor, limit=None):
+        self.executor = executor
+        self.limit = limit or getattr(executor, "_max_workers", 4)
+        self.pending = []
+        self.running = 0
+
+
+class TaskScheduler:
+    """Runs tasks on the I/O or CPU tier and delivers results on the Tk thread"""
+
+    def __init__(self, root, executor, cpu_executor=None):
+        self.root = root
+        self._tiers = {JOB_IO: _Tier(executor)}
+        self._tiers[JOB_CPU] = _Tier(cpu_executor) if cpu_executor else self._tiers[JOB_IO]
+        self._completed = deque()
+        self._wakeup_pending = False
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self.root.bind(WAKEUP_EVENT, self._on_wakeup)
+
+    def set_cpu_executor(self, executor):
+        """Route CPU jobs to a process pool from now on"""
+        with self._lock:
+            self._tiers[JOB_CPU] = _Tier(executor)
+
+    @property
+    def cpu_workers(self):
+        return self._tiers[JOB_CPU].limit
+
+    @property
+    def cpu_in_processes(self):
+        """Whether CPU jobs run in other processes rather than on threads"""
+        return isinstance(self._tiers[JOB_CPU].executor, ProcessPoolExecutor)
+
+    def submit(self, func, *args, callback=None, error_callback=None, priority=PRIORITY_NORMAL,
+               name=None, token=None, pass_token=False, job_type=JOB_IO, **kwargs):
+        """Schedule func(*args, **kwargs) and return its Task
+
+        callback(result) or error_callback(exception) runs on the UI thread
+        unless the task was cancelled. With pass_token=True an I/O task also
+        receives its CancellationToken as the ``token`` keyword argument.
+        """
+        task = Task(func, args, kwargs, callback, error_callback, priority, name, token, job_type)
+        if pass_token:
+            task.kwargs["token"] = task.token
+        with self._lock:
+            tier = self._tiers[job_type]
+            heapq.heappush(tier.pending, (priority, next(self._sequence), task))
+            stranded = bool(self._completed) and not self._wakeup_pending
+            if stranded and threading.current_thread() is threading.main_thread():
+                self._wakeup_pending = True
+            else:
+                stranded = False
+        if stranded:
+            self.root.after_idle(self._on_wakeup)
+        self._dispatch(tier)
+        return task
+
+    def submit_batch(self, func, items, *args, callback=None, error_callback=None,
+                     priority=PRIORITY_NORMAL, name=None, job_type=JOB_CPU, cleanup=None,
+                     item_callback=None):
+        """Run func(*item, *args) for every item tuple and deliver the ordered results
+
+        callback(results) runs once on the UI thread after every task has
+        finished; the first failure cancels the rest and goes to
+        error_callback instead. cleanup() runs once when the batch
+        completes, fails or is cancelled, to release shared inputs.
+        item_callback(index, result) runs as each task finishes.
+        """
+        batch = BatchTask(len(items), callback, error_callback, CancellationToken(), cleanup, item_callback)
+        if not items:
+            batch._release()
+            if callback:
+                self.post(callback, [])
+            return batch
+        for index, item in enumerate(items):
+            batch.tasks.append(self.submit(
+                func, *item, *args,
+                callback=lambda result, index=index: batch._task_done(index, result),
+                error_callback=batch._task_failed,
+                priority=priority,
+                name=name,
+                token=batch.token,
+                job_type=job_type
+            ))
+        return batch
+
+    def post(self, func, *args):
+        """Run func(*args) on the UI thread; safe to call from any thread"""
+        self._deliver(("call", func, args))
+
+    def pending_count(self):
+        with self._lock:
+            return sum(len(tier.pending) for tier in set(self._tiers.values()))
+
+    def _dispatch(self, tier):
+        """Start pending tasks, best priority first, while workers are free"""
+        while True:
+            with self._lock:
+                if tier.running >= tier.limit or not tier.pending:
+                    return
+                _, _, task = heapq.heappop(tier.pending)
+                if task.cancelled:
+                    continue
+                tier.running += 1
+            try:
+                if isinstance(tier.executor, ProcessPoolExecutor):
+                    task.started_at = time.perf_counter()
+                    task.future = tier.executor.submit(task.func, *task.args, **task.kwargs)
+                    task.future.add_done_callback(lambda future, task=task, tier=tier: self._finish_process_task(task, tier, future))
+                else:
+                    task.future = tier.executor.submit(self._run, task, tier)
+            except RuntimeError:
+                # Executor shut down while the application closes
+                with self._lock:
+                    tier.running -= 1
+                return
+
+    def _run(self, task, tier):
+        """Execute a task on a worker thread"""
+        task.started_at = time.perf_counter()
+        cpu_start = _cpu_clock()
+        result = error = None
+        try:
+            task.token.raise_if_cancelled()
+            result = task.func(*task.args, **task.kwargs)
+        except BaseException as e:
+            error = e
+        task.cpu_time = _cpu_clock() - cpu_start
+        self._finish(task, tier, result, error)
+
+    def _finish_process_task(self, task, tier, future):
+        """Collect a process-pool result (runs on the pool's manager thread)"""
+        result = error = None
+        if future.cancelled():
+            error = TaskCancelled()
+        else:
+            error = future.exception()
+            if error is None:
+                result = future.result()
+        self._finish(task, tier, result, error)
+
+    def _finish(self, task, tier, result, error):
+        task.finished_at = time.perf_counter()
+        if profiler.enabled:
+            profiler.record(f"task:{task.name}", task.run_time, task.cpu_time, failed=error is not None)
+        with self._lock:
+            tier.running -= 1
+        self._deliver(("task", task, result, error))
+        self._dispatch(tier)
+
+    def _deliver(self, item):
+        """Queue an item for the UI thread and wake Tk once per batch"""
+        with self._lock:
+            self._completed.append(item)
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        if threading.current_thread() is threading.main_thread():
+            self.root.after_idle(self._on_wakeup)
+            return
+        try:
+            self.root.event_generate(WAKEUP_EVENT, when="tail")
+        except (RuntimeError, tk.TclError):
+            # Tk is not running (yet); the next submit from the UI thread drains the queue
+            with self._lock:
+                self._wakeup_pending = False
+
+    def _on_wakeup(self, event=None):
+        """Run queued callbacks on the UI thread"""
+        with self._lock:
+            items = list(self._completed)
+            self._completed.clear()
+            self._wakeup_pending = False
+
+        for item in items:
+            if item[0] == "call":
+                _, func, args = item
+                self._invoke(func, *args)
+                continue
+            _, task, result, error = item
+            if task.cancelled or isinstance(error, TaskCancelled):
+                continue
+            if error is None:
+                if task.callback:
+                    self._invoke(task.callback, result)
+            elif task.error_callback:
+                self._invoke(task.error_callback, error)
+            else:
+                print(f"Error in background task {task.name}: {error}")
+
+    def _invoke(self, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"Error in background callback: {e}")
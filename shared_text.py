@@ -0,0 +1,93 @@
+"""Hand manuscript text to worker processes through shared memory
+
+The document is encoded to UTF-8 once and copied into a named
+``multiprocessing.shared_memory`` block. Jobs then carry only the block
+name and a ``(start, end)`` byte range; each worker maps the block,
+decodes its own slice and unmaps it again, so the text is never pickled
+and never duplicated per worker.
+
+Paragraph breaks are plain ASCII newlines, which never occur inside a
+multi-byte UTF-8 sequence, so ranges split at breaks always decode.
+"""
+import re
+from multiprocessing import shared_memory
+
+PARAGRAPH_BREAK_BYTES_PATTERN = re.compile(rb'\n{2,}')
+
+
+class SharedText:
+    """Owner of a shared-memory copy of a document's text
+
+    Only the creating process unlinks the block; call release() once
+    every job reading from it has finished or been cancelled. Workers
+    that are still running keep their own mapping until they unmap it.
+    """
+
+    def __init__(self, text):
+        data = text.encode("utf-8")
+        self.size = len(data)
+        # Zero-length blocks are not allowed
+        self._memory = shared_memory.SharedMemory(create=True, size=max(1, self.size))
+        self._memory.buf[:self.size] = data
+        self.name = self._memory.name
+
+    def paragraph_ranges(self, batches):
+        """Split the text at paragraph breaks into up to `batches` byte ranges
+
+        Ranges follow the same rule as split_paragraph_batches, so
+        formatting each range and joining with a blank line matches a
+        single pass over the whole text.
+        """
+        if self._memory is None:
+            raise ValueError("Shared text has been released")
+        target = max(1, self.size // max(1, batches))
+        data = self._memory.buf[:self.size]
+        ranges = []
+        start = 0
+        try:
+            for match in PARAGRAPH_BREAK_BYTES_PATTERN.finditer(data):
+                if match.start() - start < target:
+                    continue
+                ranges.append((start, match.start()))
+                start = match.start() + 2
+        finally:
+            data.release()
+        ranges.append((start, self.size))
+        return ranges
+
+    def release(self):
+        """Unmap and unlink the block; safe to call more than once"""
+        if self._memory is None:
+            return
+        memory, self._memory = self._memory, None
+        memory.close()
+        try:
+            memory.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def read_range(name, start, end):
+    """Decode bytes [start, end) of a shared text block (runs in a worker)"""
+    memory = _attach(name)
+    try:
+        return str(memory.buf[start:end], "utf-8")
+    finally:
+        memory.close()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching always registers the block with the
+        # resource tracker. Pool workers share their parent's tracker, where
+        # registration is idempotent, so the owner's unlink still clears it.
+        return shared_memory.SharedMemory(name=name)
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ebook_formatter import FORMATTING_PRESETS, find_code_blocks, format_text_for_platform, process_text
+
+MANUSCRIPT = """Chapter 1
+
+Some prose before the code.
+
+```
+for i in range(3):
+    print(i)
+```
+
+Chapter 2
+
+More prose.
+
+Chapter 3
+
+The end.
+"""
+
+
+def titles(text):
+    return [chapter.title for chapter in process_text(text)]
+
+
+class FormatDetectRoundTripTest(unittest.TestCase):
+    def test_headings_survive_formatting(self):
+        self.assertEqual(titles(MANUSCRIPT), ["Chapter 1", "Chapter 2", "Chapter 3"])
+        for platform, preset in FORMATTING_PRESETS.items():
+            with self.subTest(platform=platform):
+                formatted = format_text_for_platform(MANUSCRIPT, platform, preset)
+                self.assertEqual(titles(formatted), ["Chapter 1", "Chapter 2", "Chapter 3"])
+
+    def test_block_joined_onto_one_line_opens_nothing(self):
+        self.assertEqual(find_code_blocks("``` for i in range(3): print(i) ```\n\nChapter 2\n"), [])
+
+    def test_stray_fence_ends_at_next_heading(self):
+        for stray in ("```", "~~~", "[code]"):
+            with self.subTest(stray=stray):
+                text = f"Chapter 1\n\nProse.\n\n{stray}\n\nChapter 2\n\nMore.\n\nChapter 3\n"
+                self.assertEqual(titles(text), ["Chapter 1", "Chapter 2", "Chapter 3"])
+
+    def test_stray_fence_does_not_pair_past_a_heading(self):
+        for opening, closing in (("```", "```"), ("[code]", "[/code]")):
+            with self.subTest(opening=opening):
+                text = (f"Chapter 1\n\nProse.\n\n{opening}\n\nChapter 2\n\nMore.\n\n"
+                        f"Chapter 3\n\n{opening}\nx = 1\n{closing}\n\nChapter 4\n")
+                self.assertEqual(titles(text), ["Chapter 1", "Chapter 2", "Chapter 3", "Chapter 4"])
+
+    def test_closed_block_still_hides_numbered_lines(self):
+        text = "Chapter 1\n\n```\n1. first step\n```\n\nChapter 2\n"
+        self.assertEqual(titles(text), ["Chapter 1", "Chapter 2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
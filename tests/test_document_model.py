@@ -0,0 +1,90 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from document_model import DocumentSnapshot, PieceTable
+
+
+class PieceTableTest(unittest.TestCase):
+    def random_edits(self, seed, compact_threshold=None, steps=2000):
+        """Apply the same random edits to a PieceTable and a plain string"""
+        rng = random.Random(seed)
+        expected = "The quick brown fox\njumps over the lazy dog.\n"
+        table = PieceTable(expected)
+        if compact_threshold is not None:
+            table.compact_threshold = compact_threshold
+        cursor = 0
+        for step in range(steps):
+            if rng.random() < 0.6 or not expected:
+                # Half the time keep typing where the last insert ended
+                offset = cursor if rng.random() < 0.5 else rng.randint(0, len(expected))
+                text = rng.choice(["a", "bc", "\n", "word ", "é€😀", "x" * rng.randint(1, 40)])
+                table.insert(offset, text)
+                expected = expected[:offset] + text + expected[offset:]
+                cursor = offset + len(text)
+            else:
+                offset = rng.randint(0, len(expected) - 1)
+                length = rng.randint(1, 30)
+                table.delete(offset, length)
+                expected = expected[:offset] + expected[offset + length:]
+                cursor = offset
+            self.assertEqual(len(table), len(expected))
+            if step % 50 == 0:
+                self.assertEqual(table.text(), expected)
+                start = rng.randint(0, len(expected))
+                end = rng.randint(start, len(expected))
+                self.assertEqual(table.slice(start, end), expected[start:end])
+        self.assertEqual(table.text(), expected)
+
+    def test_random_inserts_and_deletes_match_a_string(self):
+        for seed in range(5):
+            with self.subTest(seed=seed):
+                self.random_edits(seed)
+
+    def test_compacting_on_every_read_keeps_the_text(self):
+        self.random_edits(11, compact_threshold=0, steps=500)
+
+    def test_typing_coalesces_into_one_piece(self):
+        table = PieceTable("ab")
+        for offset, char in enumerate("hello", start=1):
+            table.insert(offset, char)
+        self.assertEqual(table.text(), "ahellob")
+        self.assertEqual(len(table._pieces), 3)
+
+    def test_out_of_range_edits_are_clamped(self):
+        table = PieceTable("abc")
+        table.insert(10, "d")
+        table.delete(-5, 1)
+        table.delete(3, 10)
+        table.delete(1, 0)
+        self.assertEqual(table.text(), "bcd")
+
+    def test_listeners_see_every_change(self):
+        table = PieceTable("abc")
+        changes = []
+        table.add_listener(lambda *change: changes.append(change))
+        table.insert(1, "X")
+        table.delete(0, 2)
+        table.reset("new")
+        self.assertEqual(changes, [("insert", 1, "X"), ("delete", 0, 2), ("reset", 0, "new")])
+
+    def test_snapshot_keeps_its_text_after_edits(self):
+        table = PieceTable("abc")
+        snapshot = table.snapshot()
+        table.insert(3, "def")
+        self.assertEqual(snapshot.text, "abc")
+        self.assertEqual(table.snapshot().text, "abcdef")
+        with self.assertRaises(AttributeError):
+            snapshot.text = "changed"
+
+    def test_snapshot_is_immutable(self):
+        snapshot = DocumentSnapshot(1, "text")
+        with self.assertRaises(AttributeError):
+            del snapshot.version
+
+
+if __name__ == "__main__":
+    unittest.main()
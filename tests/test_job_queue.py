@@ -0,0 +1,155 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import DONE, EXTRACTING, FAILED, FORMATTING, QUEUED, JobQueue, LeaseLost
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "queue.sqlite")
+        self.queues = []
+
+    def tearDown(self):
+        for queue in self.queues:
+            queue.close()
+        shutil.rmtree(self.directory)
+
+    def open_queue(self, worker=None, **options):
+        queue = JobQueue(self.path, **options)
+        if worker:
+            # Every queue in this process would otherwise share one worker id
+            queue.worker = worker
+        self.queues.append(queue)
+        return queue
+
+    def add_jobs(self, queue, count):
+        for index in range(count):
+            self.assertTrue(queue.add(f"key-{index}", f"/in/book-{index}.txt", {"platform": "Kindle"}))
+
+    def test_adding_the_same_key_twice_is_a_no_op(self):
+        queue = self.open_queue()
+        self.add_jobs(queue, 1)
+        self.assertFalse(queue.add("key-0", "/in/book-0.txt", {}))
+        self.assertEqual(queue.counts()[QUEUED], 1)
+
+    def test_concurrent_claims_take_every_job_exactly_once(self):
+        self.add_jobs(self.open_queue(), 20)
+        claimed = []
+        lock = threading.Lock()
+
+        def work(index):
+            with JobQueue(self.path) as queue:
+                queue.worker = f"elsewhere:{index}"
+                while True:
+                    job = queue.claim()
+                    if job is None:
+                        return
+                    with lock:
+                        claimed.append(job.id)
+
+        threads = [threading.Thread(target=work, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), list(range(1, 21)))
+
+    def test_claim_resumes_after_the_last_completed_stage(self):
+        queue = self.open_queue()
+        self.add_jobs(queue, 1)
+        job = queue.claim()
+        self.assertEqual(job.state, EXTRACTING)
+        queue.finish_stage(job, EXTRACTING, 0.1)
+        queue.release(job)
+        job = queue.claim()
+        self.assertEqual(job.state, FORMATTING)
+        self.assertEqual(job.attempts, 0)
+
+    def test_live_lease_is_not_taken_over(self):
+        first = self.open_queue("elsewhere:1")
+        self.add_jobs(first, 1)
+        self.assertIsNotNone(first.claim())
+        self.assertIsNone(self.open_queue("elsewhere:2").claim())
+
+    def test_takeover_after_expired_lease_counts_as_an_attempt(self):
+        first = self.open_queue("elsewhere:1", lease_seconds=-1)
+        self.add_jobs(first, 1)
+        job = first.claim()
+        second = self.open_queue("elsewhere:2", max_attempts=3)
+        taken = second.claim()
+        self.assertEqual(taken.id, job.id)
+        self.assertEqual(taken.attempts, 1)
+        self.assertIn("timed out", taken.error)
+
+    def test_takeover_from_dead_worker_fails_job_out_of_attempts(self):
+        dead = self.open_queue(f"{socket.gethostname()}:{self.dead_pid()}")
+        self.add_jobs(dead, 1)
+        job = dead.claim()
+        queue = self.open_queue("elsewhere:2", max_attempts=1)
+        self.assertIsNone(queue.claim())
+        failed = queue.get(job.id)
+        self.assertEqual(failed.state, FAILED)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn("stopped", failed.error)
+
+    def test_stale_worker_cannot_overwrite_the_new_owner(self):
+        first = self.open_queue("elsewhere:1", lease_seconds=-1)
+        self.add_jobs(first, 1)
+        job = first.claim()
+        second = self.open_queue("elsewhere:2")
+        taken = second.claim()
+        for write in (lambda: first.start_stage(job, FORMATTING), lambda: first.complete(job, {}),
+                      lambda: first.fail(job, "boom"), lambda: first.release(job)):
+            with self.assertRaises(LeaseLost):
+                write()
+        self.assertFalse(first.heartbeat(job))
+        second.complete(taken, {"outputs": []})
+        self.assertEqual(second.get(job.id).state, DONE)
+
+    def test_heartbeat_stops_at_the_stage_deadline(self):
+        queue = self.open_queue(stage_timeout=60)
+        self.add_jobs(queue, 1)
+        job = queue.claim()
+        self.assertTrue(queue.heartbeat(job))
+        queue.stage_timeout = -1
+        queue.start_stage(job, FORMATTING)
+        self.assertFalse(queue.heartbeat(job))
+
+    def test_failures_back_off_then_fail_and_retry_failed_requeues(self):
+        queue = self.open_queue(max_attempts=2, backoff_seconds=3600)
+        self.add_jobs(queue, 1)
+        job = queue.claim()
+        queue.fail(job, "ValueError: bad input")
+        self.assertEqual(job.state, QUEUED)
+        self.assertIsNone(queue.claim())  # still backing off
+        self.assertIsNotNone(queue.next_wakeup())
+
+        queue.backoff_seconds = 0
+        queue._conn.execute("UPDATE jobs SET next_attempt = 0")
+        job = queue.claim()
+        queue.fail(job, "ValueError: bad input")
+        self.assertEqual(queue.get(job.id).state, FAILED)
+
+        self.assertEqual(queue.retry_failed(), 1)
+        job = queue.claim()
+        self.assertEqual(job.attempts, 0)
+
+    @staticmethod
+    def dead_pid():
+        """The pid of a process that has exited"""
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        return process.pid
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_patch import diff_pieces, patch_widget, split_pieces
+
+
+class FakeTextWidget:
+    """The part of a Tk text widget patch_widget uses, over a plain string"""
+
+    def __init__(self, text):
+        self.text = text
+        self.separators = 0
+
+    def offset(self, index):
+        if index == "end-1c":
+            return len(self.text)
+        line, column = map(int, index.split("."))
+        position = 0
+        for _ in range(line - 1):
+            position = self.text.index("\n", position) + 1
+        return position + column
+
+    def delete(self, start, end):
+        start, end = self.offset(start), self.offset(end)
+        self.text = self.text[:start] + self.text[end:]
+
+    def insert(self, index, text):
+        position = self.offset(index)
+        self.text = self.text[:position] + text + self.text[position:]
+
+    def edit_separator(self):
+        self.separators += 1
+
+
+def random_document(rng, paragraphs):
+    words = ["the", "night", "door", "opened", "Anna", "said", "quietly", "\t", "  "]
+    return "\n\n".join(
+        "\n".join(" ".join(rng.choice(words) for _ in range(rng.randint(1, 8))) for _ in range(rng.randint(1, 3)))
+        for _ in range(paragraphs)
+    ) + rng.choice(["", "\n", "\n\n", "\n\n\n"])
+
+
+def edit_paragraphs(rng, text):
+    pieces = split_pieces(text)
+    for _ in range(rng.randint(1, 4)):
+        action = rng.choice(["change", "insert", "delete"])
+        index = rng.randrange(len(pieces) + 1)
+        if action == "insert" or not pieces:
+            pieces.insert(index, random_document(rng, 1).rstrip("\n") + "\n\n")
+        elif index < len(pieces):
+            if action == "delete":
+                del pieces[index]
+            else:
+                pieces[index] = "    " + pieces[index]
+    return "".join(pieces)
+
+
+class SplitPiecesTest(unittest.TestCase):
+    def test_pieces_join_back_to_the_text(self):
+        for text in ("", "one", "one\n\n", "one\n\ntwo", "\n\n\nthree\n\n\n\nfour\n"):
+            with self.subTest(text=text):
+                self.assertEqual("".join(split_pieces(text)), text)
+
+
+class PatchWidgetTest(unittest.TestCase):
+    def test_random_edits_round_trip(self):
+        rng = random.Random(7)
+        for case in range(300):
+            old = random_document(rng, rng.randint(0, 12))
+            new = edit_paragraphs(rng, old) if rng.random() < 0.8 else random_document(rng, rng.randint(0, 12))
+            with self.subTest(case=case):
+                widget = FakeTextWidget(old)
+                inserted = patch_widget(widget, old, new)
+                self.assertEqual(widget.text, new)
+                self.assertEqual(inserted, sum(len(replacement) for _, _, replacement in diff_pieces(old, new)))
+
+    def test_identical_text_is_not_touched(self):
+        widget = FakeTextWidget("one\n\ntwo\n")
+        self.assertEqual(patch_widget(widget, widget.text, "one\n\ntwo\n"), 0)
+        self.assertEqual(widget.separators, 0)
+
+    def test_only_the_changed_paragraph_is_replaced(self):
+        old = "one\n\ntwo\n\nthree\n"
+        self.assertEqual(diff_pieces(old, "one\n\nTWO\n\nthree\n"), [(1, 2, "TWO\n\n")])
+
+    def test_large_change_is_left_to_a_reload(self):
+        widget = FakeTextWidget("one\n\ntwo\n")
+        self.assertIsNone(patch_widget(widget, widget.text, "x" * 100, max_changed=10))
+        self.assertEqual(widget.text, "one\n\ntwo\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Fill Tk text widgets in bounded chunks without freezing the UI
+
+A single ``insert`` of a whole manuscript makes Tk lay out every line
+before the next event is handled. TextLoader inserts one chunk of whole
+lines at a time and yields to the event loop between idle slices, so the
+first screen appears after one chunk whatever the document size and the
+window stays responsive for the rest.
+
+While a load runs the widget's undo recording is switched off; the undo
+history is cleared afterwards, since undoing half a load is meaningless.
+update() avoids reloading altogether when only a few paragraphs changed,
+patching the widget in place instead.
+"""
+import time
+
+from text_patch import patch_widget
+
+# Characters inserted per chunk, extended to the next line break
+CHUNK_CHARS = 64 * 1024
+# Longest a single idle slice may keep inserting chunks
+SLICE_SECONDS = 0.012
+# Patch in place when no more than this many characters change
+MAX_PATCH_CHARS = 4 * CHUNK_CHARS
+
+
+class TextLoader:
+    """Loads text into one widget across after_idle slices"""
+
+    def __init__(self, widget, chunk_chars=CHUNK_CHARS, slice_seconds=SLICE_SECONDS,
+                 on_progress=None, before_chunk=None, after_chunk=None, max_patch_chars=MAX_PATCH_CHARS,
+                 keep_text=True):
+        self.widget = widget
+        # Without keep_text, text is only set while loading and update() always reloads
+        self.keep_text = keep_text
+        self.max_patch_chars = max_patch_chars
+        self.text = None
+        self.chunk_chars = chunk_chars
+        self.slice_seconds = slice_seconds
+        self.on_progress = on_progress
+        self.before_chunk = before_chunk
+        self.after_chunk = after_chunk
+        self._text = None
+        self._position = 0
+        self._on_done = None
+        self._after_id = None
+        self._undo = None
+
+    @property
+    def loading(self):
+        return self._text is not None
+
+    def load(self, text, on_done=None):
+        """Replace the widget's contents with text; on_done() runs once it is all in
+
+        A load already in progress is abandoned.
+        """
+        self.cancel()
+        self._undo = self.widget.cget("undo")
+        self.widget.configure(undo=False)
+        self.text = text
+        self._text = text
+        self._position = 0
+        self._on_done = on_done
+        self._insert_chunks(self._delete_all)
+
+    def update(self, text, current=None, on_done=None):
+        """Show text, patching the widget if little changed and loading it otherwise
+
+        current is what the widget holds now; by default the text of the
+        last load or patch, unless the widget was edited since. on_done()
+        runs once the widget shows text.
+        """
+        if current is None and not self.widget.edit_modified():
+            current = self.text
+        if current is not None and not self.loading:
+            if patch_widget(self.widget, current, text, self.max_patch_chars) is not None:
+                self.text = text if self.keep_text else None
+                self.widget.edit_modified(False)
+                if on_done:
+                    on_done()
+                return
+        self.load(text, on_done)
+
+    def cancel(self):
+        """Stop a load in progress, leaving what has been inserted so far"""
+        if self._after_id:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        if self.loading:
+            self._finish()
+
+    def _delete_all(self):
+        self.widget.delete("1.0", "end")
+
+    def _next_chunk(self):
+        text = self._text
+        end = self._position + self.chunk_chars
+        if end < len(text):
+            line_end = text.find("\n", end)
+            end = len(text) if line_end == -1 else line_end + 1
+        else:
+            end = len(text)
+        chunk = text[self._position:end]
+        self._position = end
+        return chunk
+
+    def _run_slice(self):
+        self._after_id = None
+        self._insert_chunks()
+
+    def _insert_chunks(self, first_step=None):
+        deadline = time.perf_counter() + self.slice_seconds
+        if self.before_chunk:
+            self.before_chunk()
+        try:
+            if first_step:
+                first_step()
+            while self._position < len(self._text):
+                self.widget.insert("end-1c", self._next_chunk())
+                if time.perf_counter() >= deadline:
+                    break
+        finally:
+            if self.after_chunk:
+                self.after_chunk()
+
+        if self.on_progress:
+            self.on_progress(self._position / len(self._text) if self._text else 1.0)
+        if self._position < len(self._text):
+            self._after_id = self.widget.after_idle(self._run_slice)
+            return
+
+        on_done = self._on_done
+        self._finish()
+        if on_done:
+            on_done()
+
+    def _finish(self):
+        if not self.keep_text:
+            self.text = None
+        self._text = None
+        self._on_done = None
+        self.widget.configure(undo=self._undo)
+        self.widget.edit_reset()
+        self.widget.edit_modified(False)
@@ -0,0 +1,125 @@
+"""Memoized string widths for PDF layout
+
+Reportlab measures every word, and with ``wordWrap='CJK'`` every single
+character, of every paragraph it lays out, in pure Python. A novel uses a
+few thousand distinct words in one or two fonts, so nearly every
+measurement repeats an earlier one. WidthCache keeps the widths per font
+and size and is installed in place of ``stringWidth`` and ``getCharWidths`` in
+the modules that wrap paragraphs; a miss is measured by reportlab itself, so the layout is
+identical. The cache is shared by every export in the process and saved
+to the app data directory, so a new session starts warm.
+"""
+import json
+import os
+import uuid
+
+import reportlab
+import reportlab.lib.textsplit
+import reportlab.platypus.paragraph
+from reportlab.lib.textsplit import getCharWidths
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from autosave import app_data_dir
+
+# Modules whose stringWidth lookups go through the cache
+PATCHED_MODULES = (reportlab.platypus.paragraph, reportlab.lib.textsplit)
+# Widths kept per font and size; long runs of text are not worth keeping
+MAX_WIDTHS_PER_FONT = 200000
+MAX_CACHED_LENGTH = 64
+
+
+def width_cache_path():
+    return os.path.join(app_data_dir(), "text_widths.json")
+
+
+class WidthCache:
+    """String widths per (font name, font size), measured once"""
+
+    def __init__(self, measure=stringWidth, max_widths=MAX_WIDTHS_PER_FONT):
+        self.measure = measure
+        self.max_widths = max_widths
+        self.tables = {}
+        self.dirty = False
+        self.installed = False
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    def table(self, fontName, fontSize):
+        table = self.tables.get((fontName, fontSize))
+        if table is None:
+            table = self.tables[(fontName, fontSize)] = {}
+        return table
+
+    def string_width(self, text, fontName, fontSize, encoding="utf8"):
+        """Drop-in replacement for reportlab's stringWidth"""
+        table = self.table(fontName, fontSize)
+        width = table.get(text)
+        if width is None:
+            width = self.measure(text, fontName, fontSize, encoding)
+            if len(text) <= MAX_CACHED_LENGTH and len(table) < self.max_widths:
+                table[text] = width
+                self.dirty = True
+        return width
+
+    def char_widths(self, word, fontName, fontSize):
+        """Drop-in replacement for reportlab's textsplit.getCharWidths"""
+        table = self.table(fontName, fontSize)
+        try:
+            # One dictionary lookup per character once the font is warm
+            return [table[char] for char in word]
+        except KeyError:
+            return [self.string_width(char, fontName, fontSize) for char in word]
+
+    def install(self):
+        """Route reportlab's paragraph wrapping through the cache"""
+        for module in PATCHED_MODULES:
+            module.stringWidth = self.string_width
+        reportlab.lib.textsplit.getCharWidths = self.char_widths
+        self.installed = True
+
+    def uninstall(self):
+        for module in PATCHED_MODULES:
+            module.stringWidth = stringWidth
+        reportlab.lib.textsplit.getCharWidths = getCharWidths
+        self.installed = False
+
+    def load(self, path=None):
+        """Warm the cache from disk; a missing or stale file is ignored"""
+        try:
+            with open(path or width_cache_path(), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Font metrics may change between reportlab releases
+        if data.get("reportlab") != reportlab.Version:
+            return
+        for entry in data.get("fonts", []):
+            table = self.tables.setdefault((entry["font"], entry["size"]), {})
+            for text, width in entry["widths"].items():
+                table.setdefault(text, width)
+
+    def save(self, path=None):
+        """Write the cache to disk if anything was measured since the last save"""
+        if not self.dirty:
+            return
+        path = path or width_cache_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "reportlab": reportlab.Version,
+            "fonts": [
+                {
+                    "font": font,
+                    "size": size,
+                    # Copied first: another thread's export may be adding widths
+                    "widths": {text: width for text, width in table.copy().items() if isinstance(text, str)},
+                }
+                for (font, size), table in self.tables.copy().items()
+            ],
+        }
+        # Exports in several processes may save at once; each renames its own file
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, path)
+        self.dirty = False
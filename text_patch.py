@@ -0,0 +1,105 @@
+"""Update a Tk text widget by patching only the paragraphs that changed
+
+Old and new text are cut into paragraph pieces that end just after a
+blank line, so every piece starts at column 0 of some line and can be
+addressed as "<line>.0" without Tk counting characters. The pieces are
+compared pairwise when the paragraph count is unchanged and matched by
+hash otherwise, and only the differing runs are deleted and
+reinserted, last run first so earlier line numbers stay valid. Scroll
+position, tags outside the changed runs and the undo history survive,
+and Tk only lays out the lines that actually changed.
+"""
+from difflib import SequenceMatcher
+from itertools import accumulate
+
+
+def split_pieces(text):
+    """Cut text after every blank line into pieces whose concatenation is text"""
+    if not text:
+        return []
+    parts = text.split("\n\n")
+    pieces = [part + "\n\n" for part in parts[:-1]]
+    if parts[-1]:
+        pieces.append(parts[-1])
+    return pieces
+
+
+def diff_pieces(old, new):
+    """Return (first, last, replacement) edits turning old into new, last first
+
+    first and last are indices into old's pieces (last exclusive) and
+    replacement is the new text for that run.
+    """
+    old_pieces = split_pieces(old)
+    new_pieces = split_pieces(new)
+
+    # Unchanged pieces at both ends need no diffing at all
+    prefix = 0
+    limit = min(len(old_pieces), len(new_pieces))
+    while prefix < limit and old_pieces[prefix] == new_pieces[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old_pieces[-1 - suffix] == new_pieces[-1 - suffix]:
+        suffix += 1
+    old_middle = old_pieces[prefix:len(old_pieces) - suffix]
+    new_middle = new_pieces[prefix:len(new_pieces) - suffix]
+
+    edits = []
+    if len(old_middle) == len(new_middle):
+        # Same paragraph count (search and replace, most reformatting): compare pairwise
+        run_start = None
+        for index, (old_piece, new_piece) in enumerate(zip(old_middle, new_middle)):
+            if old_piece != new_piece:
+                if run_start is None:
+                    run_start = index
+            elif run_start is not None:
+                edits.append((prefix + run_start, prefix + index, "".join(new_middle[run_start:index])))
+                run_start = None
+        if run_start is not None:
+            edits.append((prefix + run_start, prefix + len(old_middle), "".join(new_middle[run_start:])))
+        edits.reverse()
+        return edits
+
+    matcher = SequenceMatcher(None, [hash(piece) for piece in old_middle], [hash(piece) for piece in new_middle])
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal" and old_middle[i1:i2] == new_middle[j1:j2]:
+            continue
+        edits.append((prefix + i1, prefix + i2, "".join(new_middle[j1:j2])))
+    edits.reverse()
+    return edits
+
+
+def piece_lines(text):
+    """Return the starting line of each piece, plus the line after the last"""
+    pieces = split_pieces(text)
+    return list(accumulate(map(str.count, pieces, ["\n"] * len(pieces)), initial=1))
+
+
+def patch_widget(widget, old, new, max_changed=None):
+    """Turn widget contents old into new with minimal edits
+
+    Returns the number of characters inserted, or None without touching
+    the widget when more than max_changed characters would change, in
+    which case a full (chunked) reload is cheaper.
+    """
+    edits = diff_pieces(old, new)
+    if max_changed is not None and sum(len(replacement) for _, _, replacement in edits) > max_changed:
+        return None
+    if not edits:
+        return 0
+
+    lines = piece_lines(old)
+    piece_count = len(lines) - 1
+    inserted = 0
+    widget.edit_separator()
+    for first, last, replacement in edits:
+        start = f"{lines[first]}.0" if first < piece_count else "end-1c"
+        end = f"{lines[last]}.0" if last < piece_count else "end-1c"
+        if last > first:
+            widget.delete(start, end)
+        if replacement:
+            widget.insert(start, replacement)
+        inserted += len(replacement)
+    widget.edit_separator()
+    return inserted
@@ -0,0 +1,478 @@
+"""Convert manuscripts dropped into a watched folder without the GUI
+
+Watches an input folder and runs every new TXT or PDF file through
+chapter detection, platform formatting and export on a bounded process
+pool. For each file, e.g. book.pdf, the outputs (book-pdf-kindle.txt, ...)
+and a ``book-pdf.job.json`` timing record are written to the output folder.
+
+    python watch_daemon.py incoming/ formatted/
+    python watch_daemon.py incoming/ formatted/ --preset Print --formats pdf --workers 4
+    python watch_daemon.py incoming/ formatted/ --once     # convert what is there and exit
+
+Changes are picked up with inotify on Linux and by polling elsewhere. A
+file is only converted once its size and modification time have stayed
+the same for ``--settle`` seconds, so files still being copied in are
+left alone; a file that settles empty is skipped until it is written
+to. A worker process that dies takes the pool with it; the pool is
+replaced and the files it was converting are queued again and then
+converted one at a time, so a file that keeps crashing its worker is
+found and recorded as failed after ``WORKER_CRASH_RETRIES`` retries
+without taking the others with it. Finished jobs are appended to a ledger in the output folder,
+keyed by a digest of the file contents, so a restart skips everything
+already converted, or already failed, and only picks up new or changed
+files.
+"""
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from ebook_formatter import (
+    FORMATTING_PRESETS,
+    extract_pdf_text,
+    preformat_text,
+    process_text,
+    write_chapters_pdf,
+    write_chapters_text,
+)
+from scheduler import create_process_pool
+
+SUPPORTED_EXTENSIONS = (".txt", ".pdf")
+EXPORT_FORMATS = ("txt", "pdf")
+LEDGER_NAME = ".watch-ledger.jsonl"
+# Seconds a file's size and mtime must stay unchanged before it is converted
+DEFAULT_SETTLE_SECONDS = 2.0
+# Seconds between directory scans when inotify is unavailable
+DEFAULT_POLL_SECONDS = 1.0
+# Longest the main loop sleeps waiting for events
+LOOP_SECONDS = 0.5
+# Times a file converted on its own is queued again after its worker process died
+WORKER_CRASH_RETRIES = 2
+
+# inotify event bits (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def log(message):
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {message}", flush=True)
+
+
+def file_digest(path):
+    """Digest of a file's contents, identifying it across renames and restarts"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_manuscript(path):
+    if path.lower().endswith(".pdf"):
+        return extract_pdf_text(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def output_stem(source_path):
+    """Base name for a source's outputs, e.g. book-pdf for book.pdf
+
+    The source extension is kept so book.txt and book.pdf do not
+    overwrite each other's outputs.
+    """
+    stem, extension = os.path.splitext(os.path.basename(source_path))
+    return f"{stem}-{extension.lstrip('.').lower()}" if extension else stem
+
+
+def export_chapters(chapters, source_path, output_dir, platform, formats):
+    """Write chapters in every format as <stem>-<preset>.<format>; returns the file names"""
+    suffix = platform.lower().replace(" ", "-")
+    outputs = []
+    for export_format in formats:
+        path = os.path.join(output_dir, f"{output_stem(source_path)}-{suffix}.{export_format}")
+        # Write beside the target and rename, so readers never see half a file
+        part_path = path + ".part"
+        if export_format == "pdf":
+            write_chapters_pdf(chapters, part_path, FORMATTING_PRESETS[platform])
+        else:
+            write_chapters_text(chapters, part_path)
+        os.replace(part_path, path)
+        outputs.append(os.path.basename(path))
+    return outputs
+
+
+def run_job(source_path, output_dir, platform, formats):
+    """Detect, format and export one manuscript (runs in a worker process)
+
+    Returns the written outputs and the wall time of every stage.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    def timed(stage, func, *args):
+        stage_started = time.perf_counter()
+        result = func(*args)
+        timings[stage] = round(time.perf_counter() - stage_started, 4)
+        return result
+
+    text = timed("import", read_manuscript, source_path)
+    source_chapters = timed("detect", process_text, text)
+    _, chapters = timed("format", preformat_text, text, platform, FORMATTING_PRESETS[platform])
+
+    outputs = timed("export", export_chapters, chapters, source_path, output_dir, platform, formats)
+    timings["total"] = round(time.perf_counter() - started, 4)
+
+    return {
+        "outputs": outputs,
+        "timings": timings,
+        "characters": len(text),
+        "source_chapters": len(source_chapters),
+        "chapters": len(chapters),
+    }
+
+
+class InotifyWatcher:
+    """Reports names written or moved into a directory, via Linux inotify"""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, f"Cannot watch {directory}")
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds and return the names that changed"""
+        names = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return names
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """Reports names added or changed in a directory, scanning at a fixed interval"""
+
+    def __init__(self, directory, interval=DEFAULT_POLL_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        self._next_scan = 0.0
+        # Size and mtime of every file at the last scan
+        self._seen = {}
+
+    def poll(self, timeout):
+        delay = self._next_scan - time.monotonic()
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+            if delay > timeout:
+                return set()
+        self._next_scan = time.monotonic() + self.interval
+        seen = {}
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    seen[entry.name] = (stat.st_size, stat.st_mtime_ns)
+            except FileNotFoundError:
+                continue
+        changed = {name for name, signature in seen.items() if self._seen.get(name) != signature}
+        self._seen = seen
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(directory, poll_interval=DEFAULT_POLL_SECONDS, use_inotify=True):
+    """Return an inotify watcher where available, otherwise a polling one"""
+    if use_inotify and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            log(f"inotify unavailable, polling instead: {e}")
+    return PollingWatcher(directory, poll_interval)
+
+
+class SettleTracker:
+    """Releases files once their size and mtime have stopped changing"""
+
+    def __init__(self, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, path):
+        """Start or keep tracking a file that may still be written to"""
+        self._pending.setdefault(path, None)
+
+    def ready(self, now):
+        """Return the tracked files that have been unchanged long enough
+
+        Files that settle empty are dropped; writing to one later makes the
+        watcher report it again.
+        """
+        settled = []
+        for path, state in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if state is None or state[0] != signature:
+                self._pending[path] = (signature, now)
+            elif now - state[1] >= self.settle_seconds:
+                del self._pending[path]
+                if stat.st_size:
+                    settled.append(path)
+                else:
+                    log(f"Skipping empty file {os.path.basename(path)}")
+        return settled
+
+
+class JobLedger:
+    """Append-only record of finished jobs, read back on startup
+
+    A key is finished whether its job succeeded or failed: keys include a
+    digest of the file, so a failed file is only tried again once its
+    content changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._finished = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn final record from a crash mid-write
+                    if entry.get("status") in ("done", "failed"):
+                        self._finished.add(entry["key"])
+
+    def __contains__(self, key):
+        return key in self._finished
+
+    def record(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if entry.get("status") in ("done", "failed"):
+            self._finished.add(entry["key"])
+
+
+class WatchDaemon:
+    """Converts settled files from the input folder with a bounded worker pool"""
+
+    def __init__(self, input_dir, output_dir, platform="Kindle", formats=EXPORT_FORMATS, workers=2,
+                 settle_seconds=DEFAULT_SETTLE_SECONDS, poll_interval=DEFAULT_POLL_SECONDS, use_inotify=True):
+        self.input_dir = os.path.abspath(input_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.platform = platform
+        self.formats = tuple(formats)
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.tracker = SettleTracker(settle_seconds)
+        self.ledger = JobLedger(os.path.join(self.output_dir, LEDGER_NAME))
+        self.queue = deque()
+        self.queued = set()
+        self.running = {}
+        # Keys in flight when a worker died, converted one at a time, and their crashes alone
+        self.suspects = {}
+        self.pool = None
+        self.stopping = False
+
+    def stop(self, *args):
+        """Finish the jobs that are running and exit"""
+        self.stopping = True
+
+    def job_key(self, digest):
+        return f"{digest}:{self.platform}:{','.join(self.formats)}"
+
+    def run(self, once=False):
+        """Watch until stopped; with once, exit when the existing files are done"""
+        watcher = create_watcher(self.input_dir, self.poll_interval, self.use_inotify)
+        self.pool = create_process_pool(self.workers)
+        log(f"Watching {self.input_dir} -> {self.output_dir} ({self.platform}, {self.workers} workers)")
+        try:
+            # Files dropped in while the daemon was down
+            for entry in os.scandir(self.input_dir):
+                self.consider(entry.name)
+            while not self.stopping:
+                for name in watcher.poll(LOOP_SECONDS if not self.running else 0):
+                    self.consider(name)
+                for path in self.tracker.ready(time.monotonic()):
+                    self.enqueue(path)
+                self.submit_queued()
+                self.collect(wait_seconds=LOOP_SECONDS if self.running else 0)
+                if once and not (self.tracker or self.queue or self.running):
+                    break
+            # Let running jobs finish so they are recorded, not redone
+            while self.running:
+                self.collect(wait_seconds=None)
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            watcher.close()
+        log("Stopped")
+
+    def consider(self, name):
+        if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("."):
+            path = os.path.join(self.input_dir, name)
+            if os.path.isfile(path):
+                self.tracker.touch(path)
+
+    def enqueue(self, path):
+        try:
+            digest = file_digest(path)
+        except OSError as e:
+            log(f"Cannot read {path}: {e}")
+            return
+        key = self.job_key(digest)
+        if key in self.ledger or key in self.queued:
+            return
+        self.queued.add(key)
+        self.queue.append((path, key))
+
+    def submit_queued(self):
+        while self.queue and len(self.running) < self.workers:
+            path, key = self.queue[0]
+            if self.running and (key in self.suspects
+                                 or any(running[1] in self.suspects for running in self.running.values())):
+                break
+            pool = self.pool
+            try:
+                future = pool.submit(run_job, path, self.output_dir, self.platform, self.formats)
+            except BrokenProcessPool:
+                # Its futures are collected and queued again as they fail
+                self.replace_pool(pool)
+                continue
+            self.queue.popleft()
+            self.running[future] = (path, key, datetime.now().isoformat(timespec="seconds"), pool)
+            log(f"Converting {os.path.basename(path)}")
+
+    def replace_pool(self, pool):
+        """Replace a pool broken by a dead worker, unless that was done already"""
+        if pool is self.pool:
+            log("A worker process died; starting a new pool")
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = create_process_pool(self.workers)
+
+    def collect(self, wait_seconds):
+        """Record finished jobs, waiting up to wait_seconds (None: until one finishes)"""
+        if not self.running:
+            return
+        done, _ = wait(list(self.running), timeout=wait_seconds, return_when=FIRST_COMPLETED)
+        in_flight = [running[3] for running in self.running.values()]
+        for future in done:
+            path, key, started, pool = self.running.pop(future)
+            if isinstance(future.exception(), BrokenProcessPool):
+                self.replace_pool(pool)
+                # Only a file converted on its own is known to have crashed its worker
+                alone = in_flight.count(pool) == 1
+                crashes = self.suspects[key] = self.suspects.get(key, 0) + alone
+                if crashes <= WORKER_CRASH_RETRIES:
+                    self.queue.appendleft((path, key))
+                    continue
+            self.suspects.pop(key, None)
+            self.queued.discard(key)
+            entry = {
+                "key": key,
+                "source": os.path.basename(path),
+                "platform": self.platform,
+                "started": started,
+                "finished": datetime.now().isoformat(timespec="seconds"),
+            }
+            try:
+                entry.update(future.result())
+                entry["status"] = "done"
+                log(f"Converted {entry['source']} in {entry['timings']['total']:.2f} s")
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                log(f"Failed to convert {entry['source']}: {e}")
+            self.write_job_record(entry)
+            self.ledger.record(entry)
+
+    def write_job_record(self, entry):
+        path = os.path.join(self.output_dir, f"{output_stem(entry['source'])}.job.json")
+        with open(path + ".part", "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+        os.replace(path + ".part", path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert manuscripts dropped into a folder")
+    parser.add_argument("input_dir", help="folder to watch for TXT and PDF manuscripts")
+    parser.add_argument("output_dir", help="folder for outputs, job records and the ledger")
+    parser.add_argument("--preset", default="Kindle", choices=list(FORMATTING_PRESETS), help="formatting preset")
+    parser.add_argument("--formats", default=",".join(EXPORT_FORMATS),
+                        help="comma-separated export formats (txt, pdf)")
+    parser.add_argument("--workers", type=int, default=2, help="manuscripts converted at once")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="seconds a file must stay unchanged before it is converted")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS,
+                        help="seconds between scans when polling")
+    parser.add_argument("--no-inotify", dest="inotify", action="store_false", help="always poll the folder")
+    parser.add_argument("--once", action="store_true", help="convert the files present now, then exit")
+    args = parser.parse_args(argv)
+    args.formats = [name.strip() for name in args.formats.split(",") if name.strip()]
+    unknown = set(args.formats) - set(EXPORT_FORMATS)
+    if unknown or not args.formats:
+        parser.error(f"--formats must be drawn from {', '.join(EXPORT_FORMATS)}")
+    return args
+
+
+def main(argv=None):
+    """Run the watch-folder daemon until interrupted"""
+    args = parse_args(argv)
+    daemon = WatchDaemon(
+        args.input_dir, args.output_dir, args.preset, args.formats, max(1, args.workers),
+        args.settle, args.poll, args.inotify
+    )
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    daemon.run(once=args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Keep several documents open under a memory budget
+
+Every open document is a WorkspaceDocument. The active one lives in the
+editor; the others keep their text in memory until the texts of all
+documents exceed the budget. The least recently used inactive documents
+are then written to the workspace store as project files and their text
+dropped. Switching back to an evicted document opens its project file:
+the chapter list appears at once and the text loads in the background,
+so memory stays bounded however many manuscripts are open.
+
+Set ``EBOOK_FORMATTER_WORKSPACE_MB`` to change the budget.
+"""
+import os
+import sys
+import time
+import uuid
+
+from autosave import app_data_dir, document_id
+from project_file import PROJECT_EXTENSION, save_project, load_project
+
+# Text kept in memory across all open documents before inactive ones are evicted
+WORKSPACE_BUDGET_BYTES = int(os.environ.get("EBOOK_FORMATTER_WORKSPACE_MB") or 256) * 1024 * 1024
+
+
+def workspace_dir():
+    """Return the directory evicted documents are stored in"""
+    return os.path.join(app_data_dir(), "workspace")
+
+
+class WorkspaceDocument:
+    """State of one open document while it is not in the editor
+
+    text is None once the document has been evicted to store_path.
+    """
+
+    def __init__(self, name="Untitled", text="", document_path=None):
+        self.name = name
+        self.text = text
+        self.original_text = ""
+        self.chapters = []
+        self.preset = None
+        self.cover_image_path = None
+        self.document_path = document_path
+        self.project_path = None
+        self.journal = None
+        self.store_path = None
+        self.evicting = False
+        # What the running eviction job is writing, see Workspace.evict_job()
+        self.evicted_state = None
+        self.last_used = time.monotonic()
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "evicted"
+        return f"WorkspaceDocument({self.name!r}, {state})"
+
+    @property
+    def loaded(self):
+        return self.text is not None
+
+    def memory_bytes(self):
+        """Approximate memory held by the document's texts"""
+        if not self.loaded:
+            return 0
+        size = sys.getsizeof(self.text)
+        if self.original_text and self.original_text is not self.text:
+            size += sys.getsizeof(self.original_text)
+        return size
+
+    def state(self):
+        """The fields written to the store; compared by identity to spot changes"""
+        return (self.text, self.original_text, self.preset, self.cover_image_path)
+
+    def release(self):
+        """Drop the in-memory state; the editor or the store now holds it"""
+        self.text = None
+        self.original_text = ""
+        self.chapters = []
+
+
+class Workspace:
+    """Open documents in tab order plus the one being edited
+
+    Used from the UI thread only; the jobs from evict_job() are the part
+    that runs on a worker.
+    """
+
+    def __init__(self, detect_chapters, budget_bytes=WORKSPACE_BUDGET_BYTES, store_dir=None):
+        self.detect_chapters = detect_chapters
+        self.budget_bytes = budget_bytes
+        self.store_dir = store_dir or workspace_dir()
+        self.documents = []
+        self.active = None
+
+    def add(self, document):
+        self.documents.append(document)
+        return document
+
+    def remove(self, document):
+        """Close a document and delete its store file"""
+        self.documents.remove(document)
+        if self.active is document:
+            self.active = None
+        if document.store_path:
+            try:
+                os.remove(document.store_path)
+            except OSError:
+                pass
+
+    def activate(self, document):
+        """Make document the one in the editor"""
+        self.active = document
+        document.last_used = time.monotonic()
+
+    def memory_bytes(self, active_bytes=0):
+        """Memory held by inactive documents plus the editor's given share"""
+        return active_bytes + sum(
+            document.memory_bytes() for document in self.documents
+            if document is not self.active and not document.evicting
+        )
+
+    def eviction_candidates(self, active_bytes=0):
+        """Return inactive documents to evict, least recently used first"""
+        excess = self.memory_bytes(active_bytes) - self.budget_bytes
+        candidates = []
+        inactive = sorted(
+            (
+                document for document in self.documents
+                if document is not self.active and document.loaded and not document.evicting
+            ),
+            key=lambda document: document.last_used
+        )
+        for document in inactive:
+            if excess <= 0:
+                break
+            candidates.append(document)
+            excess -= document.memory_bytes()
+        return candidates
+
+    def evict_job(self, document):
+        """Return a job writing document to the store, to run on a worker
+
+        The document's state is captured now, on the UI thread. Call
+        discard() or evict_failed() with the document once the job is done.
+        """
+        document.evicting = True
+        document.evicted_state = document.state()
+        if not document.store_path:
+            os.makedirs(self.store_dir, exist_ok=True)
+            # Two tabs may hold the same file, so store names are unique per document
+            name = f"{document_id(document.document_path)}-{uuid.uuid4().hex[:8]}"
+            document.store_path = os.path.join(self.store_dir, name + PROJECT_EXTENSION)
+        path, text, original_text = document.store_path, document.text, document.original_text
+        preset, cover_image_path = document.preset, document.cover_image_path
+        detect_chapters = self.detect_chapters
+        return lambda: save_project(path, text, detect_chapters(text), preset, cover_image_path, original_text)
+
+    def discard(self, document):
+        """Drop an evicted document's text once its store file is written
+
+        The text is kept while the document is in the editor. It is also
+        kept when the document changed while the job ran (it was switched
+        to, edited and switched away from), since the store then holds an
+        older version; returns False in that case so it is evicted again.
+        """
+        document.evicting = False
+        written, document.evicted_state = document.evicted_state, None
+        if document is self.active or document not in self.documents:
+            return True
+        if any(now is not then for now, then in zip(document.state(), written)):
+            return False
+        document.release()
+        return True
+
+    def evict_failed(self, document):
+        """Keep a document in memory after its store file could not be written"""
+        document.evicting = False
+        document.evicted_state = None
+
+    def close(self):
+        """Delete every store file; the workspace is not reopened across sessions"""
+        for document in list(self.documents):
+            self.remove(document)
+
+    def restore(self, document):
+        """Open an evicted document's store file, reading only its manifest"""
+        return load_project(document.store_path)